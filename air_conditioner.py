@@ -5,10 +5,15 @@ import threading
 import time
 import json
 import device_pb2
+from sharding import gateway_endpoint
+from state_bus import HEARTBEAT_INTERVAL, StateBus
+from transport import FrameReader, send_frame
+from protocol import command_params, negotiate, set_state, typed_state
+from tracing import span, traced_command
 
 
 class AirConditioner:
-    def __init__(self):
+    def __init__(self, networking=True, bus=None, ip=None):
         # Configurações de rede
         self.MCAST_GRP = '224.0.0.1'
         self.MCAST_PORT = 50000
@@ -17,6 +22,11 @@ class AirConditioner:
 
         # Guardar IP do gateway quando receber GATEWAY_DISCOVERY
         self.gateway_ip = None
+        # Portas desse gateway; com vários gateways (shards), as do dono deste device
+        self.gateway_announce_port = 50001
+        self.gateway_sensor_port = 50002
+        # Versão do protocolo combinada com o gateway no GATEWAY_DISCOVERY
+        self.protocol_version = 1
 
         # Estado do dispositivo
         self.state = {
@@ -29,20 +39,40 @@ class AirConditioner:
         # Potência padrão (exemplo)
         self.power = 1000
 
-        # Arquivos de estado (para que o sensor de temperatura possa ler e simular)
-        with open("files/ac_power.txt", "w") as f:
-            f.write("0")
-        with open("files/ac_settemp.txt", "w") as f:
-            f.write("25")
-        with open("files/ac_mode.txt", "w") as f:
-            f.write("COOL")
-        with open("files/ac_fanspeed.txt", "w") as f:
-            f.write("AUTO")
-
-        # Sockets
-        self.init_tcp_server()
-        self.init_multicast_listener()
-        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # Estado lido pelos sensores (potência, temperatura alvo, modo e ventilação), publicado no barramento
+        # em memória compartilhada (o device_host passa o mesmo bus a todos os devices)
+        self.bus = bus or StateBus()
+        # IP anunciado ao gateway, parte do device_id que identifica o registro
+        # no barramento (o device_host passa o IP do host)
+        self.ip = ip or self.get_local_ip()
+
+        # Sockets (sem networking, quem cuida da rede é o device_host.py)
+        if networking:
+            self.init_tcp_server()
+            self.init_multicast_listener()
+            self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            # Com a porta TCP definida o device_id já é o definitivo; no
+            # device_host o primeiro publish vem depois de abrir a porta
+            self.publish_state()
+
+    @property
+    def device_id(self):
+        """Identificador do device no gateway e no barramento de estado"""
+        return f"{self.device_type}_{self.ip}_{self.TCP_PORT}"
+
+    def publish_state(self):
+        """Publica potência, temperatura alvo, modo e ventilação no barramento de estado"""
+        self.bus.publish("air_conditioner", self.device_id,
+                         power=self.power if self.state["power"] == "ON" else 0,
+                         temperature=float(self.state["temperature"]),
+                         mode=self.state["mode"],
+                         fan_speed=self.state["fan_speed"])
+
+    def keep_alive(self):
+        """Republica o estado a cada HEARTBEAT_INTERVAL: sem heartbeat os sensores consideram o device parado"""
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            self.publish_state()
 
     def init_tcp_server(self):
         """Inicializa o servidor TCP para comandos"""
@@ -76,22 +106,18 @@ class AirConditioner:
         """Processa comandos recebidos"""
         try:
             command = command_msg.command
-            params = json.loads(command_msg.parameters) if command_msg.parameters else {}
+            params = command_params(command_msg)
 
             response = device_pb2.DeviceResponse()
 
             if command == "ON":
                 self.state["power"] = "ON"
                 # Ao ligar, mantenho a temperatura alvo no self.state
-                with open("files/ac_power.txt", "w") as f:
-                    f.write(str(self.power))
                 response.success = True
                 response.message = "Air conditioner turned on"
 
             elif command == "OFF":
                 self.state["power"] = "OFF"
-                with open("files/ac_power.txt", "w") as f:
-                    f.write("0")
                 response.success = True
                 response.message = "Air conditioner turned off"
 
@@ -101,10 +127,6 @@ class AirConditioner:
                     if 16 <= temp <= 30:
                         self.state["power"] = "ON"
                         self.state["temperature"] = temp
-                        with open("files/ac_power.txt", "w") as f:
-                            f.write(str(self.power))
-                        with open("files/ac_settemp.txt", "w") as f:
-                            f.write(str(temp))
                         response.success = True
                         response.message = f"Temperature set to {temp}°C"
                     else:
@@ -119,8 +141,6 @@ class AirConditioner:
                     mode = params["mode"].upper()
                     if mode in ["COOL", "HEAT", "FAN"]:
                         self.state["mode"] = mode
-                        with open("files/ac_mode.txt", "w") as f:
-                            f.write(mode)
                         response.success = True
                         response.message = f"Mode set to {mode}"
                     else:
@@ -135,8 +155,6 @@ class AirConditioner:
                     speed = params["fan_speed"].upper()
                     if speed in ["LOW", "MEDIUM", "HIGH", "AUTO"]:
                         self.state["fan_speed"] = speed
-                        with open("files/ac_fanspeed.txt", "w") as f:
-                            f.write(speed)
                         response.success = True
                         response.message = f"Fan speed set to {speed}"
                     else:
@@ -154,12 +172,12 @@ class AirConditioner:
                 response.success = False
                 response.message = "Unknown command"
 
-            # Atualiza no arquivo de settemp (caso seja ON ou algo) 
-            with open("files/ac_settemp.txt", "w") as f:
-                f.write(str(self.state["temperature"]))
+            # Sensores leem o novo estado do barramento
+            with span("device.publish_state"):
+                self.publish_state()
 
             # Passa o estado atual para a resposta
-            response.status = json.dumps(self.state)
+            set_state(response, self.device_type, self.state, self.protocol_version)
             for key, value in self.state.items():
                 response.attributes[key] = str(value)
 
@@ -169,36 +187,53 @@ class AirConditioner:
             response = device_pb2.DeviceResponse()
             response.success = False
             response.message = f"Error: {str(e)}"
-            response.status = json.dumps(self.state)
+            set_state(response, self.device_type, self.state, self.protocol_version)
             return response
 
     def handle_tcp_client(self, client_socket, addr):
         """Gerencia conexões TCP"""
         try:
+            # Um buffer reaproveitado por conexão; frames chegam inteiros mesmo
+            # se o TCP entregar a mensagem em pedaços
+            reader = FrameReader(client_socket)
             while True:
-                size_data = client_socket.recv(4)
-                if not size_data:
-                    break
-
-                msg_size = int.from_bytes(size_data, byteorder='big')
-                data = client_socket.recv(msg_size)
-                if not data:
+                data = reader.read_frame()
+                if data is None:
                     break
 
                 command_msg = device_pb2.DeviceCommand()
                 command_msg.ParseFromString(data)
 
-                response = self.handle_command(command_msg)
+                response = traced_command(command_msg, self.handle_command, f"device:{self.device_type}")
 
                 response_data = response.SerializeToString()
-                client_socket.send(len(response_data).to_bytes(4, byteorder='big'))
-                client_socket.send(response_data)
+                send_frame(client_socket, response_data)
 
         except Exception as e:
             print(f"Error handling TCP client: {e}")
         finally:
             client_socket.close()
 
+    def discovery_response(self, msg, addr, ip):
+        """
+        Resposta a um GATEWAY_DISCOVERY vindo de addr: combina a versão do
+        protocolo, guarda o gateway dono deste device e retorna
+        (DeviceDiscovery serializado, endereço de destino)
+        """
+        discovery_msg = device_pb2.DeviceDiscovery()
+        discovery_msg.device_type = self.device_type
+        discovery_msg.ip = ip
+        discovery_msg.port = self.TCP_PORT
+        self.protocol_version = negotiate(msg.protocol_version)
+        discovery_msg.protocol_version = self.protocol_version
+        set_state(discovery_msg, self.device_type, self.state, self.protocol_version)
+
+        # Anúncios e SensorData vão para o gateway dono deste device_id
+        device_id = f"{self.device_type}_{discovery_msg.ip}_{discovery_msg.port}"
+        self.gateway_ip, self.gateway_announce_port, self.gateway_sensor_port = \
+            gateway_endpoint(msg, addr, device_id)
+        return discovery_msg.SerializeToString(), (self.gateway_ip, self.gateway_announce_port)
+
     def listen_for_discovery(self):
         """Escuta por mensagens de descoberta (multicast)"""
         while True:
@@ -206,37 +241,42 @@ class AirConditioner:
             msg = device_pb2.DeviceCommand()
             msg.ParseFromString(data)
             if msg.command == "GATEWAY_DISCOVERY":
-                self.gateway_ip = addr[0]
-
-                # Prepara resposta
-                discovery_msg = device_pb2.DeviceDiscovery()
-                discovery_msg.device_type = self.device_type
-                discovery_msg.ip = self.get_local_ip()
-                discovery_msg.port = self.TCP_PORT
-                discovery_msg.status = json.dumps(self.state)
-
+                data, target = self.discovery_response(msg, addr, self.get_local_ip())
                 response_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                response_socket.sendto(discovery_msg.SerializeToString(), (addr[0], 50001))
+                response_socket.sendto(data, target)
                 response_socket.close()
 
+    def update_interval(self):
+        """Segundos entre dois envios do estado ao gateway"""
+        return 15
+
+    def tick(self, ip):
+        """SensorData serializado com o estado atual, ou None se ainda não há gateway"""
+        if self.gateway_ip is None:
+            return None
+        sensor_data = device_pb2.SensorData()
+        sensor_data.device_id = f"{self.device_type}_{ip}_{self.TCP_PORT}"
+        sensor_data.sensor_type = "ac_state"
+        sensor_data.value = float(self.state.get("temperature", 25.0))
+        if self.protocol_version >= 2:
+            sensor_data.state.CopyFrom(typed_state(self.device_type, self.state))
+        else:
+            # Protocolo 1: o resto do estado vai em JSON dentro de unit
+            sensor_data.unit = json.dumps(self.state)
+        sensor_data.timestamp = int(time.time())
+        return sensor_data.SerializeToString()
+
     def periodically_send_state(self):
         """Envia periodicamente o estado via UDP para o gateway"""
         while True:
             if self.gateway_ip is not None:
                 try:
-                    sensor_data = device_pb2.SensorData()
-                    sensor_data.device_id = f"{self.device_type}_{self.get_local_ip()}_{self.TCP_PORT}"
-                    sensor_data.sensor_type = "ac_state"
-                    sensor_data.value = float(self.state.get("temperature", 25.0))
-                    sensor_data.unit = json.dumps(self.state)
-                    sensor_data.timestamp = int(time.time())
-
-                    data = sensor_data.SerializeToString()
-                    self.udp_socket.sendto(data, (self.gateway_ip, 50002))
+                    data = self.tick(self.get_local_ip())
+                    self.udp_socket.sendto(data, (self.gateway_ip, self.gateway_sensor_port))
                 except Exception as e:
                     print(f"[AC] Error sending periodic state: {e}")
 
-            time.sleep(15)
+            time.sleep(self.update_interval())
 
     def run(self):
         discovery_thread = threading.Thread(target=self.listen_for_discovery, daemon=True)
@@ -245,6 +285,9 @@ class AirConditioner:
         periodic_thread = threading.Thread(target=self.periodically_send_state, daemon=True)
         periodic_thread.start()
 
+        heartbeat_thread = threading.Thread(target=self.keep_alive, daemon=True)
+        heartbeat_thread.start()
+
         print(f"Air Conditioner running on port {self.TCP_PORT}")
 
         while True:
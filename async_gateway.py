@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+import asyncio
+import json
+import device_pb2
+from gateway import ClientSession, Gateway, error_response
+from transport import encode_frame, read_frame_async
+
+
+class _DatagramHandler(asyncio.DatagramProtocol):
+    """Encaminha cada datagrama recebido para um método do gateway"""
+    def __init__(self, handler):
+        self.handler = handler
+
+    def datagram_received(self, data, addr):
+        try:
+            self.handler(data, addr)
+        except Exception as e:
+            print(f"[Gateway] Error handling datagram from {addr}: {e}")
+
+
+class AsyncGateway(Gateway):
+    """
+    Gateway em modo event loop: sessões de clientes, anúncios de
+    descoberta e dados de sensores são corrotinas de um único loop.
+    Usa as mesmas portas e o mesmo protocolo do modo com threads.
+    """
+
+    # Comandos que falam com dispositivos via TCP bloqueante e por isso
+    # rodam no executor padrão em vez de travar o loop
+    BLOCKING_COMMANDS = {"CONTROL_DEVICE", "BATCH_CONTROL", "GET_STATUS", "SET_STATUS"}
+    # Datagramas de sensores lidos por vez antes de devolver o controle ao loop
+    SENSOR_BATCH = 64
+
+    def init_tcp_server(self):
+        super().init_tcp_server()
+        self.tcp_socket.setblocking(False)
+
+    def init_udp_receiver(self):
+        super().init_udp_receiver()
+        self.udp_socket.setblocking(False)
+
+    def init_sensor_receiver(self):
+        super().init_sensor_receiver()
+        if self.sensor_socket is not None:
+            self.sensor_socket.setblocking(False)
+
+    def on_sensor_readable(self):
+        """
+        Esvazia o socket de sensores; usa recvmsg (e não um datagram
+        endpoint) para receber também a contagem de descartes do kernel
+        """
+        for _ in range(self.SENSOR_BATCH):
+            try:
+                data, addr = self.receive_sensor_datagram()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                print(f"[Gateway] Error receiving sensor data: {e}")
+                return
+            try:
+                self.handle_sensor_packet(data, addr)
+            except Exception as e:
+                print(f"[Gateway] Error handling datagram from {addr}: {e}")
+
+    def is_blocking(self, request):
+        """Se a requisição pode bloquear (rede ou disco) e deve ir para o executor"""
+        if request.command == "GET_HISTORY":
+            # source=log lê segmentos do log em disco
+            try:
+                params = json.loads(request.parameters) if request.parameters else {}
+            except ValueError:
+                return False  # process_client_request responde o erro
+            return isinstance(params, dict) and params.get("source") == "log"
+        return request.command in self.BLOCKING_COMMANDS
+
+    async def execute_request(self, request, session):
+        if self.is_blocking(request) or self.is_routed(request):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.request_executor, self.process_client_request, request, session)
+        return self.process_client_request(request, session)
+
+    async def serve_request(self, request, session, writer):
+        try:
+            response_data = await self.execute_request(request, session)
+        except Exception as e:
+            response_data = error_response(request, e)
+
+        # writer.write de um frame inteiro é atômico dentro do loop,
+        # então respostas concorrentes não se misturam
+        writer.write(encode_frame(self.encode_response(session, response_data)))
+        await writer.drain()
+
+    async def handle_client_session(self, reader, writer):
+        loop = asyncio.get_running_loop()
+
+        def push(response_data):
+            # Chamado pela thread de pushes das assinaturas
+            if writer.is_closing():
+                raise ConnectionError("Client session closed")
+            loop.call_soon_threadsafe(writer.write, encode_frame(self.encode_response(session, response_data)))
+
+        session = ClientSession(push)
+        self.metrics.inc("client_sessions")
+        in_flight = set()
+        try:
+            while True:
+                data = await read_frame_async(reader)
+
+                request = device_pb2.ClientRequest()
+                request.ParseFromString(data)
+                session.negotiate(request)
+
+                # Com request_id as requisições são multiplexadas: cada uma vira
+                # uma task e a resposta volta assim que fica pronta
+                if request.request_id:
+                    task = asyncio.create_task(self.serve_request(request, session, writer))
+                    in_flight.add(task)
+                    task.add_done_callback(in_flight.discard)
+                else:
+                    await self.serve_request(request, session, writer)
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            print(f"Error handling client: {e}")
+        finally:
+            self.metrics.inc("client_sessions", -1)
+            self.subscriptions.drop_session(session)
+            for task in list(in_flight):
+                task.cancel()
+            writer.close()
+
+    async def periodic_discovery(self):
+        while True:
+            await asyncio.sleep(15)
+            self.send_discovery_message()
+
+    async def periodic_expiry(self):
+        while True:
+            await asyncio.sleep(self.LEASE_CHECK_INTERVAL)
+            self.expire_leases()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.start_metrics_server()
+
+        # Endpoint UDP para anúncios (ANNOUNCE_PORT) e leitor de sensor data (SENSOR_PORT)
+        await loop.create_datagram_endpoint(
+            lambda: _DatagramHandler(self.handle_device_announcement), sock=self.udp_socket)
+        # Com workers de ingestão, SensorData é recebido fora do loop
+        if self.sensor_ingestor is not None:
+            self.sensor_ingestor.start()
+        else:
+            loop.add_reader(self.sensor_socket, self.on_sensor_readable)
+
+        if self.membership is not None:
+            self.membership.start()
+
+        # Envia multicast inicial
+        self.send_discovery_message()
+        discovery_task = asyncio.create_task(self.periodic_discovery())
+        expiry_task = asyncio.create_task(self.periodic_expiry())
+
+        server = await asyncio.start_server(self.handle_client_session, sock=self.tcp_socket)
+        print(f"Gateway (async) running on port {self.TCP_PORT}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if self.sensor_socket is not None:
+                loop.remove_reader(self.sensor_socket)
+            discovery_task.cancel()
+            expiry_task.cancel()
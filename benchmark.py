@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import random
+import resource
+import socket
+import subprocess
+import sys
+import time
+import device_pb2
+from protocol import PROTOCOL_VERSION, command_params, set_state, typed_state
+from transport import encode_frame, read_frame_async
+
+
+def free_port(kind=socket.SOCK_STREAM):
+    with socket.socket(socket.AF_INET, kind) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def raise_fd_limit():
+    """Cada device virtual tem um socket de escuta e o gateway uma conexão com ele"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def percentile(sorted_values, q):
+    """Percentil pelo posto mais próximo (sorted_values já ordenado)"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, duration):
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "errors": errors,
+        "throughput_rps": len(values) / duration if duration else 0.0,
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "p999_ms": percentile(values, 0.999) * 1000,
+        "max_ms": (values[-1] if values else 0.0) * 1000,
+    }
+
+
+class VirtualDevice:
+    """
+    Um device simulado: anuncia-se com DeviceDiscovery, atende DeviceCommand
+    por TCP como a lâmpada (atuadores) e manda SensorData (sensores)
+    """
+    def __init__(self, device_type, port, protocol_version):
+        self.device_type = device_type
+        self.port = port
+        self.protocol_version = protocol_version
+        if device_type == "smart_lamp":
+            self.state = {"power": "OFF", "brightness": 0}
+        else:
+            self.state = {"temperature": 25.0, "unit": "°C", "update_interval": 2}
+
+    @property
+    def device_id(self):
+        return f"{self.device_type}_127.0.0.1_{self.port}"
+
+    def discovery(self):
+        msg = device_pb2.DeviceDiscovery()
+        msg.device_type = self.device_type
+        msg.ip = "127.0.0.1"
+        msg.port = self.port
+        msg.protocol_version = self.protocol_version
+        set_state(msg, self.device_type, self.state, self.protocol_version)
+        return msg.SerializeToString()
+
+    def sensor_data(self):
+        self.state["temperature"] = round(20 + random.random() * 10, 2)
+        msg = device_pb2.SensorData()
+        msg.device_id = self.device_id
+        msg.sensor_type = "temperature"
+        msg.value = self.state["temperature"]
+        msg.timestamp = int(time.time())
+        if self.protocol_version >= 2:
+            msg.state.CopyFrom(typed_state(self.device_type, self.state))
+        else:
+            msg.unit = json.dumps(self.state)
+        return msg.SerializeToString()
+
+    def handle_command(self, command_msg):
+        params = command_params(command_msg)
+        response = device_pb2.DeviceResponse()
+        response.success = True
+        if command_msg.command == "ON":
+            self.state.update(power="ON", brightness=50)
+        elif command_msg.command == "OFF":
+            self.state.update(power="OFF", brightness=0)
+        elif command_msg.command == "SET_BRIGHTNESS" and "brightness" in params:
+            brightness = int(params["brightness"])
+            self.state.update(power="ON" if brightness else "OFF", brightness=brightness)
+        elif command_msg.command != "GET_STATUS":
+            response.success = False
+        response.message = "ok" if response.success else "Unknown command"
+        set_state(response, self.device_type, self.state, self.protocol_version)
+        return response
+
+    async def serve(self, reader, writer):
+        try:
+            while True:
+                command_msg = device_pb2.DeviceCommand()
+                command_msg.ParseFromString(await read_frame_async(reader))
+                writer.write(encode_frame(self.handle_command(command_msg).SerializeToString()))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass  # gateway desconectou, ou o processo está encerrando
+        finally:
+            writer.close()
+
+
+class VirtualFleet:
+    """Todos os devices virtuais num único event loop (roda num processo próprio)"""
+    # Devices reais respondem ao GATEWAY_DISCOVERY a cada 15s; aqui o
+    # anúncio é direto, bem antes da lease de 45s vencer
+    ANNOUNCE_INTERVAL = 10
+    TICK = 0.01
+
+    def __init__(self, config, ready, sending, stop, sent):
+        self.config = config
+        self.ready = ready      # Event: todos os devices escutando e anunciados
+        self.sending = sending  # Event: sensores enviando SensorData
+        self.stop = stop        # Event: encerra o processo
+        self.sent = sent        # Value: SensorData enviados
+        self.devices = []
+        self.servers = []
+
+    def announce(self, sock):
+        target = ("127.0.0.1", self.config["announce_port"])
+        for device in self.devices:
+            sock.sendto(device.discovery(), target)
+
+    async def start(self):
+        config = self.config
+        sensors = int(config["devices"] * config["sensor_fraction"])
+        for index in range(config["devices"]):
+            device_type = "temperature_sensor" if index < sensors else "smart_lamp"
+            device = VirtualDevice(device_type, 0, config["protocol"])
+            server = await asyncio.start_server(device.serve, "127.0.0.1", 0)
+            device.port = server.sockets[0].getsockname()[1]
+            self.devices.append(device)
+            self.servers.append(server)
+
+    async def announce_loop(self, sock):
+        while True:
+            self.announce(sock)
+            await asyncio.sleep(self.ANNOUNCE_INTERVAL)
+
+    async def sensor_loop(self, sock):
+        """Envia rate SensorData/s por sensor, distribuídos em ticks de TICK segundos"""
+        sensors = [device for device in self.devices if device.device_type != "smart_lamp"]
+        target = ("127.0.0.1", self.config["sensor_port"])
+        rate = len(sensors) * self.config["sensor_rate"]
+        if not sensors or rate <= 0:
+            return
+        position = 0
+        owed = 0.0
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(self.TICK)
+            now = time.perf_counter()
+            if not self.sending.is_set():
+                last = now
+                continue
+            owed += rate * (now - last)
+            last = now
+            count = int(owed)
+            owed -= count
+            delivered = 0
+            for _ in range(count):
+                try:
+                    sock.sendto(sensors[position].sensor_data(), target)
+                except BlockingIOError:
+                    break  # buffer de envio cheio: o resto do tick não sai
+                delivered += 1
+                position = (position + 1) % len(sensors)
+            with self.sent.get_lock():
+                self.sent.value += delivered
+
+    async def main(self):
+        await self.start()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        tasks = [asyncio.create_task(self.announce_loop(sock)),
+                 asyncio.create_task(self.sensor_loop(sock))]
+        self.ready.set()
+        while not self.stop.is_set():
+            await asyncio.sleep(0.1)
+        for task in tasks:
+            task.cancel()
+
+    def run(self):
+        raise_fd_limit()
+        asyncio.run(self.main())
+
+
+class VirtualClient:
+    """Um cliente em malha fechada: uma requisição em voo por conexão"""
+    def __init__(self, host, port, mix, lamp_ids):
+        self.host = host
+        self.port = port
+        self.mix = mix
+        self.lamp_ids = lamp_ids
+        self.latencies = {command: [] for command in mix}
+        self.errors = {command: 0 for command in mix}
+        self.request_ids = 0
+
+    def build_request(self, command):
+        request = device_pb2.ClientRequest()
+        request.command = command
+        self.request_ids += 1
+        request.request_id = self.request_ids
+        if command in ("CONTROL_DEVICE", "GET_STATUS"):
+            request.device_id = random.choice(self.lamp_ids)
+        if command == "CONTROL_DEVICE":
+            request.action = "SET_BRIGHTNESS"
+            request.parameters = json.dumps({"brightness": random.randint(0, 100)})
+        return request
+
+    async def run(self, deadline):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        commands = list(self.mix)
+        weights = [self.mix[command] for command in commands]
+        try:
+            while time.perf_counter() < deadline:
+                command = random.choices(commands, weights)[0]
+                request = self.build_request(command)
+                started = time.perf_counter()
+                writer.write(encode_frame(request.SerializeToString()))
+                response = device_pb2.ClientResponse()
+                response.ParseFromString(await read_frame_async(reader))
+                elapsed = time.perf_counter() - started
+                if response.success:
+                    self.latencies[command].append(elapsed)
+                else:
+                    self.errors[command] += 1
+        finally:
+            writer.close()
+
+
+async def request_once(host, port, command):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        request = device_pb2.ClientRequest()
+        request.command = command
+        writer.write(encode_frame(request.SerializeToString()))
+        response = device_pb2.ClientResponse()
+        response.ParseFromString(await read_frame_async(reader))
+        return response
+    finally:
+        writer.close()
+
+
+async def gateway_stats(host, port):
+    response = await request_once(host, port, "GATEWAY_STATS")
+    return dict(response.stats)
+
+
+def sensor_packets(stats):
+    return sum(value for name, value in stats.items() if name.startswith("sensor_packets_total"))
+
+
+async def wait_for_registry(host, port, expected, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            response = await request_once(host, port, "LIST_DEVICES")
+            lamps = [dev.device_id for dev in response.devices if dev.device_type == "smart_lamp"]
+            if len(response.devices) >= expected:
+                return lamps
+        except OSError:
+            pass
+        await asyncio.sleep(0.5)
+    raise TimeoutError(f"Gateway did not register {expected} devices in {timeout}s")
+
+
+async def run_clients(config, sent, sending):
+    host, port = config["gateway_host"], config["tcp_port"]
+    lamp_ids = await wait_for_registry(host, port, config["devices"], config["startup_timeout"])
+    if not lamp_ids and any(command != "LIST_DEVICES" for command in config["mix"]):
+        raise RuntimeError("No smart_lamp devices to control (lower --sensor-fraction)")
+
+    sending.set()
+    await asyncio.sleep(config["warmup"])
+    before = await gateway_stats(host, port)
+    sent_before = sent.value
+
+    clients = [VirtualClient(host, port, config["mix"], lamp_ids) for _ in range(config["clients"])]
+    started = time.perf_counter()
+    await asyncio.gather(*(client.run(started + config["duration"]) for client in clients))
+    duration = time.perf_counter() - started
+
+    # Sensores param e o gateway tem um instante para esvaziar os sockets
+    sending.clear()
+    sent_after = sent.value
+    await asyncio.sleep(1.0)
+    after = await gateway_stats(host, port)
+
+    requests = {}
+    everything, errors = [], 0
+    for command in config["mix"]:
+        latencies = [value for client in clients for value in client.latencies[command]]
+        failed = sum(client.errors[command] for client in clients)
+        requests[command] = summarize(latencies, failed, duration)
+        everything.extend(latencies)
+        errors += failed
+    requests["ALL"] = summarize(everything, errors, duration)
+
+    sensor_sent = sent_after - sent_before
+    received = sensor_packets(after) - sensor_packets(before)
+    return {
+        "duration_s": duration,
+        "requests": requests,
+        "sensor": {
+            "sent": sensor_sent,
+            "received": received,
+            "loss": max(0.0, 1 - received / sensor_sent) if sensor_sent else 0.0,
+            "udp_drops": after.get("sensor_udp_drops", 0) - before.get("sensor_udp_drops", 0),
+        },
+        "gateway_stats": after,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def start_gateway(config):
+    command = [sys.executable, "gateway.py", "--mode", config["gateway_mode"],
+               "--port", str(config["tcp_port"]),
+               "--announce-port", str(config["announce_port"]),
+               "--sensor-port", str(config["sensor_port"]),
+               "--sensor-workers", str(config["sensor_workers"]),
+               "--sensor-log-dir", "", "--metrics-port", "0", "--state-feed-port", "0"]
+    return subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def parse_mix(text):
+    """"list=20,control=80" -> {"LIST_DEVICES": 20, "CONTROL_DEVICE": 80}"""
+    names = {"list": "LIST_DEVICES", "control": "CONTROL_DEVICE", "status": "GET_STATUS"}
+    mix = {}
+    for item in filter(None, text.split(",")):
+        name, _, weight = item.partition("=")
+        if float(weight or 1) > 0:
+            mix[names[name.strip()]] = float(weight or 1)
+    return mix
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Carga sintética no gateway: devices e clientes virtuais, latências e perda")
+    parser.add_argument("--devices", type=int, default=1000, help="devices virtuais")
+    parser.add_argument("--sensor-fraction", type=float, default=0.5,
+                        help="fração dos devices que são sensores (o resto são lâmpadas)")
+    parser.add_argument("--sensor-rate", type=float, default=0.5, help="SensorData/s por sensor")
+    parser.add_argument("--clients", type=int, default=20, help="clientes virtuais (uma conexão cada)")
+    parser.add_argument("--mix", default="list=10,control=80,status=10",
+                        help="peso de cada requisição: list, control, status")
+    parser.add_argument("--duration", type=float, default=10, help="segundos de medição")
+    parser.add_argument("--warmup", type=float, default=2, help="segundos com sensores antes de medir")
+    parser.add_argument("--protocol", type=int, default=PROTOCOL_VERSION, help="versão do protocolo dos devices")
+    parser.add_argument("--gateway-mode", choices=["async", "threaded"], default="async")
+    parser.add_argument("--sensor-workers", type=int, default=0)
+    parser.add_argument("--gateway", help="host:porta de um gateway já rodando (com --announce-port/--sensor-port)")
+    parser.add_argument("--announce-port", type=int, default=50001)
+    parser.add_argument("--sensor-port", type=int, default=50002)
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="arquivo para o resultado em JSON (além da saída padrão)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    random.seed(args.seed)
+    raise_fd_limit()
+
+    config = {
+        "devices": args.devices, "sensor_fraction": args.sensor_fraction, "sensor_rate": args.sensor_rate,
+        "clients": args.clients, "mix": parse_mix(args.mix), "duration": args.duration,
+        "warmup": args.warmup, "protocol": args.protocol, "gateway_mode": args.gateway_mode,
+        "sensor_workers": args.sensor_workers, "startup_timeout": args.startup_timeout, "seed": args.seed,
+    }
+    gateway = None
+    if args.gateway:
+        host, _, port = args.gateway.rpartition(":")
+        config.update(gateway_host=host, tcp_port=int(port),
+                      announce_port=args.announce_port, sensor_port=args.sensor_port)
+    else:
+        # Gateway local em portas livres, sem log em disco nem endpoint de métricas
+        config.update(gateway_host="127.0.0.1", tcp_port=free_port(),
+                      announce_port=free_port(socket.SOCK_DGRAM), sensor_port=free_port(socket.SOCK_DGRAM))
+        gateway = start_gateway(config)
+
+    ready, sending, stop = multiprocessing.Event(), multiprocessing.Event(), multiprocessing.Event()
+    sent = multiprocessing.Value("Q", 0)
+    fleet = multiprocessing.Process(target=VirtualFleet(config, ready, sending, stop, sent).run, daemon=True)
+    fleet.start()
+    try:
+        if not ready.wait(args.startup_timeout):
+            raise TimeoutError("Virtual devices did not start")
+        result = asyncio.run(run_clients(config, sent, sending))
+    finally:
+        stop.set()
+        fleet.join(5)
+        if gateway is not None:
+            gateway.terminate()
+            gateway.wait()
+
+    result = {"commit": git_commit(), "timestamp": time.time(), "config": config, **result}
+    for command, summary in result["requests"].items():
+        print(f"{command:<15} {summary['count']:>8} ok {summary['errors']:>5} err "
+              f"{summary['throughput_rps']:>9.1f} req/s  p50 {summary['p50_ms']:.2f} ms  "
+              f"p99 {summary['p99_ms']:.2f} ms  p999 {summary['p999_ms']:.2f} ms", file=sys.stderr)
+    sensor = result["sensor"]
+    print(f"SensorData      {sensor['sent']} sent, {sensor['received']} received, "
+          f"loss {sensor['loss'] * 100:.2f}%", file=sys.stderr)
+
+    output = json.dumps(result, indent=2, sort_keys=True)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,58 +2,152 @@
 import socket
 import json
 import sys
+import time
+import itertools
+import random
+import threading
+from concurrent.futures import Future
 import device_pb2
+from transport import FrameReader, send_frame
+from compression import SUPPORTED_ENCODINGS, decode_response
 from datetime import datetime
 
+
 class SmartHomeClient:
-    def __init__(self, gateway_ip="127.0.0.1", gateway_port=6000):
+    def __init__(self, gateway_ip="127.0.0.1", gateway_port=6000, timeout=10.0, compression=True, trace=True):
         self.gateway_ip = gateway_ip
         self.gateway_port = gateway_port
+        self.timeout = timeout
         self.sock = None
+        # Respostas grandes (ex.: LIST_DEVICES) podem vir comprimidas
+        self.accept_encodings = SUPPORTED_ENCODINGS if compression else ()
+        # Com trace, gateway e devices medem cada trecho das requisições (GET_TRACES)
+        self.trace = trace
+
+        # Requisições em voo: request_id -> (socket em que foi enviada, Future
+        # com o ClientResponse); uma conexão que cai só falha as suas
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        # Um cliente pode ser usado por várias threads (ex.: repasses entre
+        # shards): só uma abre a conexão
+        self.connect_lock = threading.Lock()
+        self.request_ids = itertools.count(1)
+
+        # Assinaturas ativas: request_id do SUBSCRIBE -> callback dos pushes
+        self.subscriptions = {}
         
     def connect(self):
-        """Conecta ao gateway"""
-        try:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.sock.connect((self.gateway_ip, self.gateway_port))
+        """Conecta ao gateway (se ainda não estiver conectado)"""
+        with self.connect_lock:
+            if self.sock is not None:
+                return True
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                sock.connect((self.gateway_ip, self.gateway_port))
+            except Exception as e:
+                print(f"Error connecting to gateway: {e}")
+                sock.close()
+                return False
+            self.sock = sock
+            reader = threading.Thread(target=self._read_responses, args=(sock,), daemon=True)
+            reader.start()
             return True
-        except Exception as e:
-            print(f"Error connecting to gateway: {e}")
-            return False
             
     def disconnect(self):
         """Desconecta do gateway"""
-        if self.sock:
-            self.sock.close()
-            self.sock = None
-            
-    def send_request(self, request):
-        """Envia requisição para o gateway"""
-        if not self.sock:
+        with self.connect_lock:
+            sock, self.sock = self.sock, None
+        if sock:
+            sock.close()
+
+    def _read_responses(self, sock):
+        """Entrega cada resposta recebida ao Future do request_id correspondente"""
+        reader = FrameReader(sock)
+        try:
+            while True:
+                response_data = reader.read_frame()
+                if response_data is None:
+                    break
+
+                response = device_pb2.ClientResponse()
+                response.ParseFromString(response_data)
+                decode_response(response)
+                with self.pending_lock:
+                    _, future = self.pending.pop(response.request_id, (None, None))
+                    callback = self.subscriptions.get(response.request_id)
+                if callback is not None:
+                    try:
+                        callback(response)
+                    except Exception as e:
+                        print(f"Error in subscription callback: {e}")
+                if future is not None:
+                    future.set_result(response)
+        except OSError:
+            pass
+        finally:
+            with self.connect_lock:
+                current = self.sock is sock
+                if current:
+                    self.sock = None
+            with self.pending_lock:
+                # Só as requisições desta conexão; as de uma conexão mais
+                # nova continuam esperando a resposta dela
+                lost = [request_id for request_id, (owner, _) in self.pending.items() if owner is sock]
+                futures = [self.pending.pop(request_id)[1] for request_id in lost]
+                if current:
+                    self.subscriptions = {}
+            for future in futures:
+                future.set_exception(ConnectionError("Connection to gateway lost"))
+
+    def send_request_async(self, request):
+        """
+        Envia a requisição sem esperar a resposta e retorna um Future.
+        Várias requisições podem estar em voo na mesma conexão.
+        """
+        sock = self.sock
+        if sock is None:
             if not self.connect():
-                return None
-                
+                future = Future()
+                future.set_exception(ConnectionError("Not connected to gateway"))
+                return future
+            sock = self.sock
+
+        if not request.request_id:
+            request.request_id = next(self.request_ids)
+        if self.trace and not request.trace_id:
+            request.trace_id = random.getrandbits(63) or 1
+        if self.accept_encodings and not request.accept_encodings:
+            request.accept_encodings.extend(self.accept_encodings)
+        future = Future()
+        with self.pending_lock:
+            self.pending[request.request_id] = (sock, future)
+
         try:
-            # Envia requisição
             data = request.SerializeToString()
-            self.sock.send(len(data).to_bytes(4, byteorder='big'))
-            self.sock.send(data)
-            
-            # Recebe resposta
-            size_data = self.sock.recv(4)
-            if not size_data:
-                return None
-                
-            msg_size = int.from_bytes(size_data, byteorder='big')
-            response_data = self.sock.recv(msg_size)
-            
-            # Processa resposta
-            response = device_pb2.ClientResponse()
-            response.ParseFromString(response_data)
-            return response
+            with self.send_lock:
+                if sock is None:
+                    raise ConnectionError("Connection to gateway lost")
+                send_frame(sock, data)
+        except Exception as e:
+            self.forget(request.request_id)
+            if not future.done():
+                future.set_exception(e)
+        return future
+
+    def forget(self, request_id):
+        """Descarta uma requisição em voo cuja resposta não será mais esperada"""
+        with self.pending_lock:
+            self.pending.pop(request_id, None)
             
+    def send_request(self, request):
+        """Envia requisição para o gateway"""
+        future = self.send_request_async(request)
+        try:
+            return future.result(timeout=self.timeout)
         except Exception as e:
             print(f"Error communicating with gateway: {e}")
+            self.forget(request.request_id)
             self.disconnect()
             return None
             
@@ -104,9 +198,175 @@ class SmartHomeClient:
         response = self.send_request(request)
         if response:
             print(f"Response: {response.message}")
+            if response.status:
+                print(f"Status: {response.status}")
             return response.success
         return False
             
+    def control_devices(self, actions, timeout_ms=0):
+        """
+        Envia várias ações (device_id, action, parameters) em um único
+        BATCH_CONTROL; o gateway as executa em paralelo
+        """
+        request = device_pb2.ClientRequest()
+        request.command = "BATCH_CONTROL"
+        request.timeout_ms = timeout_ms
+        for device_id, action, parameters in actions:
+            item = request.actions.add()
+            item.device_id = device_id
+            item.action = action
+            if parameters:
+                item.parameters = json.dumps(parameters)
+
+        response = self.send_request(request)
+        if response:
+            print(f"Response: {response.message}")
+            for result in response.results:
+                print(f"  {result.device_id}: {result.message}")
+            return response.success
+        return False
+
+    def turn_off_all(self):
+        """Desliga todas as lâmpadas e ares-condicionados em um único lote"""
+        request = device_pb2.ClientRequest()
+        request.command = "LIST_DEVICES"
+        response = self.send_request(request)
+        if not response or not response.success:
+            print("Erro ao listar dispositivos")
+            return False
+
+        actions = [(device.device_id, "OFF", None) for device in response.devices
+                   if device.device_type in ("smart_lamp", "air_conditioner")]
+        if not actions:
+            print("Nenhum dispositivo para desligar")
+            return True
+        return self.control_devices(actions)
+
+    def subscribe(self, callback, device_types=None, device_ids=None, interval_ms=500):
+        """
+        Assina as mudanças de estado dos dispositivos. callback recebe a
+        resposta inicial (lista completa) e cada push seguinte.
+        Retorna o request_id da assinatura, ou None em caso de erro.
+        """
+        request = device_pb2.ClientRequest()
+        request.command = "SUBSCRIBE"
+        params = {"interval_ms": interval_ms}
+        if device_types:
+            params["device_types"] = list(device_types)
+        if device_ids:
+            params["device_ids"] = list(device_ids)
+        request.parameters = json.dumps(params)
+
+        # O callback precisa estar registrado antes do primeiro push chegar
+        request.request_id = next(self.request_ids)
+        with self.pending_lock:
+            self.subscriptions[request.request_id] = callback
+        response = self.send_request(request)
+        if not response or not response.success:
+            with self.pending_lock:
+                self.subscriptions.pop(request.request_id, None)
+            return None
+        return request.request_id
+
+    def unsubscribe(self, subscription_id):
+        """Cancela uma assinatura criada por subscribe()"""
+        with self.pending_lock:
+            self.subscriptions.pop(subscription_id, None)
+        request = device_pb2.ClientRequest()
+        request.command = "UNSUBSCRIBE"
+        request.parameters = json.dumps({"subscription_id": subscription_id})
+        response = self.send_request(request)
+        return bool(response and response.success)
+
+    def watch_devices(self):
+        """Mostra as mudanças de estado empurradas pelo gateway até o usuário teclar Enter"""
+        def on_update(response):
+            for device in response.devices:
+                print(f"[{datetime.now():%H:%M:%S}] {device.device_id}: {device.status}")
+            for device_id in response.removed_device_ids:
+                print(f"[{datetime.now():%H:%M:%S}] {device_id}: removido")
+
+        subscription_id = self.subscribe(on_update)
+        if subscription_id is None:
+            print("Erro ao assinar atualizações")
+            return
+        input("Acompanhando mudanças (Enter para parar)...\n")
+        self.unsubscribe(subscription_id)
+
+    def get_history(self, device_id, start=None, end=None, bucket=0, source="memory"):
+        """
+        Busca as leituras de um sensor entre start e end (epoch em segundos).
+        Com bucket > 0 o gateway agrega por janelas de bucket segundos;
+        source="log" consulta o log em disco em vez da memória.
+        Retorna a lista de HistoryPoint, ou None em caso de erro.
+        """
+        request = device_pb2.ClientRequest()
+        request.command = "GET_HISTORY"
+        request.device_id = device_id
+        params = {"bucket": bucket, "source": source}
+        if start is not None:
+            params["start"] = start
+        if end is not None:
+            params["end"] = end
+        request.parameters = json.dumps(params)
+
+        response = self.send_request(request)
+        if response and response.success:
+            return list(response.history)
+        if response:
+            print(f"Response: {response.message}")
+        return None
+
+    def show_history(self):
+        """Menu para consultar o histórico de um sensor"""
+        device_id = input("Digite o ID do dispositivo: ")
+        minutes = input("Últimos quantos minutos? [10]: ").strip() or "10"
+        bucket = input("Agregar em janelas de quantos segundos? [0 = sem agregação]: ").strip() or "0"
+        source = input("Fonte (memory/log) [memory]: ").strip() or "memory"
+
+        now = time.time()
+        points = self.get_history(device_id, start=now - float(minutes) * 60, end=now,
+                                  bucket=float(bucket), source=source)
+        if points is None:
+            print("Erro ao obter histórico")
+            return
+        for point in points:
+            when = datetime.fromtimestamp(point.timestamp)
+            if point.count > 1:
+                print(f"{when}  avg={point.value:.2f}  min={point.min:.2f}  max={point.max:.2f}  n={point.count}")
+            else:
+                print(f"{when}  {point.value:.2f}")
+
+    def get_traces(self, limit=20, min_ms=0, command=None):
+        """Requisições rastreadas mais recentes do gateway (lista de Trace), ou None"""
+        request = device_pb2.ClientRequest()
+        request.command = "GET_TRACES"
+        params = {"limit": limit, "min_ms": min_ms}
+        if command:
+            params["command"] = command
+        request.parameters = json.dumps(params)
+
+        response = self.send_request(request)
+        if response and response.success:
+            return list(response.traces)
+        if response:
+            print(f"Response: {response.message}")
+        return None
+
+    def show_traces(self):
+        """Menu para ver onde o tempo das requisições lentas foi gasto"""
+        min_ms = input("Só requisições acima de quantos ms? [0]: ").strip() or "0"
+        command = input("Comando (vazio = todos): ").strip().upper()
+        traces = self.get_traces(min_ms=float(min_ms), command=command or None)
+        if traces is None:
+            print("Erro ao obter traces")
+            return
+        for trace in traces:
+            print(f"\n{datetime.fromtimestamp(trace.start)}  {trace.command} {trace.device_id}  "
+                  f"{trace.duration * 1000:.2f} ms  (trace {trace.trace_id:x})")
+            for span in sorted(trace.spans, key=lambda span: span.start):
+                print(f"    {span.process:<24} {span.name:<24} {span.duration * 1000:8.2f} ms")
+
     def get_device_status(self, device_id):
         """Obtém status de um dispositivo"""
         request = device_pb2.ClientRequest()
@@ -116,6 +376,8 @@ class SmartHomeClient:
         response = self.send_request(request)
         if response:
             print(f"Response: {response.message}")
+            if response.status:
+                print(f"Status: {response.status}")
             return response.success
         return False
         
@@ -126,6 +388,10 @@ class SmartHomeClient:
         print("2. Controlar lâmpada")
         print("3. Controlar ar condicionado")
         print("4. Ver status de dispositivo")
+        print("5. Desligar lâmpadas e ares-condicionados")
+        print("6. Acompanhar mudanças em tempo real")
+        print("7. Histórico de sensor")
+        print("8. Requisições lentas (traces)")
         print("0. Sair")
         
     def control_lamp(self):
@@ -191,6 +457,14 @@ class SmartHomeClient:
             elif option == "4":
                 device_id = input("Digite o ID do dispositivo: ")
                 self.get_device_status(device_id)
+            elif option == "5":
+                self.turn_off_all()
+            elif option == "6":
+                self.watch_devices()
+            elif option == "7":
+                self.show_history()
+            elif option == "8":
+                self.show_traces()
             else:
                 print("Opção inválida!")
                 
@@ -1,8 +1,9 @@
 #!/usr/bin/env python3
-import socket
 import json
+import queue
 
 import device_pb2
+from client import SmartHomeClient as GatewayClient
 
 import tkinter as tk
 from tkinter import ttk, messagebox
@@ -13,60 +14,41 @@ from ttkbootstrap.constants import *
 # ===============================================
 #           CLIENTE DE COMUNICAÇÃO
 # ===============================================
-class SmartHomeClient:
-    def __init__(self, gateway_ip="127.0.0.1", gateway_port=6000):
-        self.gateway_ip = gateway_ip
-        self.gateway_port = gateway_port
-        self.sock = None
-        
+class SmartHomeClient(GatewayClient):
+    """
+    Cliente da GUI: conexão, envio e leitura das respostas são os de
+    client.SmartHomeClient; aqui as chamadas retornam (resposta, erro)
+    para a interface mostrar a mensagem.
+    """
     def connect(self):
-        """Conecta ao gateway"""
-        try:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.sock.connect((self.gateway_ip, self.gateway_port))
+        """Conecta ao gateway; retorna (sucesso, mensagem)"""
+        if super().connect():
             return True, "Conexão estabelecida com sucesso!"
-        except Exception:
-            return False, f"Gateway offline."
-            
-    def disconnect(self):
-        """Desconecta do gateway"""
-        if self.sock:
-            self.sock.close()
-            self.sock = None
+        return False, "Gateway offline."
 
     def is_connected(self):
         return self.sock is not None
 
     def send_request(self, request):
-        """Envia requisição para o gateway e obtém resposta"""
+        """Envia requisição para o gateway e obtém (resposta, erro)"""
         if not self.sock:
             return None, "Desconectado do Gateway."
 
         try:
-            data = request.SerializeToString()
-            self.sock.send(len(data).to_bytes(4, byteorder='big'))
-            self.sock.send(data)
-            
-            # Recebe resposta
-            size_data = self.sock.recv(4)
-            if not size_data:
-                return None, "Gateway não retornou dados."
-                
-            msg_size = int.from_bytes(size_data, byteorder='big')
-            response_data = self.sock.recv(msg_size)
-            
-            # Processa resposta
-            response = device_pb2.ClientResponse()
-            response.ParseFromString(response_data)
-            return response, None
-            
+            return self.send_request_async(request).result(timeout=self.timeout), None
         except Exception:
+            # Sem resposta: a requisição não fica esquecida em pending
+            self.forget(request.request_id)
             return None, f"Desconectado do Gateway."
             
-    def list_devices(self):
-        """Lista todos os dispositivos (retorna ClientResponse)"""
+    def list_devices(self, since_version=0):
+        """
+        Lista os dispositivos (retorna ClientResponse). Com since_version,
+        o gateway devolve só os alterados e os removidos desde essa versão.
+        """
         request = device_pb2.ClientRequest()
         request.command = "LIST_DEVICES"
+        request.since_version = since_version
         return self.send_request(request)
             
     def control_device(self, device_id, action, parameters=None):
@@ -79,6 +61,65 @@ class SmartHomeClient:
             request.parameters = json.dumps(parameters)
         return self.send_request(request)
 
+    def control_devices(self, actions, timeout_ms=0):
+        """
+        Envia várias ações (device_id, action, parameters) em um único
+        BATCH_CONTROL (retorna ClientResponse com um resultado por ação)
+        """
+        request = device_pb2.ClientRequest()
+        request.command = "BATCH_CONTROL"
+        request.timeout_ms = timeout_ms
+        for device_id, action, parameters in actions:
+            item = request.actions.add()
+            item.device_id = device_id
+            item.action = action
+            if parameters:
+                item.parameters = json.dumps(parameters)
+        return self.send_request(request)
+
+    def subscribe(self, callback, device_types=None, device_ids=None, interval_ms=500):
+        """
+        Assina as mudanças de estado dos dispositivos. callback recebe a
+        resposta inicial (lista completa) e cada push seguinte, a partir da
+        thread de leitura. Retorna (ClientResponse, erro).
+        """
+        request = device_pb2.ClientRequest()
+        request.command = "SUBSCRIBE"
+        params = {"interval_ms": interval_ms}
+        if device_types:
+            params["device_types"] = list(device_types)
+        if device_ids:
+            params["device_ids"] = list(device_ids)
+        request.parameters = json.dumps(params)
+
+        # O callback precisa estar registrado antes do primeiro push chegar
+        request_id = next(self.request_ids)
+        with self.pending_lock:
+            self.subscriptions[request_id] = callback
+        request.request_id = request_id
+        response, error = self.send_request(request)
+        if error or not response or not response.success:
+            with self.pending_lock:
+                self.subscriptions.pop(request_id, None)
+        return response, error
+
+    def get_history(self, device_id, start=None, end=None, bucket=0, source="memory"):
+        """
+        Busca as leituras de um sensor entre start e end (epoch em segundos),
+        agregadas por janelas de bucket segundos se bucket > 0; source="log"
+        consulta o log em disco (retorna ClientResponse com o campo history)
+        """
+        request = device_pb2.ClientRequest()
+        request.command = "GET_HISTORY"
+        request.device_id = device_id
+        params = {"bucket": bucket, "source": source}
+        if start is not None:
+            params["start"] = start
+        if end is not None:
+            params["end"] = end
+        request.parameters = json.dumps(params)
+        return self.send_request(request)
+
     def get_device_status(self, device_id):
         """Obtém status de um dispositivo (retorna ClientResponse)"""
         request = device_pb2.ClientRequest()
@@ -413,8 +454,14 @@ class SmartHomeGUI(tb.Window):
         self.status_panel = DeviceStatusPanel(self.middle_frame_right)
         self.status_panel.pack(side=TOP, fill=BOTH, expand=True, padx=5, pady=5)
 
-        # Inicia o loop de atualização periódica a cada 5s
+        # Cache local sincronizado incrementalmente com o registro do gateway
+        self.reset_device_cache()
+
+        # Inicia o loop de atualização periódica a cada 5s (só usado quando
+        # o gateway não aceita SUBSCRIBE); pushes são aplicados a cada 200ms
         self.update_interval_ms = 5000
+        self.push_interval_ms = 500
+        self.push_drain_ms = 200
         self.start_periodic_update()
 
     # =============================================
@@ -471,6 +518,9 @@ class SmartHomeGUI(tb.Window):
         btn_list = tb.Button(frm_dev, text="Listar Dispositivos", command=self.on_list_devices, bootstyle=PRIMARY)
         btn_list.pack(side=TOP, anchor="nw", padx=5, pady=5)
 
+        btn_all_off = tb.Button(frm_dev, text="Desligar Todos", command=self.on_turn_off_all, bootstyle=DANGER)
+        btn_all_off.pack(side=TOP, anchor="nw", padx=5, pady=5)
+
         tree_container = tb.Frame(frm_dev)
         tree_container.pack(side=TOP, fill=BOTH, expand=True)
 
@@ -587,14 +637,75 @@ class SmartHomeGUI(tb.Window):
         for item in self.device_tree.get_children():
             self.device_tree.delete(item)
 
-        for dev in response.devices:
+        devices = self.apply_device_list(response)
+        for dev in devices:
             dev_id = dev.device_id
             dev_type = dev.device_type
             ip_port = f"{dev.ip}:{dev.port}"
             dev_status = dev.status
             self.device_tree.insert("", tk.END, values=(dev_id, dev_type, dev_status, ip_port))
 
-        self.status_panel.update_status(response.devices)
+        self.status_panel.update_status(devices)
+
+    def apply_device_list(self, response):
+        """
+        Aplica uma resposta de LIST_DEVICES (completa ou incremental)
+        ao cache local e retorna a lista atual de dispositivos
+        """
+        if response.full_sync:
+            self.device_cache = {}
+        for dev in response.devices:
+            self.device_cache[dev.device_id] = dev
+        for dev_id in response.removed_device_ids:
+            self.device_cache.pop(dev_id, None)
+        self.sync_version = response.version
+        return list(self.device_cache.values())
+
+    def reset_device_cache(self):
+        self.device_cache = {}  # device_id -> DeviceInfo
+        self.sync_version = 0
+        self.subscribed = False
+        self.push_queue = queue.Queue()
+
+    def start_subscription(self):
+        """
+        Assina as mudanças no gateway. Os pushes chegam na thread de leitura
+        do cliente e são repassados ao Tk por uma fila; sem assinatura
+        (gateway antigo), periodic_update volta a consultar LIST_DEVICES.
+        """
+        push_queue = self.push_queue
+        response, error = self.client.subscribe(push_queue.put, interval_ms=self.push_interval_ms)
+        self.subscribed = bool(response and response.success)
+        if not self.subscribed:
+            self.write_log("Gateway sem suporte a SUBSCRIBE; usando consulta periódica.", "[INFO]")
+
+    def on_turn_off_all(self):
+        """Desliga todas as lâmpadas e ares-condicionados com um BATCH_CONTROL"""
+        if not self.client.is_connected():
+            self.write_log("Conecte-se ao Gateway primeiro.", "[ERRO]")
+            return
+
+        response, error = self.client.list_devices()
+        if error or not response or not response.success:
+            self.write_log("Falha ao listar dispositivos.", "[ERRO]")
+            return
+
+        actions = [(dev.device_id, "OFF", None) for dev in response.devices
+                   if dev.device_type in ("smart_lamp", "air_conditioner")]
+        if not actions:
+            self.write_log("Nenhum dispositivo para desligar.", "[INFO]")
+            return
+
+        self.write_log(f"Desligando {len(actions)} dispositivos", "[ACTION]")
+        response, error = self.client.control_devices(actions)
+        if error or not response:
+            self.write_log(error or "Sem resposta do Gateway.", "[ERRO]")
+            return
+
+        self.write_log(response.message, "[RESPONSE]")
+        for result in response.results:
+            if not result.success:
+                self.write_log(f"{result.device_id}: {result.message}", "[ERRO]")
 
     # =============================================
     #   AÇÕES DE CONEXÃO
@@ -610,10 +721,12 @@ class SmartHomeGUI(tb.Window):
         self.client.gateway_port = port
 
         success, msg = self.client.connect()
+        self.reset_device_cache()
         if success:
             self.conn_indicator.config(foreground="green")
             self.conn_status_label.config(text="[Conectado]", foreground="green")
             self.write_log(msg, "[INFO]")
+            self.start_subscription()
         else:
             self.client.disconnect()
             self.conn_indicator.config(foreground="red")
@@ -626,6 +739,7 @@ class SmartHomeGUI(tb.Window):
     def on_disconnect(self):
         if self.client.is_connected():
             self.client.disconnect()
+            self.reset_device_cache()
             self.conn_indicator.config(foreground="red")
             for item in self.device_tree.get_children():
                 self.device_tree.delete(item)
@@ -655,12 +769,32 @@ class SmartHomeGUI(tb.Window):
     # =============================================
     def start_periodic_update(self):
         self.after(self.update_interval_ms, self.periodic_update)
+        self.after(self.push_drain_ms, self.drain_pushes)
+
+    def drain_pushes(self):
+        """Aplica no painel os pushes recebidos desde a última chamada (sem rede)"""
+        changed = False
+        while True:
+            try:
+                response = self.push_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.apply_device_list(response)
+            changed = True
+        if changed:
+            self.status_panel.update_status(list(self.device_cache.values()))
+
+        self.after(self.push_drain_ms, self.drain_pushes)
 
     def periodic_update(self):
-        if self.client.is_connected():
-            response, error = self.client.list_devices()
+        if self.client.is_connected() and not self.subscribed:
+            # Sincronização incremental: só chega o que mudou desde a última
+            response, error = self.client.list_devices(self.sync_version)
             if response and response.success:
-                self.status_panel.update_status(response.devices)
+                changed = response.full_sync or response.devices or response.removed_device_ids
+                devices = self.apply_device_list(response)
+                if changed:
+                    self.status_panel.update_status(devices)
 
         self.after(self.update_interval_ms, self.periodic_update)
 
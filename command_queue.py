@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from tracing import activate, active
+
+
+class PendingCommand:
+    """Um comando esperando na fila de um device e quem espera o resultado"""
+    def __init__(self, command, parameters, future, traces):
+        self.command = command
+        self.parameters = parameters
+        self.futures = [future]
+        self.traces = traces  # (recorder, início epoch, início perf_counter) das requisições rastreadas
+
+
+class DeviceCommandQueues:
+    """
+    Uma fila FIFO limitada de comandos por device.
+
+    Cada device tem no máximo um despachante ativo (uma tarefa no executor)
+    que executa os comandos da sua fila um de cada vez, na ordem de chegada,
+    via execute(device_id, command, parameters) -> (success, message, status).
+    Um setpoint igual ao último comando ainda na fila o substitui: só o
+    valor mais recente chega ao device e todos os pedidos recebem esse
+    resultado. A fusão é só com o fim da fila (queue[-1]), nunca com um
+    comando mais antigo nem com o que já está em execução, para não mudar
+    a ordem: SET_BRIGHTNESS 10, OFF, SET_BRIGHTNESS 20 chegam os três ao
+    device. Com a fila cheia o comando é recusado na hora ("busy").
+    Quem desiste de esperar cancela o seu Future (future.cancel()): um
+    comando na fila sem ninguém esperando não é executado.
+    Requisições rastreadas na thread que chama submit() ganham um span
+    gateway.queue_wait e os spans da execução.
+    """
+    # Comandos em que só o último valor importa
+    MERGEABLE_COMMANDS = {"SET_BRIGHTNESS", "SET_TEMPERATURE", "SET_MODE", "SET_FAN_SPEED",
+                          "SET_INTERVAL", "GET_STATUS"}
+
+    def __init__(self, execute, executor, max_pending=16):
+        self.execute = execute
+        self.executor = executor
+        self.max_pending = max_pending
+
+        self.lock = threading.Lock()
+        self.queues = {}  # device_id -> deque de PendingCommand (sem o que está em execução)
+
+        self.submitted = 0
+        self.merged = 0
+        self.rejected = 0
+
+    def submit(self, device_id, command, parameters=None):
+        """Enfileira o comando e retorna um Future com (success, message, status)"""
+        future = Future()
+        traces = [(recorder, time.time(), time.perf_counter()) for recorder in active()]
+        with self.lock:
+            self.submitted += 1
+            queue = self.queues.get(device_id)
+            start = queue is None
+            if start:
+                queue = self.queues[device_id] = deque()
+
+            if queue and command in self.MERGEABLE_COMMANDS and queue[-1].command == command:
+                queue[-1].parameters = parameters
+                queue[-1].futures.append(future)
+                queue[-1].traces.extend(traces)
+                self.merged += 1
+                return future
+
+            if len(queue) >= self.max_pending:
+                self.rejected += 1
+                future.set_result((False, "Device busy: command queue full", ""))
+                return future
+
+            queue.append(PendingCommand(command, parameters, future, traces))
+
+        if start:
+            self.executor.submit(self._dispatch, device_id)
+        return future
+
+    def _dispatch(self, device_id):
+        while True:
+            with self.lock:
+                queue = self.queues[device_id]
+                if not queue:
+                    # Fila vazia: o próximo submit abre outro despachante
+                    del self.queues[device_id]
+                    return
+                pending = queue.popleft()
+
+            # A partir daqui os Futures não podem mais ser cancelados
+            pending.futures = [future for future in pending.futures
+                               if future.set_running_or_notify_cancel()]
+            if not pending.futures:
+                continue  # todos desistiram enquanto o comando estava na fila
+
+            now = time.perf_counter()
+            for recorder, start, started in pending.traces:
+                recorder.add("gateway.queue_wait", start, now - started)
+            try:
+                with activate(*(recorder for recorder, _, _ in pending.traces)):
+                    result = self.execute(device_id, pending.command, pending.parameters)
+            except Exception as e:
+                result = (False, f"Error: {e}", "")
+            for future in pending.futures:
+                future.set_result(result)
+
+    def stats(self):
+        with self.lock:
+            queued = sum(len(queue) for queue in self.queues.values())
+        return {
+            "command_queue_depth": queued,
+            "commands_submitted": self.submitted,
+            "commands_merged": self.merged,
+            "commands_rejected_busy": self.rejected,
+        }
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+import json
+import zlib
+import device_pb2
+from protocol import typed_state
+from transport import FrameError, MAX_FRAME_SIZE
+
+# Respostas menores que isso vão sem compressão (o ganho não paga o custo)
+COMPRESS_THRESHOLD = 1024
+COMPRESS_LEVEL = 6
+
+# Em ordem de preferência
+SUPPORTED_ENCODINGS = (device_pb2.ENCODING_ZLIB_DICT, device_pb2.ENCODING_ZLIB)
+
+# Estado típico de cada tipo de device, como os devices mandam
+SAMPLE_STATES = {
+    "temperature_sensor": {"temperature": 25.0, "unit": "°C", "update_interval": 2},
+    "brightness_sensor": {"brightness": 0, "unit": "%", "update_interval": 2},
+    "power_sensor": {"power": 0, "unit": "W", "update_interval": 2},
+    "air_conditioner": {"power": "OFF", "temperature": 25, "mode": "COOL", "fan_speed": "AUTO"},
+    "smart_lamp": {"power": "OFF", "brightness": 0},
+}
+
+
+def build_dictionary():
+    """
+    Dicionário do ENCODING_ZLIB_DICT: um LIST_DEVICES com um DeviceInfo
+    típico de cada tipo, de onde o zlib tira as strings que se repetem
+    (ids, chaves do JSON de status, tags dos campos). Cliente e gateway
+    precisam do mesmo dicionário; mudá-lo exige um novo valor de Encoding.
+    """
+    response = device_pb2.ClientResponse()
+    response.success = True
+    response.message = "Devices retrieved successfully"
+    for port, (device_type, state) in enumerate(SAMPLE_STATES.items(), start=40000):
+        dev = response.devices.add()
+        dev.ip = "192.168.0.10"
+        dev.port = port
+        dev.device_type = device_type
+        dev.device_id = f"{device_type}_{dev.ip}_{port}"
+        dev.status = json.dumps(state)
+        dev.state.CopyFrom(typed_state(device_type, state))
+        if device_type.endswith("_sensor"):
+            dev.attributes['sensor_data'] = json.dumps({"value": 25.0, "timestamp": 1700000000})
+    return response.SerializeToString()
+
+
+DICTIONARY = build_dictionary()
+
+
+def choose_encoding(accepted):
+    """Melhor codificação aceita pelo cliente (ENCODING_NONE se nenhuma)"""
+    for encoding in SUPPORTED_ENCODINGS:
+        if encoding in accepted:
+            return encoding
+    return device_pb2.ENCODING_NONE
+
+
+def compress_response(response_data, encoding, threshold=COMPRESS_THRESHOLD):
+    """
+    Envolve um ClientResponse serializado num ClientResponse comprimido,
+    se a codificação foi negociada, a resposta passa do limiar e a
+    compressão de fato diminui o frame. Caso contrário retorna response_data.
+    """
+    if encoding == device_pb2.ENCODING_NONE or len(response_data) < threshold:
+        return response_data
+    if encoding == device_pb2.ENCODING_ZLIB_DICT:
+        compressor = zlib.compressobj(COMPRESS_LEVEL, zdict=DICTIONARY)
+    else:
+        compressor = zlib.compressobj(COMPRESS_LEVEL)
+    wrapper = device_pb2.ClientResponse()
+    wrapper.encoding = encoding
+    wrapper.compressed_body = compressor.compress(response_data) + compressor.flush()
+    compressed = wrapper.SerializeToString()
+    return compressed if len(compressed) < len(response_data) else response_data
+
+
+def decode_response(response, max_size=MAX_FRAME_SIZE):
+    """Substitui um ClientResponse comprimido pelo original (no próprio objeto)"""
+    if response.encoding == device_pb2.ENCODING_NONE:
+        return response
+    if response.encoding == device_pb2.ENCODING_ZLIB_DICT:
+        decompressor = zlib.decompressobj(zdict=DICTIONARY)
+    elif response.encoding == device_pb2.ENCODING_ZLIB:
+        decompressor = zlib.decompressobj()
+    else:
+        raise FrameError(f"Unknown response encoding {response.encoding}")
+    data = decompressor.decompress(response.compressed_body, max_size)
+    if decompressor.unconsumed_tail:
+        raise FrameError(f"Compressed response exceeds limit of {max_size} bytes")
+    response.Clear()
+    response.ParseFromString(data)
+    return response
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+import socket
+import threading
+import time
+
+
+class DeviceConnectionPool:
+    """
+    Pool de conexões TCP keep-alive do gateway para os dispositivos.
+
+    Os dispositivos já processam várias mensagens por conexão em
+    handle_tcp_client, então reaproveitar o socket evita um handshake
+    TCP por comando. Cada dispositivo (ip, porta) guarda no máximo
+    max_per_device conexões ociosas, descartadas após idle_timeout.
+    Leituras esperam no máximo read_timeout: um device que aceita a
+    conexão mas não responde gera socket.timeout em vez de prender a
+    thread do gateway para sempre.
+    """
+    def __init__(self, max_per_device=4, idle_timeout=30.0, connect_timeout=3.0, read_timeout=5.0):
+        self.max_per_device = max_per_device
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+        self.idle = {}  # (ip, port) -> [(socket, instante em que ficou ocioso), ...]
+        self.lock = threading.Lock()
+
+    def _new_connection(self, addr):
+        sock = socket.create_connection(addr, timeout=self.connect_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(self.read_timeout)
+        return sock
+
+    def acquire(self, addr):
+        """
+        Retorna (socket, reused). reused indica que a conexão veio do
+        pool e pode ter sido fechada pelo dispositivo enquanto ociosa.
+        """
+        now = time.time()
+        expired = []
+        sock = None
+        with self.lock:
+            conns = self.idle.get(addr, [])
+            while conns:
+                candidate, idle_since = conns.pop()
+                if now - idle_since > self.idle_timeout:
+                    expired.append(candidate)
+                else:
+                    sock = candidate
+                    break
+        for old in expired:
+            old.close()
+
+        if sock is not None:
+            return sock, True
+        return self._new_connection(addr), False
+
+    def release(self, addr, sock):
+        """Devolve uma conexão saudável ao pool"""
+        with self.lock:
+            conns = self.idle.setdefault(addr, [])
+            if len(conns) < self.max_per_device:
+                conns.append((sock, time.time()))
+                return
+        sock.close()
+
+    def discard(self, sock):
+        """Fecha uma conexão quebrada sem devolvê-la ao pool"""
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+    def prune(self):
+        """Fecha todas as conexões ociosas há mais de idle_timeout"""
+        now = time.time()
+        expired = []
+        with self.lock:
+            for addr in list(self.idle.keys()):
+                keep = []
+                for sock, idle_since in self.idle[addr]:
+                    if now - idle_since > self.idle_timeout:
+                        expired.append(sock)
+                    else:
+                        keep.append((sock, idle_since))
+                if keep:
+                    self.idle[addr] = keep
+                else:
+                    del self.idle[addr]
+        for sock in expired:
+            sock.close()
+
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import random
+import resource
+import socket
+import struct
+import device_pb2
+from air_conditioner import AirConditioner
+from brightness_sensor import BrightnessSensor
+from power_sensor import PowerSensor
+from smart_lamp import SmartLamp
+from state_bus import HEARTBEAT_INTERVAL, StateBus
+from state_feed import StateFeed
+from temperature_sensor import TemperatureSensor
+from thermal import SIMULATION_TICK, Building
+from tracing import traced_command
+from transport import encode_frame, read_frame_async
+
+MCAST_GRP = '224.0.0.1'
+MCAST_PORT = 50000
+
+DEVICE_CLASSES = {
+    "smart_lamp": SmartLamp,
+    "air_conditioner": AirConditioner,
+    "temperature_sensor": TemperatureSensor,
+    "brightness_sensor": BrightnessSensor,
+    "power_sensor": PowerSensor,
+}
+
+# Respostas a um GATEWAY_DISCOVERY saem em lotes, para não estourar o
+# buffer de recepção do gateway com centenas de anúncios de uma vez
+ANNOUNCE_BATCH = 64
+
+
+def get_local_ip():
+    """IP local anunciado por todos os devices do host"""
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect(("8.8.8.8", 80))
+        ip = s.getsockname()[0]
+    except Exception:
+        ip = "127.0.0.1"
+    finally:
+        s.close()
+    return ip
+
+
+def raise_fd_limit():
+    """Cada device tem um socket de escuta e o gateway uma conexão com ele"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+class DiscoveryProtocol(asyncio.DatagramProtocol):
+    def __init__(self, host):
+        self.host = host
+
+    def datagram_received(self, data, addr):
+        try:
+            msg = device_pb2.DeviceCommand()
+            msg.ParseFromString(data)
+        except Exception as e:
+            print(f"[Host] Invalid multicast message from {addr}: {e}")
+            return
+        if msg.command == "GATEWAY_DISCOVERY":
+            task = asyncio.ensure_future(self.host.announce(msg, addr))
+            # O loop só guarda referência fraca às tasks
+            self.host.announcing.add(task)
+            task.add_done_callback(self.host.announcing.discard)
+
+
+class DeviceHost:
+    """
+    Vários devices simulados num único processo e num único event loop.
+
+    Cada device continua com sua porta TCP e seu device_id, mas todos
+    compartilham um listener multicast, um socket UDP de envio, o
+    barramento de estado (state_bus.py) e o feed do gateway
+    (state_feed.py). A lógica de cada tipo é a mesma dos scripts avulsos
+    (handle_command, discovery_response, tick), criados com networking=False.
+    """
+    def __init__(self, counts, ip=None, bind="0.0.0.0", rooms=0, rooms_per_floor=None):
+        self.ip = ip or get_local_ip()
+        self.bind = bind
+        # Um único mapeamento do barramento de estado para todos os devices
+        self.bus = StateBus()
+        # e um único receptor do feed do gateway para todos os sensores
+        self.feed = StateFeed()
+
+        # Com rooms, um prédio simulado (thermal.py) com ACs, lâmpadas e
+        # sensores de temperatura distribuídos pelas salas em rodízio
+        self.building = None
+        if rooms:
+            self.building = Building.grid(
+                rooms, rooms_per_floor,
+                ac_rooms=[index % rooms for index in range(counts.get("air_conditioner", 0))],
+                lamp_rooms=[index % rooms for index in range(counts.get("smart_lamp", 0))])
+
+        self.devices = []
+        for device_type, count in counts.items():
+            for index in range(count):
+                options = {}
+                if device_type.endswith("_sensor"):
+                    options["feed"] = self.feed
+                if device_type == "temperature_sensor" and self.building is not None:
+                    options.update(building=self.building, room=index % rooms)
+                self.devices.append(DEVICE_CLASSES[device_type](networking=False, bus=self.bus, ip=self.ip,
+                                                                **options))
+
+        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp_socket.setblocking(False)
+        self.dropped = 0
+        self.servers = []
+        self.tasks = []
+        self.announcing = set()
+
+    def send(self, data, target):
+        try:
+            self.udp_socket.sendto(data, target)
+        except OSError:
+            # Buffer de envio cheio: como UDP, o datagrama se perde
+            self.dropped += 1
+
+    async def start(self):
+        for device in self.devices:
+            server = await asyncio.start_server(
+                lambda reader, writer, device=device: self.serve(device, reader, writer),
+                self.bind, 0)
+            device.TCP_PORT = server.sockets[0].getsockname()[1]
+            self.servers.append(server)
+            if hasattr(device, "publish_state"):
+                # Com a porta definida o device_id é o definitivo
+                device.publish_state()
+
+        mcast_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        mcast_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        mcast_socket.bind(('0.0.0.0', MCAST_PORT))
+        mreq = struct.pack("4sl", socket.inet_aton(MCAST_GRP), socket.INADDR_ANY)
+        mcast_socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: DiscoveryProtocol(self), sock=mcast_socket)
+
+        for device in self.devices:
+            self.tasks.append(asyncio.create_task(self.report(device)))
+        self.tasks.append(asyncio.create_task(self.keep_alive()))
+        if self.building is not None:
+            self.tasks.append(asyncio.create_task(self.simulate_building()))
+
+    async def serve(self, device, reader, writer):
+        """Conexão do gateway com um device: frames DeviceCommand/DeviceResponse"""
+        process = f"device:{device.device_type}"
+        try:
+            while True:
+                command_msg = device_pb2.DeviceCommand()
+                command_msg.ParseFromString(await read_frame_async(reader))
+                response = traced_command(command_msg, device.handle_command, process)
+                writer.write(encode_frame(response.SerializeToString()))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass  # gateway desconectou, ou o processo está encerrando
+        except Exception as e:
+            print(f"[Host] Error handling TCP client of {device.device_type}:{device.TCP_PORT}: {e}")
+        finally:
+            writer.close()
+
+    async def announce(self, msg, addr):
+        """Responde a um GATEWAY_DISCOVERY por todos os devices"""
+        for index, device in enumerate(self.devices, start=1):
+            data, target = device.discovery_response(msg, addr, self.ip)
+            self.send(data, target)
+            if index % ANNOUNCE_BATCH == 0:
+                await asyncio.sleep(0.001)
+
+    async def report(self, device):
+        """Laço periódico de um device: simula e manda SensorData ao gateway"""
+        # Espalha os envios pelo intervalo em vez de todos no mesmo instante
+        await asyncio.sleep(random.uniform(0, device.update_interval()))
+        while True:
+            try:
+                data = device.tick(self.ip)
+                if data is not None:
+                    self.send(data, (device.gateway_ip, device.gateway_sensor_port))
+            except Exception as e:
+                print(f"[Host] Error in periodic task of {device.device_type}:{device.TCP_PORT}: {e}")
+            await asyncio.sleep(device.update_interval())
+
+    async def keep_alive(self):
+        """Heartbeat dos atuadores no barramento, como o keep_alive de cada script"""
+        actuators = [device for device in self.devices if hasattr(device, "publish_state")]
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            for device in actuators:
+                device.publish_state()
+
+    async def simulate_building(self):
+        """Avança todas as salas do prédio numa única atualização por SIMULATION_TICK"""
+        acs = [device for device in self.devices if device.device_type == "air_conditioner"]
+        lamps = [device for device in self.devices if device.device_type == "smart_lamp"]
+        while True:
+            self.building.set_acs([ac.state for ac in acs])
+            self.building.set_lamps([lamp.power_draw() for lamp in lamps])
+            self.building.step()
+            await asyncio.sleep(SIMULATION_TICK)
+
+    def summary(self):
+        counts = {}
+        for device in self.devices:
+            counts[device.device_type] = counts.get(device.device_type, 0) + 1
+        return ", ".join(f"{count} {device_type}" for device_type, count in counts.items())
+
+
+async def run(args, counts):
+    host = DeviceHost(counts, ip=args.ip, bind=args.bind,
+                      rooms=args.rooms, rooms_per_floor=args.rooms_per_floor)
+    await host.start()
+    print(f"Device host running {len(host.devices)} devices ({host.summary()}) on {host.ip}")
+    if host.building is not None:
+        print(f"Simulating a building with {host.building.rooms} rooms")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Roda muitos devices simulados num único processo")
+    for device_type in DEVICE_CLASSES:
+        parser.add_argument(f"--{device_type.replace('_', '-')}", type=int, default=0,
+                            metavar="N", help=f"Quantidade de {device_type}")
+    parser.add_argument("--ip", default=None,
+                        help="IP anunciado pelos devices (padrão: IP local)")
+    parser.add_argument("--bind", default="0.0.0.0",
+                        help="Endereço de escuta das portas TCP dos devices")
+    parser.add_argument("--rooms", type=int, default=0,
+                        help="Simula um prédio com N salas; 0 = cada sensor de temperatura simula a sua sala")
+    parser.add_argument("--rooms-per-floor", type=int, default=None,
+                        help="Salas por andar do prédio (padrão: todas no mesmo andar)")
+    args = parser.parse_args()
+
+    counts = {device_type: getattr(args, device_type) for device_type in DEVICE_CLASSES}
+    if not any(counts.values()):
+        parser.error("informe a quantidade de pelo menos um tipo de device")
+
+    raise_fd_limit()
+    try:
+        asyncio.run(run(args, counts))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
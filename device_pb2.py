@@ -13,35 +13,73 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0c\x64\x65vice.proto\"P\n\x0f\x44\x65viceDiscovery\x12\x13\n\x0b\x64\x65vice_type\x18\x01 \x01(\t\x12\n\n\x02ip\x18\x02 \x01(\t\x12\x0c\n\x04port\x18\x03 \x01(\x05\x12\x0e\n\x06status\x18\x04 \x01(\t\"W\n\rClientRequest\x12\x0f\n\x07\x63ommand\x18\x01 \x01(\t\x12\x11\n\tdevice_id\x18\x02 \x01(\t\x12\x0e\n\x06\x61\x63tion\x18\x03 \x01(\t\x12\x12\n\nparameters\x18\x04 \x01(\t\"P\n\x0e\x43lientResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x1c\n\x07\x64\x65vices\x18\x03 \x03(\x0b\x32\x0b.DeviceInfo\"\xc2\x01\n\nDeviceInfo\x12\x11\n\tdevice_id\x18\x01 \x01(\t\x12\x13\n\x0b\x64\x65vice_type\x18\x02 \x01(\t\x12\n\n\x02ip\x18\x03 \x01(\t\x12\x0c\n\x04port\x18\x04 \x01(\x05\x12\x0e\n\x06status\x18\x05 \x01(\t\x12/\n\nattributes\x18\x06 \x03(\x0b\x32\x1b.DeviceInfo.AttributesEntry\x1a\x31\n\x0f\x41ttributesEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"4\n\rDeviceCommand\x12\x0f\n\x07\x63ommand\x18\x01 \x01(\t\x12\x12\n\nparameters\x18\x02 \x01(\t\"\xaa\x01\n\x0e\x44\x65viceResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x0e\n\x06status\x18\x03 \x01(\t\x12\x33\n\nattributes\x18\x04 \x03(\x0b\x32\x1f.DeviceResponse.AttributesEntry\x1a\x31\n\x0f\x41ttributesEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"d\n\nSensorData\x12\x11\n\tdevice_id\x18\x01 \x01(\t\x12\x13\n\x0bsensor_type\x18\x02 \x01(\t\x12\r\n\x05value\x18\x03 \x01(\x01\x12\x0c\n\x04unit\x18\x04 \x01(\t\x12\x11\n\ttimestamp\x18\x05 \x01(\x03\"\\\n\x0b\x44\x65viceState\x12\x11\n\tdevice_id\x18\x01 \x01(\t\x12\x13\n\x0b\x64\x65vice_type\x18\x02 \x01(\t\x12\x12\n\nstate_json\x18\x03 \x01(\t\x12\x11\n\ttimestamp\x18\x04 \x01(\x03\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0c\x64\x65vice.proto\"\x8c\x01\n\x0f\x44\x65viceDiscovery\x12\x13\n\x0b\x64\x65vice_type\x18\x01 \x01(\t\x12\n\n\x02ip\x18\x02 \x01(\t\x12\x0c\n\x04port\x18\x03 \x01(\x05\x12\x0e\n\x06status\x18\x04 \x01(\t\x12\x18\n\x10protocol_version\x18\x05 \x01(\r\x12 \n\x05state\x18\x06 \x01(\x0b\x32\x11.TypedDeviceState\"{\n\x13\x41irConditionerState\x12\x1a\n\x05power\x18\x01 \x01(\x0e\x32\x0b.PowerState\x12\x13\n\x0btemperature\x18\x02 \x01(\x05\x12\x15\n\x04mode\x18\x03 \x01(\x0e\x32\x07.AcMode\x12\x1c\n\tfan_speed\x18\x04 \x01(\x0e\x32\t.FanSpeed\";\n\tLampState\x12\x1a\n\x05power\x18\x01 \x01(\x0e\x32\x0b.PowerState\x12\x12\n\nbrightness\x18\x02 \x01(\x05\"j\n\x0bSensorState\x12\r\n\x05value\x18\x01 \x01(\x01\x12\x0c\n\x04unit\x18\x02 \x01(\t\x12\x17\n\x0fupdate_interval\x18\x03 \x01(\x05\x12\x10\n\x08\x64\x65\x61\x64\x62\x61nd\x18\x04 \x01(\x01\x12\x13\n\x0bmax_silence\x18\x05 \x01(\x05\"\x88\x01\n\x10TypedDeviceState\x12/\n\x0f\x61ir_conditioner\x18\x01 \x01(\x0b\x32\x14.AirConditionerStateH\x00\x12\x1a\n\x04lamp\x18\x02 \x01(\x0b\x32\n.LampStateH\x00\x12\x1e\n\x06sensor\x18\x03 \x01(\x0b\x32\x0c.SensorStateH\x00\x42\x07\n\x05state\"\x88\x02\n\rCommandParams\x12\x18\n\x0btemperature\x18\x01 \x01(\x05H\x00\x88\x01\x01\x12\x17\n\nbrightness\x18\x02 \x01(\x05H\x01\x88\x01\x01\x12\x15\n\x04mode\x18\x03 \x01(\x0e\x32\x07.AcMode\x12\x1c\n\tfan_speed\x18\x04 \x01(\x0e\x32\t.FanSpeed\x12\x15\n\x08interval\x18\x05 \x01(\x05H\x02\x88\x01\x01\x12\x15\n\x08\x64\x65\x61\x64\x62\x61nd\x18\x06 \x01(\x01H\x03\x88\x01\x01\x12\x18\n\x0bmax_silence\x18\x07 \x01(\x05H\x04\x88\x01\x01\x42\x0e\n\x0c_temperatureB\r\n\x0b_brightnessB\x0b\n\t_intervalB\x0b\n\t_deadbandB\x0e\n\x0c_max_silence\"F\n\x04Span\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x0f\n\x07process\x18\x02 \x01(\t\x12\r\n\x05start\x18\x03 \x01(\x01\x12\x10\n\x08\x64uration\x18\x04 \x01(\x01\"t\n\x05Trace\x12\x10\n\x08trace_id\x18\x01 \x01(\x04\x12\x0f\n\x07\x63ommand\x18\x02 \x01(\t\x12\x11\n\tdevice_id\x18\x03 \x01(\t\x12\r\n\x05start\x18\x04 \x01(\x01\x12\x10\n\x08\x64uration\x18\x05 \x01(\x01\x12\x14\n\x05spans\x18\x06 \x03(\x0b\x32\x05.Span\"\x9e\x02\n\rClientRequest\x12\x0f\n\x07\x63ommand\x18\x01 \x01(\t\x12\x11\n\tdevice_id\x18\x02 \x01(\t\x12\x0e\n\x06\x61\x63tion\x18\x03 \x01(\t\x12\x12\n\nparameters\x18\x04 \x01(\t\x12\x12\n\nrequest_id\x18\x05 \x01(\x04\x12\x1e\n\x07\x61\x63tions\x18\x06 \x03(\x0b\x32\r.DeviceAction\x12\x12\n\ntimeout_ms\x18\x07 \x01(\r\x12\x15\n\rsince_version\x18\x08 \x01(\x04\x12\x13\n\x0bshard_local\x18\t \x01(\x08\x12\x1a\n\x06shards\x18\n \x03(\x0b\x32\n.ShardInfo\x12#\n\x10\x61\x63\x63\x65pt_encodings\x18\x0b \x03(\x0e\x32\t.Encoding\x12\x10\n\x08trace_id\x18\x0c \x01(\x04\"g\n\tShardInfo\x12\x10\n\x08shard_id\x18\x01 \x01(\t\x12\n\n\x02ip\x18\x02 \x01(\t\x12\x10\n\x08tcp_port\x18\x03 \x01(\x05\x12\x15\n\rannounce_port\x18\x04 \x01(\x05\x12\x13\n\x0bsensor_port\x18\x05 \x01(\x05\"E\n\x0c\x44\x65viceAction\x12\x11\n\tdevice_id\x18\x01 \x01(\t\x12\x0e\n\x06\x61\x63tion\x18\x02 \x01(\t\x12\x12\n\nparameters\x18\x03 \x01(\t\"C\n\x0c\x41\x63tionResult\x12\x11\n\tdevice_id\x18\x01 \x01(\t\x12\x0f\n\x07success\x18\x02 \x01(\x08\x12\x0f\n\x07message\x18\x03 \x01(\t\"\xcd\x03\n\x0e\x43lientResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x1c\n\x07\x64\x65vices\x18\x03 \x03(\x0b\x32\x0b.DeviceInfo\x12\x12\n\nrequest_id\x18\x04 \x01(\x04\x12\x1e\n\x07results\x18\x05 \x03(\x0b\x32\r.ActionResult\x12\x0f\n\x07version\x18\x06 \x01(\x04\x12\x1a\n\x12removed_device_ids\x18\x07 \x03(\t\x12\x11\n\tfull_sync\x18\x08 \x01(\x08\x12\x1e\n\x07history\x18\t \x03(\x0b\x32\r.HistoryPoint\x12)\n\x05stats\x18\n \x03(\x0b\x32\x1a.ClientResponse.StatsEntry\x12\x1a\n\x06shards\x18\x0b \x03(\x0b\x32\n.ShardInfo\x12\x0e\n\x06status\x18\x0c \x01(\t\x12\x1b\n\x08\x65ncoding\x18\r \x01(\x0e\x32\t.Encoding\x12\x17\n\x0f\x63ompressed_body\x18\x0e \x01(\x0c\x12\x14\n\x05spans\x18\x0f \x03(\x0b\x32\x05.Span\x12\x16\n\x06traces\x18\x10 \x03(\x0b\x32\x06.Trace\x1a,\n\nStatsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x01:\x02\x38\x01\"Y\n\x0cHistoryPoint\x12\x11\n\ttimestamp\x18\x01 \x01(\x01\x12\r\n\x05value\x18\x02 \x01(\x01\x12\x0b\n\x03min\x18\x03 \x01(\x01\x12\x0b\n\x03max\x18\x04 \x01(\x01\x12\r\n\x05\x63ount\x18\x05 \x01(\r\"\xe4\x01\n\nDeviceInfo\x12\x11\n\tdevice_id\x18\x01 \x01(\t\x12\x13\n\x0b\x64\x65vice_type\x18\x02 \x01(\t\x12\n\n\x02ip\x18\x03 \x01(\t\x12\x0c\n\x04port\x18\x04 \x01(\x05\x12\x0e\n\x06status\x18\x05 \x01(\t\x12/\n\nattributes\x18\x06 \x03(\x0b\x32\x1b.DeviceInfo.AttributesEntry\x12 \n\x05state\x18\x07 \x01(\x0b\x32\x11.TypedDeviceState\x1a\x31\n\x0f\x41ttributesEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"\x80\x01\n\rDeviceCommand\x12\x0f\n\x07\x63ommand\x18\x01 \x01(\t\x12\x12\n\nparameters\x18\x02 \x01(\t\x12\x18\n\x10protocol_version\x18\x03 \x01(\r\x12\x1e\n\x06params\x18\x04 \x01(\x0b\x32\x0e.CommandParams\x12\x10\n\x08trace_id\x18\x05 \x01(\x04\"\xe2\x01\n\x0e\x44\x65viceResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x0e\n\x06status\x18\x03 \x01(\t\x12\x33\n\nattributes\x18\x04 \x03(\x0b\x32\x1f.DeviceResponse.AttributesEntry\x12 \n\x05state\x18\x05 \x01(\x0b\x32\x11.TypedDeviceState\x12\x14\n\x05spans\x18\x06 \x03(\x0b\x32\x05.Span\x1a\x31\n\x0f\x41ttributesEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"\x86\x01\n\nSensorData\x12\x11\n\tdevice_id\x18\x01 \x01(\t\x12\x13\n\x0bsensor_type\x18\x02 \x01(\t\x12\r\n\x05value\x18\x03 \x01(\x01\x12\x0c\n\x04unit\x18\x04 \x01(\t\x12\x11\n\ttimestamp\x18\x05 \x01(\x03\x12 \n\x05state\x18\x06 \x01(\x0b\x32\x11.TypedDeviceState\"\\\n\x0b\x44\x65viceState\x12\x11\n\tdevice_id\x18\x01 \x01(\t\x12\x13\n\x0b\x64\x65vice_type\x18\x02 \x01(\t\x12\x12\n\nstate_json\x18\x03 \x01(\t\x12\x11\n\ttimestamp\x18\x04 \x01(\x03\"j\n\rActuatorState\x12\x11\n\tdevice_id\x18\x01 \x01(\t\x12\x13\n\x0b\x64\x65vice_type\x18\x02 \x01(\t\x12 \n\x05state\x18\x03 \x01(\x0b\x32\x11.TypedDeviceState\x12\x0f\n\x07version\x18\x04 \x01(\x04\".\n\x0c\x41\x63tuatorFeed\x12\x1e\n\x06states\x18\x01 \x03(\x0b\x32\x0e.ActuatorState*<\n\nPowerState\x12\x11\n\rPOWER_UNKNOWN\x10\x00\x12\r\n\tPOWER_OFF\x10\x01\x12\x0c\n\x08POWER_ON\x10\x02*R\n\x06\x41\x63Mode\x12\x13\n\x0f\x41\x43_MODE_UNKNOWN\x10\x00\x12\x10\n\x0c\x41\x43_MODE_COOL\x10\x01\x12\x10\n\x0c\x41\x43_MODE_HEAT\x10\x02\x12\x0f\n\x0b\x41\x43_MODE_FAN\x10\x03*r\n\x08\x46\x61nSpeed\x12\x15\n\x11\x46\x41N_SPEED_UNKNOWN\x10\x00\x12\x11\n\rFAN_SPEED_LOW\x10\x01\x12\x14\n\x10\x46\x41N_SPEED_MEDIUM\x10\x02\x12\x12\n\x0e\x46\x41N_SPEED_HIGH\x10\x03\x12\x12\n\x0e\x46\x41N_SPEED_AUTO\x10\x04*H\n\x08\x45ncoding\x12\x11\n\rENCODING_NONE\x10\x00\x12\x11\n\rENCODING_ZLIB\x10\x01\x12\x16\n\x12\x45NCODING_ZLIB_DICT\x10\x02\x62\x06proto3')
 
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, globals())
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'device_pb2', globals())
 if _descriptor._USE_C_DESCRIPTORS == False:
 
   DESCRIPTOR._options = None
+  _CLIENTRESPONSE_STATSENTRY._options = None
+  _CLIENTRESPONSE_STATSENTRY._serialized_options = b'8\001'
   _DEVICEINFO_ATTRIBUTESENTRY._options = None
   _DEVICEINFO_ATTRIBUTESENTRY._serialized_options = b'8\001'
   _DEVICERESPONSE_ATTRIBUTESENTRY._options = None
   _DEVICERESPONSE_ATTRIBUTESENTRY._serialized_options = b'8\001'
-  _DEVICEDISCOVERY._serialized_start=16
-  _DEVICEDISCOVERY._serialized_end=96
-  _CLIENTREQUEST._serialized_start=98
-  _CLIENTREQUEST._serialized_end=185
-  _CLIENTRESPONSE._serialized_start=187
-  _CLIENTRESPONSE._serialized_end=267
-  _DEVICEINFO._serialized_start=270
-  _DEVICEINFO._serialized_end=464
-  _DEVICEINFO_ATTRIBUTESENTRY._serialized_start=415
-  _DEVICEINFO_ATTRIBUTESENTRY._serialized_end=464
-  _DEVICECOMMAND._serialized_start=466
-  _DEVICECOMMAND._serialized_end=518
-  _DEVICERESPONSE._serialized_start=521
-  _DEVICERESPONSE._serialized_end=691
-  _DEVICERESPONSE_ATTRIBUTESENTRY._serialized_start=415
-  _DEVICERESPONSE_ATTRIBUTESENTRY._serialized_end=464
-  _SENSORDATA._serialized_start=693
-  _SENSORDATA._serialized_end=793
-  _DEVICESTATE._serialized_start=795
-  _DEVICESTATE._serialized_end=887
+  _POWERSTATE._serialized_start=3116
+  _POWERSTATE._serialized_end=3176
+  _ACMODE._serialized_start=3178
+  _ACMODE._serialized_end=3260
+  _FANSPEED._serialized_start=3262
+  _FANSPEED._serialized_end=3376
+  _ENCODING._serialized_start=3378
+  _ENCODING._serialized_end=3450
+  _DEVICEDISCOVERY._serialized_start=17
+  _DEVICEDISCOVERY._serialized_end=157
+  _AIRCONDITIONERSTATE._serialized_start=159
+  _AIRCONDITIONERSTATE._serialized_end=282
+  _LAMPSTATE._serialized_start=284
+  _LAMPSTATE._serialized_end=343
+  _SENSORSTATE._serialized_start=345
+  _SENSORSTATE._serialized_end=451
+  _TYPEDDEVICESTATE._serialized_start=454
+  _TYPEDDEVICESTATE._serialized_end=590
+  _COMMANDPARAMS._serialized_start=593
+  _COMMANDPARAMS._serialized_end=857
+  _SPAN._serialized_start=859
+  _SPAN._serialized_end=929
+  _TRACE._serialized_start=931
+  _TRACE._serialized_end=1047
+  _CLIENTREQUEST._serialized_start=1050
+  _CLIENTREQUEST._serialized_end=1336
+  _SHARDINFO._serialized_start=1338
+  _SHARDINFO._serialized_end=1441
+  _DEVICEACTION._serialized_start=1443
+  _DEVICEACTION._serialized_end=1512
+  _ACTIONRESULT._serialized_start=1514
+  _ACTIONRESULT._serialized_end=1581
+  _CLIENTRESPONSE._serialized_start=1584
+  _CLIENTRESPONSE._serialized_end=2045
+  _CLIENTRESPONSE_STATSENTRY._serialized_start=2001
+  _CLIENTRESPONSE_STATSENTRY._serialized_end=2045
+  _HISTORYPOINT._serialized_start=2047
+  _HISTORYPOINT._serialized_end=2136
+  _DEVICEINFO._serialized_start=2139
+  _DEVICEINFO._serialized_end=2367
+  _DEVICEINFO_ATTRIBUTESENTRY._serialized_start=2318
+  _DEVICEINFO_ATTRIBUTESENTRY._serialized_end=2367
+  _DEVICECOMMAND._serialized_start=2370
+  _DEVICECOMMAND._serialized_end=2498
+  _DEVICERESPONSE._serialized_start=2501
+  _DEVICERESPONSE._serialized_end=2727
+  _DEVICERESPONSE_ATTRIBUTESENTRY._serialized_start=2318
+  _DEVICERESPONSE_ATTRIBUTESENTRY._serialized_end=2367
+  _SENSORDATA._serialized_start=2730
+  _SENSORDATA._serialized_end=2864
+  _DEVICESTATE._serialized_start=2866
+  _DEVICESTATE._serialized_end=2958
+  _ACTUATORSTATE._serialized_start=2960
+  _ACTUATORSTATE._serialized_end=3066
+  _ACTUATORFEED._serialized_start=3068
+  _ACTUATORFEED._serialized_end=3114
 # @@protoc_insertion_point(module_scope)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+import heapq
+import threading
+import time
+from collections import OrderedDict
+
+
+class DeviceRegistry:
+    """
+    Registro de dispositivos do gateway com versionamento.
+
+    Toda mutação visível em um DeviceInfo recebe uma nova versão global
+    (monotonicamente crescente), guardada em device['version']. Remoções
+    deixam um tombstone com a versão em que ocorreram, permitindo que um
+    cliente peça apenas o que mudou desde a última sincronização.
+
+    Cada entrada tem uma lease (device['expires_at']) renovada por touch()
+    a cada anúncio ou SensorData; expire() remove as vencidas. As expirações
+    ficam num heap com no máximo uma entrada por device, então o custo é
+    O(log n) por device vencido ou renovado.
+    """
+    def __init__(self, max_tombstones=1024, lease_duration=45.0):
+        self.devices = {}  # device_id -> device_info
+        self.version = 0
+        self.lock = threading.RLock()
+
+        self.tombstones = OrderedDict()  # device_id -> versão da remoção
+        self.max_tombstones = max_tombstones
+        # Versão do tombstone mais recente já descartado; quem sincronizou
+        # antes disso pode ter perdido remoções e precisa de lista completa
+        self.tombstone_floor = 0
+
+        # Callbacks chamados com o device_id após cada mudança de versão
+        self.listeners = []
+
+        self.lease_duration = lease_duration
+        self.expiry_heap = []    # (expires_at, device_id)
+        self.in_heap = set()     # device_ids com entrada no heap
+
+    def __contains__(self, device_id):
+        return device_id in self.devices
+
+    def __getitem__(self, device_id):
+        return self.devices[device_id]
+
+    def __len__(self):
+        return len(self.devices)
+
+    def get(self, device_id, default=None):
+        return self.devices.get(device_id, default)
+
+    def values(self):
+        with self.lock:
+            return list(self.devices.values())
+
+    def _next_version(self):
+        self.version += 1
+        return self.version
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def _notify(self, device_id):
+        for callback in self.listeners:
+            callback(device_id)
+
+    def put(self, device_info):
+        """Insere ou substitui um dispositivo inteiro"""
+        with self.lock:
+            device_info['version'] = self._next_version()
+            device_info.setdefault('expires_at', time.time() + self.lease_duration)
+            self.devices[device_info['id']] = device_info
+            self.tombstones.pop(device_info['id'], None)
+            if device_info['id'] not in self.in_heap:
+                heapq.heappush(self.expiry_heap, (device_info['expires_at'], device_info['id']))
+                self.in_heap.add(device_info['id'])
+        self._notify(device_info['id'])
+        return device_info
+
+    def update(self, device_id, defaults=None, **changes):
+        """
+        Aplica changes ao dispositivo (criando-o a partir de defaults se
+        não existir). A versão só avança se algum campo mudou de fato.
+        Retorna o device_info, ou None se não existe e não há defaults.
+        """
+        with self.lock:
+            device = self.devices.get(device_id)
+            if device is None:
+                if defaults is None:
+                    return None
+                device = dict(defaults)
+                device.update(changes)
+                return self.put(device)
+
+            changed = False
+            for key, value in changes.items():
+                if device.get(key) != value:
+                    device[key] = value
+                    changed = True
+            if changed:
+                device['version'] = self._next_version()
+        if changed:
+            self._notify(device_id)
+        return device
+
+    def touch(self, device_id, last_seen):
+        """
+        Atualiza last_seen e renova a lease; nenhum dos dois faz parte do
+        DeviceInfo, então não gera nova versão. O heap não é mexido aqui:
+        a entrada antiga é reposicionada quando vencer em expire().
+        """
+        device = self.devices.get(device_id)
+        if device is not None:
+            device['last_seen'] = last_seen
+            device['expires_at'] = last_seen + self.lease_duration
+
+    def expire(self, now=None):
+        """Remove os devices com lease vencida e retorna seus ids"""
+        now = time.time() if now is None else now
+        expired = []
+        with self.lock:
+            while self.expiry_heap and self.expiry_heap[0][0] <= now:
+                _, device_id = heapq.heappop(self.expiry_heap)
+                device = self.devices.get(device_id)
+                if device is None:
+                    self.in_heap.discard(device_id)
+                elif device['expires_at'] > now:
+                    # Lease renovada depois de entrar no heap
+                    heapq.heappush(self.expiry_heap, (device['expires_at'], device_id))
+                else:
+                    self.in_heap.discard(device_id)
+                    expired.append(device_id)
+            for device_id in expired:
+                self.remove(device_id)
+        return expired
+
+    def remove(self, device_id):
+        with self.lock:
+            device = self.devices.pop(device_id, None)
+            if device is None:
+                return None
+            self.tombstones[device_id] = self._next_version()
+            while len(self.tombstones) > self.max_tombstones:
+                _, dropped_version = self.tombstones.popitem(last=False)
+                self.tombstone_floor = dropped_version
+        self._notify(device_id)
+        return device
+
+    def clear(self):
+        with self.lock:
+            for device_id in list(self.devices.keys()):
+                self.remove(device_id)
+
+    def changes_since(self, since_version):
+        """
+        Retorna (versão atual, dispositivos alterados, ids removidos, full_sync).
+        Com since_version == 0, ou anterior ao último tombstone descartado,
+        devolve a lista completa e full_sync=True.
+        """
+        with self.lock:
+            if since_version <= 0 or since_version < self.tombstone_floor or since_version > self.version:
+                return self.version, list(self.devices.values()), [], True
+
+            changed = [device for device in self.devices.values() if device['version'] > since_version]
+            removed = [device_id for device_id, version in self.tombstones.items() if version > since_version]
+            return self.version, changed, removed, False
@@ -1,17 +1,175 @@
 #!/usr/bin/env python3
+import argparse
+import asyncio
 import socket
 import threading
 import time
 import json
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
 import device_pb2
+from connection_pool import DeviceConnectionPool
+from transport import FrameReader, recv_frame, send_frame
+from device_registry import DeviceRegistry
+from state_feed import FEED_PORT, StateFeedPublisher
+from subscriptions import SubscriptionManager
+from sensor_history import SensorHistory, downsample
+from sensor_log import SensorLog
+from sensor_ingest import SensorIngestor, enable_drop_tracking, receive_datagram
+from sharding import Shard, ShardMembership
+from status_cache import StatusCache
+from command_queue import DeviceCommandQueues
+from protocol import PROTOCOL_VERSION, encode_params, state_json
+from compression import COMPRESS_THRESHOLD, choose_encoding, compress_response
+from metrics import Metrics, start_metrics_server
+from tracing import Trace, TraceBuffer, activate, add_remote, current_trace_id, span
+from google.protobuf.message import DecodeError
+
+# Número do campo `devices` em ClientResponse
+DEVICES_FIELD_NUMBER = 3
+
+
+def encode_length_delimited(field_number, payload):
+    """Codifica payload como um campo length-delimited (wire type 2) de protobuf"""
+    out = bytearray()
+    value = (field_number << 3) | 2
+    for value in (value, len(payload)):
+        while value > 0x7f:
+            out.append((value & 0x7f) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out) + payload
+
+
+def error_response(request, error):
+    """ClientResponse serializado de falha para uma requisição que levantou exceção"""
+    response = device_pb2.ClientResponse()
+    response.success = False
+    response.message = f"Error: {error}"
+    response.request_id = request.request_id
+    return response.SerializeToString()
+
+
+class ClientSession:
+    """
+    Conexão de um cliente com o gateway; send() recebe um ClientResponse
+    serializado e pode ser chamado de qualquer thread
+    """
+    def __init__(self, send):
+        self.send = send
+        # Compressão das respostas, negociada pelo accept_encodings do cliente
+        self.encoding = device_pb2.ENCODING_NONE
+
+    def negotiate(self, request):
+        if request.accept_encodings:
+            self.encoding = choose_encoding(request.accept_encodings)
+
 
 class Gateway:
-    def __init__(self):
+    # Prazo padrão de um BATCH_CONTROL sem timeout_ms
+    BATCH_TIMEOUT_MS = 5000
+    # Intervalo mínimo padrão entre pushes de uma assinatura
+    SUBSCRIBE_INTERVAL_MS = 500
+    # Um device some do registro se ficar LEASE_DURATION segundos sem anúncio
+    # nem SensorData (3 rodadas de descoberta)
+    LEASE_DURATION = 45
+    LEASE_CHECK_INTERVAL = 1
+    # Pontos guardados em memória por série de sensor (~2h a cada 2s)
+    HISTORY_CAPACITY = 4096
+    # Comandos sobre um único device, repassados ao shard dono
+    DEVICE_COMMANDS = {"CONTROL_DEVICE", "GET_STATUS", "SET_STATUS", "GET_HISTORY"}
+    # Comandos esperando por device antes de o gateway responder "busy"
+    COMMAND_QUEUE_SIZE = 16
+    # Espera máxima de um comando de cliente por device (fila + execução);
+    # cada leitura do device em si expira no read_timeout do pool
+    DEVICE_CALL_TIMEOUT = 10.0
+    # Valores possíveis dos labels das métricas (o resto vira "other", para
+    # um cliente ou device não criar séries sem limite)
+    CLIENT_COMMANDS = {"LIST_DEVICES", "GET_HISTORY", "GATEWAY_STATS", "GET_TRACES", "SHARD_HELLO", "SUBSCRIBE",
+                       "UNSUBSCRIBE", "CONTROL_DEVICE", "BATCH_CONTROL", "GET_STATUS", "SET_STATUS"}
+    # Requisições rastreadas (com trace_id) guardadas para GET_TRACES; as de
+    # monitoramento não entram, para não empurrar as outras para fora
+    TRACE_CAPACITY = 1024
+    UNTRACED_COMMANDS = {"GATEWAY_STATS", "GET_TRACES", "SHARD_HELLO"}
+    SENSOR_TYPES = {"temperature", "brightness", "power", "ac_state", "lamp_state"}
+
+    def __init__(self, sensor_log_dir="files/sensor_log", sensor_workers=0, verbose=False,
+                 tcp_port=6000, announce_port=50001, sensor_port=50002,
+                 shard_id=None, advertise_ip=None, peers=(), status_ttl=1.0, status_stale_ttl=10.0,
+                 compress_threshold=COMPRESS_THRESHOLD, metrics_port=0, state_feed_port=FEED_PORT):
         self.MCAST_GRP = '224.0.0.1'
         self.MCAST_PORT = 50000
-        self.TCP_PORT = 6000
+        self.TCP_PORT = tcp_port
+        self.ANNOUNCE_PORT = announce_port
+        self.SENSOR_PORT = sensor_port
+
+        # Com sensor_workers > 0, SensorData é recebido por essa quantidade de
+        # threads (SO_REUSEPORT); com 0, por um único socket como antes
+        self.sensor_workers = sensor_workers
+        # Log de cada SensorData recebido (caro com muitos sensores)
+        self.verbose = verbose
+        # Respostas a partir desse tamanho são comprimidas, se o cliente aceitar
+        self.compress_threshold = compress_threshold
+
+        # Contadores e histogramas de GATEWAY_STATS e de metrics_port (0 desativa)
+        self.metrics = Metrics()
+        self.metrics.counter("sensor_packets_total", "SensorData recebidos, por sensor_type")
+        self.metrics.counter("sensor_parse_errors_total", "SensorData que não puderam ser decodificados")
+        self.metrics.counter("device_errors_total", "Comandos que falharam na comunicação com o device")
+        self.metrics.gauge("client_sessions", "Conexões de clientes abertas")
+        self.metrics.histogram("client_request_seconds", "Tempo para atender uma ClientRequest, por comando")
+        self.metrics.histogram("device_rtt_seconds", "Ida e volta de um DeviceCommand até o device")
+        self.metrics.add_collector(self.collect_stats)
+        self.metrics_port = metrics_port
+
+        # Últimas requisições com trace_id e o tempo gasto em cada trecho
+        self.traces = TraceBuffer(self.TRACE_CAPACITY)
+        self.trace_process = f"gateway:{shard_id}" if shard_id else "gateway"
         
-        self.devices = {}  # device_id -> device_info
+        self.devices = DeviceRegistry(lease_duration=self.LEASE_DURATION)  # device_id -> device_info, com versões e leases
+
+        # Últimas HISTORY_CAPACITY leituras de cada sensor, para GET_HISTORY;
+        # a série sai da memória junto com o device (ver on_registry_change)
+        self.history = SensorHistory(self.HISTORY_CAPACITY)
+        self.devices.add_listener(self.on_registry_change)
+
+        # Log durável em disco de todo SensorData (None desativa)
+        self.sensor_log = SensorLog(sensor_log_dir) if sensor_log_dir else None
+
+        # Assinaturas SUBSCRIBE recebem pushes a cada mudança no registro
+        self.subscriptions = SubscriptionManager(self.devices, self.encode_device_info)
+
+        # Estado de lâmpadas e ACs republicado em multicast para os sensores
+        # de qualquer host (state_feed_port=0 desativa)
+        self.state_feed = StateFeedPublisher(self.devices, state_feed_port) if state_feed_port else None
+
+        # Conexões keep-alive reaproveitadas entre comandos para o mesmo device
+        self.connection_pool = DeviceConnectionPool()
+
+        # Requisições com request_id de todas as sessões rodam neste pool
+        self.request_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="gateway-request")
+
+        # Pool separado para repasses entre shards e releituras do cache de
+        # status, disparados a partir de threads do request_executor
+        self.device_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="gateway-device")
+
+        # Cada device recebe um comando por vez, em ordem de chegada; os
+        # despachantes das filas rodam neste pool
+        self.command_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="gateway-dispatch")
+        self.command_queues = DeviceCommandQueues(self.execute_device_command, self.command_executor,
+                                                  max_pending=self.COMMAND_QUEUE_SIZE)
+
+        # GET_STATUS de vários clientes para o mesmo device vira uma única
+        # chamada, e o resultado é reaproveitado por status_ttl segundos
+        # (só para devices do registro; a entrada sai junto com o device)
+        self.status_cache = StatusCache(self.fetch_device_status, self.device_executor,
+                                        ttl=status_ttl, stale_ttl=status_stale_ttl, registry=self.devices)
+
+        # Com shard_id, este gateway é um shard: só é dono dos device_ids que
+        # caem nele no anel de hashing consistente e repassa o resto
+        self.membership = None
+        if shard_id:
+            local = Shard(shard_id, advertise_ip or self.get_local_ip(), tcp_port, announce_port, sensor_port)
+            self.membership = ShardMembership(local, seeds=peers, on_change=self.on_ring_change)
 
         self.init_tcp_server()
         self.init_udp_receiver()
@@ -25,190 +183,728 @@ class Gateway:
 
     def init_udp_receiver(self):
         self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.udp_socket.bind(('0.0.0.0', 50001))
+        self.udp_socket.bind(('0.0.0.0', self.ANNOUNCE_PORT))
 
     def init_sensor_receiver(self):
+        if self.sensor_workers:
+            self.sensor_ingestor = SensorIngestor(self.handle_sensor_packet, port=self.SENSOR_PORT,
+                                                  workers=self.sensor_workers)
+            self.sensor_socket = None
+            return
+        self.sensor_ingestor = None
         self.sensor_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sensor_socket.bind(('0.0.0.0', 50002))
+        # Descartes do kernel neste socket (SO_RXQ_OVFL), como nos workers
+        self.sensor_track_drops = enable_drop_tracking(self.sensor_socket)
+        self.sensor_udp_drops = 0
+        self.sensor_socket.bind(('0.0.0.0', self.SENSOR_PORT))
+
+    def get_local_ip(self):
+        """IP pelo qual os devices alcançam este gateway"""
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            s.connect(("8.8.8.8", 80))
+            ip = s.getsockname()[0]
+        except Exception:
+            ip = "127.0.0.1"
+        finally:
+            s.close()
+        return ip
 
     def send_discovery_message(self):
-        self.devices.clear()
+        # Não limpa mais o registro: cada device tem uma lease renovada por
+        # anúncios e SensorData, e expire_leases() remove os que sumiram
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
         sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
         discovery_msg = device_pb2.DeviceCommand()
         discovery_msg.command = "GATEWAY_DISCOVERY"
+        discovery_msg.protocol_version = PROTOCOL_VERSION
+        if self.membership is not None:
+            # Cada device calcula o seu shard dono a partir desta lista
+            discovery_msg.parameters = json.dumps(
+                {"shards": [shard.to_dict() for shard in self.membership.shards()]})
         data = discovery_msg.SerializeToString()
         sock.sendto(data, (self.MCAST_GRP, self.MCAST_PORT))
         sock.close()
 
-    def listen_for_device_announcements(self):
-        while True:
-            data, addr = self.udp_socket.recvfrom(1024)
-            discovery_msg = device_pb2.DeviceDiscovery()
-            discovery_msg.ParseFromString(data)
-
-            device_id = f"{discovery_msg.device_type}_{discovery_msg.ip}_{discovery_msg.port}"
-            device_info = {
-                'id': device_id,
-                'type': discovery_msg.device_type,
-                'ip': discovery_msg.ip,
-                'port': discovery_msg.port,
-                # Armazena o status fornecido (já deve ser JSON)
-                'status': discovery_msg.status if discovery_msg.status else "{}",
-                'last_seen': time.time()
-            }
-
-            self.devices[device_id] = device_info
-            print(f"[Gateway] Device discovered/updated: {device_id}")
+        self.connection_pool.prune()
+        if self.sensor_log is not None:
+            self.sensor_log.enforce_retention()
+
+    def on_ring_change(self, ring):
+        """
+        Rebalanceamento: esquece os devices que passaram a ser de outro
+        shard e anuncia o novo anel, para que eles se reanunciem ao dono
+        """
+        print(f"[Gateway] Shard ring changed: {len(ring)} shard(s)")
+        for device_info in self.devices.values():
+            if ring.owner(device_info['id']) is not self.membership.local:
+                self.devices.remove(device_info['id'])
+        self.send_discovery_message()
 
-    def listen_for_sensor_data(self):
-        while True:
-            data, addr = self.sensor_socket.recvfrom(2048)
-            sensor_data = device_pb2.SensorData()
+    def expire_leases(self):
+        for device_id in self.devices.expire():
+            print(f"[Gateway] Device lease expired: {device_id}")
+
+    def handle_device_announcement(self, data, addr):
+        """Processa um DeviceDiscovery recebido na porta 50001"""
+        discovery_msg = device_pb2.DeviceDiscovery()
+        discovery_msg.ParseFromString(data)
+
+        device_id = f"{discovery_msg.device_type}_{discovery_msg.ip}_{discovery_msg.port}"
+        changes = {
+            'type': discovery_msg.device_type,
+            'ip': discovery_msg.ip,
+            'port': discovery_msg.port,
+            'protocol': discovery_msg.protocol_version or 1,
+        }
+        if discovery_msg.HasField("state"):
+            changes['state'] = discovery_msg.state.SerializeToString()
+        else:
+            # Armazena o status fornecido (já deve ser JSON)
+            changes['status'] = discovery_msg.status if discovery_msg.status else "{}"
+        self.devices.update(device_id, defaults={'id': device_id, 'status': "{}"}, **changes)
+        self.devices.touch(device_id, time.time())
+        print(f"[Gateway] Device discovered/updated: {device_id}")
+
+    def handle_sensor_packet(self, data, addr):
+        """Processa um SensorData recebido na porta 50002"""
+        sensor_data = device_pb2.SensorData()
+        try:
             sensor_data.ParseFromString(data)
+        except DecodeError:
+            self.metrics.inc("sensor_parse_errors_total")
+            raise
+        sensor_type = sensor_data.sensor_type
+        self.metrics.inc("sensor_packets_total",
+                         sensor_type=sensor_type if sensor_type in self.SENSOR_TYPES else "other")
+
+        device_id = sensor_data.device_id
+        changes = {
+            # (Opcional) Se quiser armazenar sensor_data.value em 'last_sensor_data':
+            'last_sensor_data': {
+                'value': sensor_data.value,
+                'timestamp': sensor_data.timestamp
+            }
+        }
 
-            device_id = sensor_data.device_id
-            if device_id not in self.devices:
-                self.devices[device_id] = {
-                    'id': device_id,
-                    'type': sensor_data.sensor_type,
-                    'ip': addr[0],
-                    'port': 0,
-                    'status': "{}",
-                    'last_seen': time.time()
-                }
-
-            device = self.devices[device_id]
-            device['last_seen'] = time.time()
-
-            # Se sensor_data.unit contém o JSON do estado, use isso
+        if sensor_data.HasField("state"):
+            # Protocolo 2: o estado já veio tipado, nada mais a decodificar
+            changes['state'] = sensor_data.state.SerializeToString()
+        else:
+            # Protocolo 1: se sensor_data.unit contém o JSON do estado, use isso
             try:
-                # Tenta decodificar o 'unit' como JSON
                 if sensor_data.unit:
                     json.loads(sensor_data.unit)  # Se não der erro, é um JSON válido
-                    device['status'] = sensor_data.unit
+                    changes['status'] = sensor_data.unit
             except:
                 pass
 
-            # (Opcional) Se quiser armazenar sensor_data.value em 'last_sensor_data':
-            device['last_sensor_data'] = {
-                'value': sensor_data.value,
-                'timestamp': sensor_data.timestamp
-            }
-
+        self.devices.update(
+            device_id,
+            defaults={
+                'id': device_id,
+                'type': sensor_data.sensor_type,
+                'ip': addr[0],
+                'port': 0,
+                'status': "{}",
+            },
+            **changes
+        )
+        self.devices.touch(device_id, time.time())
+        now = time.time()
+        self.history.record(device_id, sensor_data.timestamp or now, sensor_data.value)
+        if self.sensor_log is not None:
+            self.sensor_log.append(now, sensor_data.timestamp, sensor_data.value, device_id, sensor_data.sensor_type)
+
+        if self.verbose:
             print(f"[Gateway] Sensor data from {device_id}, type={sensor_data.sensor_type}")
 
+    def listen_for_device_announcements(self):
+        while True:
+            data, addr = self.udp_socket.recvfrom(1024)
+            self.handle_device_announcement(data, addr)
+
+    def receive_sensor_datagram(self, flags=0):
+        """Lê um datagrama do socket único de sensores, atualizando sensor_udp_drops"""
+        data, addr, drops = receive_datagram(self.sensor_socket, 2048, flags, self.sensor_track_drops)
+        if drops is not None:
+            self.sensor_udp_drops = drops
+        return data, addr
+
+    def listen_for_sensor_data(self):
+        while True:
+            data, addr = self.receive_sensor_datagram()
+            try:
+                self.handle_sensor_packet(data, addr)
+            except Exception as e:
+                print(f"[Gateway] Error handling sensor data from {addr}: {e}")
+
     def send_command_to_device(self, device_id, command, parameters=None):
-        if device_id not in self.devices:
-            return False, "Device not found"
+        success, message, _ = self.call_device(device_id, command, parameters)
+        return success, message
 
-        device = self.devices[device_id]
+    def on_registry_change(self, device_id):
+        """Listener do registro: device removido (tombstone) perde a série em memória"""
+        if device_id not in self.devices:
+            self.history.forget(device_id)
+
+    def fetch_device_status(self, device_id):
+        """Leitura de GET_STATUS feita pelo status_cache"""
+        return self.call_device(device_id, "GET_STATUS")
+
+    def call_device(self, device_id, command, parameters=None):
+        """
+        Passa o comando pela fila do device e espera a execução, no máximo
+        DEVICE_CALL_TIMEOUT; retorna (success, message, status JSON do device)
+        """
+        future = self.command_queues.submit(device_id, command, parameters)
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.connect((device['ip'], device['port']))
-
-            command_msg = device_pb2.DeviceCommand()
-            command_msg.command = command
-            if parameters:
+            return future.result(timeout=self.DEVICE_CALL_TIMEOUT)
+        except FutureTimeoutError:
+            # Ainda na fila: não chega mais ao device (já em execução, termina
+            # sozinho no prazo de leitura do pool)
+            future.cancel()
+            return False, "Timeout waiting for device", ""
+
+    def execute_device_command(self, device_id, command, parameters=None):
+        """Envia um DeviceCommand ao device (chamado só pelo despachante da sua fila)"""
+        device = self.devices.get(device_id)
+        if device is None:
+            return False, "Device not found", ""
+
+        addr = (device['ip'], device['port'])
+
+        command_msg = device_pb2.DeviceCommand()
+        command_msg.command = command
+        command_msg.trace_id = current_trace_id()
+        if parameters:
+            params = encode_params(parameters) if device.get('protocol', 1) >= 2 else None
+            if params is not None:
+                command_msg.params.CopyFrom(params)
+            else:
                 command_msg.parameters = json.dumps(parameters)
+        data = command_msg.SerializeToString()
 
-            data = command_msg.SerializeToString()
-            sock.send(len(data).to_bytes(4, byteorder='big'))
-            sock.send(data)
-
-            size_data = sock.recv(4)
-            if not size_data:
-                return False, "No response from device"
+        # Uma conexão reaproveitada pode ter sido fechada pelo dispositivo
+        # enquanto estava ociosa; nesse caso reconecta uma única vez
+        for attempt in range(2):
+            try:
+                with span("gateway.device_connect"):
+                    sock, reused = self.connection_pool.acquire(addr)
+            except Exception as e:
+                self.metrics.inc("device_errors_total")
+                return False, f"Error communicating with device: {e}", ""
 
-            msg_size = int.from_bytes(size_data, byteorder='big')
-            response_data = sock.recv(msg_size)
+            try:
+                started = time.perf_counter()
+                with span("gateway.device_rtt"):
+                    send_frame(sock, data)
+
+                    # Lê só o próprio frame: o socket volta para o pool
+                    response_data = recv_frame(sock)
+                if response_data is None:
+                    raise ConnectionResetError("No response from device")
+                self.metrics.observe("device_rtt_seconds", time.perf_counter() - started)
+
+            except socket.timeout:
+                # Device aceitou a conexão mas não respondeu: a conexão não
+                # serve mais (a resposta pode chegar atrasada nela)
+                self.connection_pool.discard(sock)
+                self.metrics.inc("device_errors_total")
+                return False, "Timeout waiting for device", ""
+            except (BrokenPipeError, ConnectionResetError) as e:
+                self.connection_pool.discard(sock)
+                if reused and attempt == 0:
+                    continue
+                self.metrics.inc("device_errors_total")
+                return False, f"Error communicating with device: {e}", ""
+            except Exception as e:
+                self.connection_pool.discard(sock)
+                self.metrics.inc("device_errors_total")
+                return False, f"Error communicating with device: {e}", ""
+
+            self.connection_pool.release(addr, sock)
 
             response = device_pb2.DeviceResponse()
             response.ParseFromString(response_data)
+            add_remote(response.spans)
 
             # Se o device nos mandou status, atualize
-            if response.success and response.status:
+            status = response.status
+            if response.HasField("state"):
+                self.devices.update(device_id, state=response.state.SerializeToString())
+                # Clientes continuam recebendo o status em JSON
+                status = state_json(device['type'], response.state)
+            elif response.success and status:
                 # response.status deve ser JSON completo
-                device['status'] = response.status
-
-            return response.success, response.message
-
+                self.devices.update(device_id, status=status)
+
+            if response.success and status:
+                # Todo device responde com o estado completo, então qualquer
+                # comando bem-sucedido também renova o cache de GET_STATUS
+                if command != "GET_STATUS":
+                    self.status_cache.put(device_id, (True, "Status retrieved", status))
+            elif command != "GET_STATUS":
+                self.status_cache.invalidate(device_id)
+
+            return response.success, response.message, status
+
+    def run_batch(self, actions, timeout):
+        """
+        Dispara as ações de um BATCH_CONTROL em paralelo e espera no máximo
+        timeout segundos pelo lote inteiro. Ações que não terminam a tempo
+        são reportadas como falha; as que ainda estão na fila são
+        canceladas, e só a que já está em execução pode chegar ao device.
+        """
+        futures = []
+        for action in actions:
+            try:
+                parameters = json.loads(action.parameters) if action.parameters else None
+            except ValueError:
+                futures.append(None)
+                continue
+            futures.append(self.command_queues.submit(action.device_id, action.action, parameters))
+
+        wait([f for f in futures if f is not None], timeout=timeout)
+
+        results = []
+        for action, future in zip(actions, futures):
+            result = device_pb2.ActionResult()
+            result.device_id = action.device_id
+            if future is None:
+                result.success = False
+                result.message = "Invalid parameters"
+            elif not future.done():
+                # Tira da fila o que ainda não começou a ser executado
+                future.cancel()
+                result.success = False
+                result.message = "Timeout waiting for device"
+            else:
+                try:
+                    result.success, result.message, _ = future.result()
+                except Exception as e:
+                    result.success = False
+                    result.message = f"Error: {e}"
+            results.append(result)
+        return results
+
+    def collect_stats(self):
+        """Valores lidos dos componentes (registro, ingestão, shards, cache, filas)"""
+        stats = {"registry_size": len(self.devices), "registry_version": self.devices.version}
+        if self.sensor_ingestor is not None:
+            stats.update(self.sensor_ingestor.stats())
+        elif self.sensor_track_drops:
+            stats["sensor_udp_drops"] = self.sensor_udp_drops
+        if self.membership is not None:
+            stats["shards"] = len(self.membership.ring)
+        stats.update(self.status_cache.stats())
+        stats.update(self.command_queues.stats())
+        return stats
+
+    def is_routed(self, request):
+        """Se a requisição precisa de outros shards para ser atendida"""
+        if self.membership is None or request.shard_local or len(self.membership.ring) < 2:
+            return False
+        if request.command == "LIST_DEVICES":
+            return True
+        if request.command == "BATCH_CONTROL":
+            return any(not self.membership.is_local(action.device_id) for action in request.actions)
+        if request.command in self.DEVICE_COMMANDS:
+            return bool(request.device_id) and not self.membership.is_local(request.device_id)
+        return False
+
+    def route_request(self, request):
+        """Atende uma requisição que envolve outros shards (ver is_routed)"""
+        if request.command == "LIST_DEVICES":
+            return self.list_all_shards(request)
+        if request.command == "BATCH_CONTROL":
+            return self.route_batch(request)
+
+        shard = self.membership.owner(request.device_id)
+        try:
+            # O shard dono pode levar até DEVICE_CALL_TIMEOUT para responder
+            with span("gateway.forward"):
+                response = self.membership.forward(
+                    shard, request, self.DEVICE_CALL_TIMEOUT + ShardMembership.REQUEST_TIMEOUT)
         except Exception as e:
-            return False, f"Error communicating with device: {e}"
+            return error_response(request, f"Shard {shard.shard_id} unreachable: {e}")
+        # Os spans do shard dono entram no trace deste (e voltam ao cliente com ele)
+        add_remote(response.spans)
+        response.ClearField("spans")
+        response.request_id = request.request_id
+        return response.SerializeToString()
+
+    def list_all_shards(self, request):
+        """
+        LIST_DEVICES com os devices de todos os shards. As versões são de
+        cada shard, então a resposta é sempre completa (full_sync) e leva
+        como versão a soma delas.
+        """
+        forwarded = device_pb2.ClientRequest()
+        forwarded.command = "LIST_DEVICES"
+        peers = [shard for shard in self.membership.shards() if shard is not self.membership.local]
+        futures = [self.device_executor.submit(self.membership.forward, shard, forwarded) for shard in peers]
+
+        version, devices, _, _ = self.devices.changes_since(0)
+        seen = {device_info['id'] for device_info in devices}
+        devices_data = [self.encode_device_info(device_info) for device_info in devices]
+        unreachable = 0
+        for future in futures:
+            try:
+                peer_response = future.result()
+            except Exception:
+                unreachable += 1
+                continue
+            version += peer_response.version
+            for dev in peer_response.devices:
+                # Durante um rebalanceamento o device pode estar em dois shards
+                if dev.device_id not in seen:
+                    seen.add(dev.device_id)
+                    devices_data.append(encode_length_delimited(DEVICES_FIELD_NUMBER, dev.SerializeToString()))
+
+        response = device_pb2.ClientResponse()
+        response.success = True
+        response.message = "Devices retrieved successfully"
+        if unreachable:
+            response.message += f" ({unreachable} shard(s) unreachable)"
+        response.version = version
+        response.full_sync = True
+        response.request_id = request.request_id
+        return response.SerializeToString() + b"".join(devices_data)
+
+    def route_batch(self, request):
+        """
+        BATCH_CONTROL com devices de vários shards: cada shard recebe um
+        sub-lote com as suas ações, todos em paralelo, e os resultados
+        voltam na ordem original
+        """
+        timeout = (request.timeout_ms or self.BATCH_TIMEOUT_MS) / 1000.0
+        groups = {}  # shard_id -> (shard, índices das ações)
+        for index, action in enumerate(request.actions):
+            shard = self.membership.owner(action.device_id)
+            groups.setdefault(shard.shard_id, (shard, []))[1].append(index)
+
+        results = [None] * len(request.actions)
+        remote = []
+        for shard, indices in groups.values():
+            if shard is self.membership.local:
+                continue
+            sub_batch = device_pb2.ClientRequest()
+            sub_batch.command = "BATCH_CONTROL"
+            sub_batch.timeout_ms = int(timeout * 1000)
+            sub_batch.actions.extend(request.actions[i] for i in indices)
+            remote.append((shard, indices, self.device_executor.submit(
+                self.membership.forward, shard, sub_batch, timeout + ShardMembership.REQUEST_TIMEOUT)))
+
+        local = groups.get(self.membership.local.shard_id)
+        if local is not None:
+            indices = local[1]
+            for i, result in zip(indices, self.run_batch([request.actions[i] for i in indices], timeout)):
+                results[i] = result
+
+        for shard, indices, future in remote:
+            try:
+                sub_results = list(future.result().results)
+            except Exception as e:
+                sub_results = []
+                for i in indices:
+                    result = device_pb2.ActionResult()
+                    result.device_id = request.actions[i].device_id
+                    result.success = False
+                    result.message = f"Shard {shard.shard_id} unreachable: {e}"
+                    sub_results.append(result)
+            for i, result in zip(indices, sub_results):
+                results[i] = result
+
+        response = device_pb2.ClientResponse()
+        response.results.extend(results)
+        failed = sum(1 for result in results if not result.success)
+        response.success = failed == 0
+        response.message = f"{len(results) - failed}/{len(results)} actions succeeded"
+        response.request_id = request.request_id
+        return response.SerializeToString()
+
+    def query_history(self, device_id, params):
+        """
+        Pontos de GET_HISTORY entre params['start'] e params['end'].
+        source="log" consulta o log em disco (instante de recebimento no
+        gateway) em vez do ring buffer em memória.
+        """
+        start = params.get("start", 0)
+        end = params.get("end", time.time())
+        bucket = params.get("bucket", 0)
+        if params.get("source") == "log":
+            return downsample(self.sensor_log.query(device_id, start, end), start, bucket)
+        return self.history.query(device_id, start, end, bucket)
+
+    def fill_device_info(self, dev, device_info):
+        """Preenche um DeviceInfo a partir de uma entrada do registro"""
+        dev.device_id = device_info['id']
+        dev.device_type = device_info['type']
+        dev.ip = device_info['ip']
+        dev.port = device_info['port']
+        if device_info.get('state'):
+            # Protocolo 2: o JSON de status só é montado aqui, uma vez por
+            # versão (encode_device_info guarda o resultado)
+            dev.state.ParseFromString(device_info['state'])
+            dev.status = state_json(device_info['type'], dev.state)
+        else:
+            dev.status = device_info['status']  # já é JSON
+        if 'last_sensor_data' in device_info:
+            dev.attributes['sensor_data'] = json.dumps(device_info['last_sensor_data'])
+
+    def encode_device_info(self, device_info):
+        """
+        Retorna o DeviceInfo do device já codificado como um elemento do
+        campo repeated `devices` de ClientResponse. Os bytes ficam em cache
+        no próprio registro, válidos enquanto a versão do device não mudar.
+        """
+        cached = device_info.get('encoded')
+        version = device_info['version']
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        dev = device_pb2.DeviceInfo()
+        self.fill_device_info(dev, device_info)
+        encoded = encode_length_delimited(DEVICES_FIELD_NUMBER, dev.SerializeToString())
+        device_info['encoded'] = (version, encoded)
+        return encoded
+
+    def process_client_request(self, request, session=None):
+        """
+        Executa um ClientRequest e devolve o ClientResponse correspondente,
+        já serializado. session é a ClientSession de origem (necessária
+        para SUBSCRIBE).
+        """
+        started = time.perf_counter()
+        try:
+            if not request.trace_id or request.command in self.UNTRACED_COMMANDS:
+                return self.execute_client_request(request, session)
+            return self.execute_traced(request, session)
+        finally:
+            command = request.command if request.command in self.CLIENT_COMMANDS else "other"
+            self.metrics.observe("client_request_seconds", time.perf_counter() - started, command=command)
+
+    def execute_traced(self, request, session):
+        """
+        Executa uma requisição com trace_id: os trechos medidos vão para
+        self.traces e, como campo spans, ao fim da resposta
+        """
+        trace = Trace(self.trace_process, request.trace_id, request.command, request.device_id)
+        try:
+            with activate(trace), trace.span("gateway.request"):
+                response_data = self.execute_client_request(request, session)
         finally:
-            sock.close()
+            trace.duration = time.time() - trace.start
+            self.traces.record(trace)
+        spans = device_pb2.ClientResponse()
+        trace.fill(spans.spans)
+        return response_data + spans.SerializeToString()
+
+    def execute_client_request(self, request, session):
+        if self.is_routed(request):
+            return self.route_request(request)
+
+        response = device_pb2.ClientResponse()
+        # DeviceInfos pré-codificados, concatenados após o resto da resposta
+        # (protobuf aceita os campos em qualquer ordem)
+        devices_data = b""
+
+        if request.command == "LIST_DEVICES":
+            # Com since_version o cliente recebe só o que mudou desde a última
+            # sincronização (mais os ids removidos); sem ele, a lista completa
+            version, changed, removed, full_sync = self.devices.changes_since(request.since_version)
+            response.success = True
+            response.message = "Devices retrieved successfully"
+            response.version = version
+            response.full_sync = full_sync
+            response.removed_device_ids.extend(removed)
+            devices_data = b"".join(self.encode_device_info(device_info) for device_info in changed)
+
+        elif request.command == "GET_HISTORY":
+            params = json.loads(request.parameters) if request.parameters else {}
+            if not request.device_id:
+                response.success = False
+                response.message = "Missing device_id"
+            elif params.get("source") == "log" and self.sensor_log is None:
+                response.success = False
+                response.message = "Sensor log disabled"
+            else:
+                points = self.query_history(request.device_id, params)
+                for timestamp, value, low, high, count in points:
+                    point = response.history.add()
+                    point.timestamp = timestamp
+                    point.value = value
+                    point.min = low
+                    point.max = high
+                    point.count = count
+                response.success = True
+                response.message = f"{len(points)} points"
+
+        elif request.command == "GATEWAY_STATS":
+            response.success = True
+            response.message = "Gateway stats"
+            for name, value in self.metrics.flat().items():
+                response.stats[name] = value
+
+        elif request.command == "GET_TRACES":
+            params = json.loads(request.parameters) if request.parameters else {}
+            traces = self.traces.recent(params.get("limit", 50), params.get("min_ms", 0) / 1000.0,
+                                        params.get("command"))
+            for trace in traces:
+                trace.fill_proto(response.traces.add())
+            response.success = True
+            response.message = f"{len(traces)} traces"
+
+        elif request.command == "SHARD_HELLO" and self.membership is not None:
+            self.membership.handle_hello(request, response)
+            response.success = True
+            response.message = "Hello"
+
+        elif request.command == "SUBSCRIBE":
+            # Os pushes reaproveitam o request_id da assinatura, então
+            # só funcionam em conexões multiplexadas
+            if session is None or not request.request_id:
+                response.success = False
+                response.message = "SUBSCRIBE requires a request_id"
+            elif self.membership is not None and len(self.membership.ring) > 1:
+                # Os pushes só cobrem o registro local; com vários shards o
+                # cliente volta a consultar LIST_DEVICES, que junta todos
+                response.success = False
+                response.message = "SUBSCRIBE is not available with multiple shards"
+            else:
+                params = json.loads(request.parameters) if request.parameters else {}
+                response, devices_data = self.subscriptions.subscribe(
+                    session,
+                    request.request_id,
+                    device_types=params.get("device_types"),
+                    device_ids=params.get("device_ids"),
+                    interval=params.get("interval_ms", self.SUBSCRIBE_INTERVAL_MS) / 1000.0
+                )
+
+        elif request.command == "UNSUBSCRIBE":
+            params = json.loads(request.parameters) if request.parameters else {}
+            if session is not None and self.subscriptions.unsubscribe(session, params.get("subscription_id")):
+                response.success = True
+                response.message = "Unsubscribed"
+            else:
+                response.success = False
+                response.message = "Subscription not found"
+
+        elif request.command == "CONTROL_DEVICE":
+            if not request.device_id:
+                response.success = False
+                response.message = "Missing device_id"
+            else:
+                response.success, response.message, response.status = self.call_device(
+                    request.device_id,
+                    request.action,
+                    json.loads(request.parameters) if request.parameters else None
+                )
+
+        elif request.command == "BATCH_CONTROL":
+            if not request.actions:
+                response.success = False
+                response.message = "Missing actions"
+            else:
+                timeout = (request.timeout_ms or self.BATCH_TIMEOUT_MS) / 1000.0
+                results = self.run_batch(request.actions, timeout)
+                response.results.extend(results)
+                failed = sum(1 for result in results if not result.success)
+                response.success = failed == 0
+                response.message = f"{len(results) - failed}/{len(results)} actions succeeded"
+
+        elif request.command in ("GET_STATUS", "SET_STATUS"):
+            # SET_STATUS é o nome antigo do mesmo comando
+            if not request.device_id:
+                response.success = False
+                response.message = "Missing device_id"
+            else:
+                response.success, response.message, response.status = self.status_cache.get(request.device_id)
+
+        else:
+            response.success = False
+            response.message = "Unknown command"
+
+        response.request_id = request.request_id
+        return response.SerializeToString() + devices_data
+
+    def encode_response(self, session, response_data):
+        """Resposta como vai para o socket da sessão (comprimida, se negociado)"""
+        return compress_response(response_data, session.encoding, self.compress_threshold)
 
     def handle_client_request(self, client_socket):
+        # Respostas de requisições concorrentes (e pushes de assinaturas) podem
+        # sair fora de ordem, mas cada frame precisa ser escrito inteiro no socket
+        send_lock = threading.Lock()
+
+        def reply(response_data):
+            response_data = self.encode_response(session, response_data)
+            with send_lock:
+                send_frame(client_socket, response_data)
+
+        session = ClientSession(reply)
+        self.metrics.inc("client_sessions")
+
+        def serve(request):
+            try:
+                response_data = self.process_client_request(request, session)
+            except Exception as e:
+                response_data = error_response(request, e)
+            try:
+                reply(response_data)
+            except OSError:
+                pass  # cliente desconectou antes da resposta
+
+        reader = FrameReader(client_socket)
         try:
             while True:
-                size_data = client_socket.recv(4)
-                if not size_data:
-                    break
-                msg_size = int.from_bytes(size_data, byteorder='big')
-                data = client_socket.recv(msg_size)
-                if not data:
+                data = reader.read_frame()
+                if data is None:
                     break
 
                 request = device_pb2.ClientRequest()
                 request.ParseFromString(data)
+                session.negotiate(request)
 
-                response = device_pb2.ClientResponse()
-
-                if request.command == "LIST_DEVICES":
-                    response.success = True
-                    response.message = "Devices retrieved successfully"
-                    for device_info in self.devices.values():
-                        dev = response.devices.add()
-                        dev.device_id = device_info['id']
-                        dev.device_type = device_info['type']
-                        dev.ip = device_info['ip']
-                        dev.port = device_info['port']
-                        dev.status = device_info['status']  # já é JSON
-                        if 'last_sensor_data' in device_info:
-                            dev.attributes['sensor_data'] = json.dumps(device_info['last_sensor_data'])
-
-                elif request.command == "CONTROL_DEVICE":
-                    if not request.device_id:
-                        response.success = False
-                        response.message = "Missing device_id"
-                    else:
-                        success, message = self.send_command_to_device(
-                            request.device_id,
-                            request.action,
-                            json.loads(request.parameters) if request.parameters else None
-                        )
-                        response.success = success
-                        response.message = message
-
-                elif request.command == "SET_STATUS":
-                    if not request.device_id:
-                        response.success = False
-                        response.message = "Missing device_id"
-                    else:
-                        success, message = self.send_command_to_device(request.device_id, "GET_STATUS")
-                        response.success = success
-                        response.message = message
-
+                # Com request_id o cliente aceita respostas fora de ordem, então
+                # a requisição roda no pool sem bloquear as seguintes
+                if request.request_id:
+                    self.request_executor.submit(serve, request)
                 else:
-                    response.success = False
-                    response.message = "Unknown command"
-
-                response_data = response.SerializeToString()
-                client_socket.send(len(response_data).to_bytes(4, byteorder='big'))
-                client_socket.send(response_data)
+                    serve(request)
 
         except Exception as e:
             print(f"Error handling client: {e}")
         finally:
+            self.metrics.inc("client_sessions", -1)
+            self.subscriptions.drop_session(session)
             client_socket.close()
 
+    def start_metrics_server(self):
+        if not self.metrics_port:
+            return
+        try:
+            start_metrics_server(self.metrics, self.metrics_port)
+            print(f"Metrics on http://127.0.0.1:{self.metrics_port}/metrics")
+        except OSError as e:
+            print(f"[Gateway] Metrics server disabled: {e}")
+
     def run(self):
+        self.start_metrics_server()
+
         # Threads para receber anúncios e sensor data
         discovery_thread = threading.Thread(target=self.listen_for_device_announcements, daemon=True)
         discovery_thread.start()
 
-        sensor_thread = threading.Thread(target=self.listen_for_sensor_data, daemon=True)
-        sensor_thread.start()
+        if self.sensor_ingestor is not None:
+            self.sensor_ingestor.start()
+        else:
+            sensor_thread = threading.Thread(target=self.listen_for_sensor_data, daemon=True)
+            sensor_thread.start()
+
+        if self.membership is not None:
+            self.membership.start()
 
         # Envia multicast inicial
         self.send_discovery_message()
@@ -222,12 +918,68 @@ class Gateway:
         discovery_timer = threading.Thread(target=periodic_discovery, daemon=True)
         discovery_timer.start()
 
+        # Expiração das leases do registro
+        def periodic_expiry():
+            while True:
+                time.sleep(self.LEASE_CHECK_INTERVAL)
+                self.expire_leases()
+
+        expiry_timer = threading.Thread(target=periodic_expiry, daemon=True)
+        expiry_timer.start()
+
         print(f"Gateway running on port {self.TCP_PORT}")
         while True:
             client_sock, addr = self.tcp_socket.accept()
             t = threading.Thread(target=self.handle_client_request, args=(client_sock,), daemon=True)
             t.start()
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Gateway do escritório inteligente")
+    parser.add_argument("--mode", choices=["async", "threaded"], default="async",
+                        help="async: um único event loop (padrão); threaded: uma thread por cliente")
+    parser.add_argument("--sensor-log-dir", default="files/sensor_log",
+                        help="diretório do log de SensorData em disco (vazio desativa)")
+    parser.add_argument("--sensor-workers", type=int, default=0,
+                        help="threads de ingestão de SensorData compartilhando a porta 50002 (0 = socket único)")
+    parser.add_argument("--verbose", action="store_true",
+                        help="imprime cada SensorData recebido")
+    parser.add_argument("--port", type=int, default=6000, help="porta TCP de clientes")
+    parser.add_argument("--announce-port", type=int, default=50001, help="porta UDP dos anúncios dos devices")
+    parser.add_argument("--sensor-port", type=int, default=50002, help="porta UDP de SensorData")
+    parser.add_argument("--shard-id",
+                        help="roda como um shard: devices são divididos entre os gateways por hash do device_id")
+    parser.add_argument("--advertise-ip", help="IP deste shard anunciado aos devices e aos outros shards")
+    parser.add_argument("--peers", default="",
+                        help="outros shards, como ip:porta separados por vírgula (os demais são descobertos)")
+    parser.add_argument("--status-ttl", type=float, default=1.0,
+                        help="segundos em que um GET_STATUS é servido do cache sem consultar o device")
+    parser.add_argument("--status-stale-ttl", type=float, default=10.0,
+                        help="até quantos segundos um status vencido ainda é servido enquanto é relido")
+    parser.add_argument("--metrics-port", type=int, default=9108,
+                        help="porta local (127.0.0.1) com as métricas em formato texto do Prometheus (0 desativa)")
+    parser.add_argument("--compress-threshold", type=int, default=COMPRESS_THRESHOLD,
+                        help="bytes a partir dos quais respostas são comprimidas para clientes que aceitam")
+    parser.add_argument("--state-feed-port", type=int, default=FEED_PORT,
+                        help="porta UDP multicast do feed de estado dos atuadores para os sensores (0 desativa)")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    gateway = Gateway()
-    gateway.run()
+    args = parse_args()
+    peers = []
+    for peer in filter(None, args.peers.split(",")):
+        host, _, port = peer.strip().rpartition(":")
+        peers.append((host, int(port)))
+    options = dict(sensor_log_dir=args.sensor_log_dir, sensor_workers=args.sensor_workers,
+                   verbose=args.verbose, tcp_port=args.port, announce_port=args.announce_port,
+                   sensor_port=args.sensor_port, shard_id=args.shard_id,
+                   advertise_ip=args.advertise_ip, peers=peers, status_ttl=args.status_ttl,
+                   status_stale_ttl=args.status_stale_ttl, compress_threshold=args.compress_threshold,
+                   metrics_port=args.metrics_port, state_feed_port=args.state_feed_port)
+    if args.mode == "threaded":
+        gateway = Gateway(**options)
+        gateway.run()
+    else:
+        from async_gateway import AsyncGateway
+        gateway = AsyncGateway(**options)
+        asyncio.run(gateway.run())
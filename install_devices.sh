@@ -1,7 +1,7 @@
 #!/bin/bash
 
 sudo dnf install -y python pip zsh
-pip install protobuf ttkbootstrap
+pip install protobuf ttkbootstrap numpy
 chmod +x *.py
 export PS1=devices:$PS1
 zsh
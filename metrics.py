@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Limites superiores (em segundos) dos buckets dos histogramas de latência
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class ThreadMetrics:
+    """Valores escritos por uma única thread"""
+    def __init__(self, thread):
+        self.thread = thread
+        self.counters = {}    # (nome, labels) -> valor
+        self.histograms = {}  # (nome, labels) -> [contagem de cada bucket..., +Inf, soma]
+
+
+def _merge(target, source):
+    # dict(...) e list(...) copiam sem liberar o GIL, então a thread dona
+    # pode continuar escrevendo enquanto somamos
+    for key, value in dict(source.counters).items():
+        target.counters[key] = target.counters.get(key, 0) + value
+    for key, cells in dict(source.histograms).items():
+        cells = list(cells)
+        merged = target.histograms.get(key)
+        if merged is None:
+            target.histograms[key] = cells
+        else:
+            for i, value in enumerate(cells):
+                merged[i] += value
+
+
+def _labels_text(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Metrics:
+    """
+    Contadores, gauges e histogramas sem lock no caminho quente.
+
+    Cada thread escreve numa cópia própria dos valores (threading.local);
+    só a leitura percorre as cópias de todas as threads e soma. O lock é
+    tomado apenas na primeira escrita de uma thread e na leitura. Cópias
+    de threads que já terminaram são somadas numa base e descartadas,
+    para não acumular uma por conexão no modo com threads.
+    """
+    def __init__(self, prefix="gateway"):
+        self.prefix = prefix
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.threads = []                  # ThreadMetrics das threads vivas
+        self.retired = ThreadMetrics(None)  # soma das threads que terminaram
+        self.kinds = {}                    # nome -> (tipo, descrição)
+        self.buckets = {}                  # nome do histograma -> limites
+        self.collectors = []               # funções que retornam {nome: valor}
+
+    def counter(self, name, description):
+        self.kinds[name] = ("counter", description)
+
+    def gauge(self, name, description):
+        """Valor que sobe e desce com inc(name, 1) / inc(name, -1)"""
+        self.kinds[name] = ("gauge", description)
+
+    def histogram(self, name, description, buckets=LATENCY_BUCKETS):
+        self.kinds[name] = ("histogram", description)
+        self.buckets[name] = tuple(buckets)
+
+    def add_collector(self, collect):
+        """collect() -> {nome: valor}, lido só na hora de expor (ex.: tamanho do registro)"""
+        self.collectors.append(collect)
+
+    def _values(self):
+        values = getattr(self.local, "values", None)
+        if values is None:
+            values = self.local.values = ThreadMetrics(threading.current_thread())
+            with self.lock:
+                self.threads.append(values)
+        return values
+
+    def inc(self, name, value=1, **labels):
+        counters = self._values().counters
+        key = (name, tuple(labels.items()))
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        histograms = self._values().histograms
+        key = (name, tuple(labels.items()))
+        cells = histograms.get(key)
+        buckets = self.buckets[name]
+        if cells is None:
+            cells = histograms[key] = [0] * (len(buckets) + 2)
+        cells[bisect.bisect_left(buckets, value)] += 1
+        cells[-1] += value
+
+    def snapshot(self):
+        """ThreadMetrics com a soma de todas as threads"""
+        total = ThreadMetrics(None)
+        with self.lock:
+            alive = []
+            for values in self.threads:
+                if values.thread.is_alive():
+                    alive.append(values)
+                else:
+                    _merge(self.retired, values)
+            self.threads = alive
+            _merge(total, self.retired)
+            for values in alive:
+                _merge(total, values)
+        return total
+
+    def collected(self):
+        values = {}
+        for collect in self.collectors:
+            values.update(collect())
+        return values
+
+    def quantile(self, name, cells, q):
+        """Estimativa de um quantil: limite do bucket onde ele cai"""
+        buckets = self.buckets[name]
+        count = sum(cells[:-1])
+        if not count:
+            return 0.0
+        seen = 0
+        for i, value in enumerate(cells[:-1]):
+            seen += value
+            if seen >= q * count:
+                return buckets[min(i, len(buckets) - 1)]
+        return buckets[-1]
+
+    def flat(self):
+        """Tudo como {nome: valor}, para o campo stats de GATEWAY_STATS"""
+        total = self.snapshot()
+        stats = {}
+        for (name, labels), value in total.counters.items():
+            stats[name + _labels_text(labels)] = value
+        for (name, labels), cells in total.histograms.items():
+            suffix = _labels_text(labels)
+            stats[f"{name}_count{suffix}"] = sum(cells[:-1])
+            stats[f"{name}_sum{suffix}"] = cells[-1]
+            stats[f"{name}_p50{suffix}"] = self.quantile(name, cells, 0.5)
+            stats[f"{name}_p99{suffix}"] = self.quantile(name, cells, 0.99)
+        stats.update(self.collected())
+        return stats
+
+    def render(self):
+        """Formato texto de exposição do Prometheus (version 0.0.4)"""
+        total = self.snapshot()
+        series = {}  # nome -> linhas
+        for (name, labels), value in total.counters.items():
+            series.setdefault(name, []).append(f"{self.prefix}_{name}{_labels_text(labels)} {value}")
+        for (name, labels), cells in total.histograms.items():
+            lines = series.setdefault(name, [])
+            cumulative = 0
+            for bound, value in zip(self.buckets[name] + ("+Inf",), cells[:-1]):
+                cumulative += value
+                lines.append(f"{self.prefix}_{name}_bucket{_labels_text(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.prefix}_{name}_sum{_labels_text(labels)} {cells[-1]}")
+            lines.append(f"{self.prefix}_{name}_count{_labels_text(labels)} {cumulative}")
+
+        out = []
+        for name in sorted(series):
+            kind, description = self.kinds.get(name, ("untyped", ""))
+            out.append(f"# HELP {self.prefix}_{name} {description}")
+            out.append(f"# TYPE {self.prefix}_{name} {kind}")
+            out.extend(sorted(series[name]) if kind != "histogram" else series[name])
+        for name, value in sorted(self.collected().items()):
+            out.append(f"# TYPE {self.prefix}_{name} untyped")
+            out.append(f"{self.prefix}_{name} {value}")
+        return "\n".join(out) + "\n"
+
+
+def start_metrics_server(metrics, port, host="127.0.0.1"):
+    """Serve metrics.render() por HTTP em host:port numa thread própria"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # sem uma linha no terminal a cada coleta
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
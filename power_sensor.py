@@ -3,13 +3,17 @@ import socket
 import struct
 import threading
 import time
-import json
 import device_pb2
-import subprocess
+from sharding import gateway_endpoint
+from state_bus import StateBus
+from state_feed import StateFeed
+from transport import FrameReader, send_frame
+from protocol import ReportPolicy, command_params, negotiate, set_state, typed_state
+from tracing import traced_command
 
 
 class PowerSensor:
-    def __init__(self):
+    def __init__(self, networking=True, bus=None, feed=None, ip=None):
         # Configurações de rede
         self.MCAST_GRP = '224.0.0.1'
         self.MCAST_PORT = 50000
@@ -23,13 +27,27 @@ class PowerSensor:
             "update_interval": 2  # segundos
         }
         
-        # Inicializar sockets
-        self.init_tcp_server()
-        self.init_multicast_listener()
-        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # Inicializar sockets (sem networking, quem cuida da rede é o device_host.py)
+        if networking:
+            self.init_tcp_server()
+            self.init_multicast_listener()
+            self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         
         # IP do gateway (será atualizado quando recebermos GATEWAY_DISCOVERY)
         self.gateway_ip = None
+        # Portas desse gateway; com vários gateways (shards), as do dono deste device
+        self.gateway_announce_port = 50001
+        self.gateway_sensor_port = 50002
+        # Versão do protocolo combinada com o gateway no GATEWAY_DISCOVERY
+        self.protocol_version = 1
+        # Envio por mudança: deadband e max_silence entram no estado
+        self.reporting = ReportPolicy(self.device_type, self.state)
+        # Estado dos atuadores, publicado por eles em memória compartilhada
+        self.bus = bus or StateBus()
+        # e republicado pelo gateway em multicast, para atuadores de outros hosts
+        self.feed = feed if feed is not None else (StateFeed() if networking else None)
+        # IP anunciado ao gateway, parte do device_id (o device_host passa o IP do host)
+        self.ip = ip or self.get_local_ip()
         
     def init_tcp_server(self):
         """Inicializa o servidor TCP para comandos"""
@@ -58,50 +76,76 @@ class PowerSensor:
         finally:
             s.close()
         return ip
+
+    def actuators(self, device_type):
+        """
+        Estado de cada atuador do tipo que está rodando, {device_id: estado}:
+        os de outros hosts pelo feed do gateway e os desta máquina pelo
+        barramento, que é mais recente e prevalece
+        """
+        states = self.feed.read(device_type) if self.feed is not None else {}
+        states.update(self.bus.read(device_type))
+        return states
         
+    def read_power(self):
+        """Potência atual: soma das potências de todos os ares-condicionados e lâmpadas"""
+        potencia = 0
+        # Só contam os atuadores com heartbeat recente (barramento ou feed do gateway)
+        for device_type in ("air_conditioner", "smart_lamp"):
+            for device in self.actuators(device_type).values():
+                potencia = potencia + device["power"]
+        self.state["power"] = potencia
+
+    @property
+    def device_id(self):
+        """Identificador do device no gateway e no barramento de estado"""
+        return f"{self.device_type}_{self.ip}_{self.TCP_PORT}"
+
+    def update_interval(self):
+        """Segundos entre duas leituras"""
+        return self.state["update_interval"]
+
+    def tick(self, ip):
+        """
+        Avança a simulação um intervalo e retorna o SensorData serializado
+        com a potência, ou None se ainda não há gateway ou se o valor
+        não saiu da deadband e o último envio foi há menos de max_silence
+        """
+        self.read_power()
+        if not self.gateway_ip:
+            return None
+        if not self.reporting.should_report(self.state["power"]):
+            return None
+        # Cria mensagem de dados do sensor
+        sensor_data = device_pb2.SensorData()
+        sensor_data.device_id = f"{self.device_type}_{ip}_{self.TCP_PORT}"
+        sensor_data.sensor_type = "power"
+        sensor_data.value = self.state["power"]
+        sensor_data.unit = self.state["unit"]
+        if self.protocol_version >= 2:
+            sensor_data.state.CopyFrom(typed_state(self.device_type, self.state))
+        sensor_data.timestamp = int(time.time())
+        return sensor_data.SerializeToString()
+
     def simulate_power(self):
         """Lida com as mudanças de potência e envia dados periodicamente ao Gateway"""
         while True:
-            # Testando se o ar condicionado e a lâmpada estão conectados
-            pid_ac = subprocess.check_output("ps -aux | grep air_conditioner.py", shell=True, text=True)
-            pid_lamp = subprocess.check_output("ps -aux | grep smart_lamp.py", shell=True, text=True)
-            potencia = 0
-            if len(pid_ac.split("\n")) > 3:
-                # Conexão com potência do ar condicionado
-                with open("files/ac_power.txt", "r") as f:
-                    conteudo = f.read().split()
-                    potencia = potencia + int(conteudo[0])
-            if len(pid_lamp.split("\n")) > 3:
-                with open("files/lamp_power.txt", "r") as f:
-                    conteudo = f.read().split()
-                    potencia = potencia + int(conteudo[0])
-            self.state["power"] = potencia
-                
-                
-            if self.gateway_ip:
-                # Cria mensagem de dados do sensor
-                sensor_data = device_pb2.SensorData()
-                sensor_data.device_id = f"{self.device_type}_{self.get_local_ip()}_{self.TCP_PORT}"
-                sensor_data.sensor_type = "power"
-                sensor_data.value = self.state["power"]
-                sensor_data.unit = self.state["unit"]
-                sensor_data.timestamp = int(time.time())
-                
-                # Envia para o gateway via UDP
+            data = self.tick(self.get_local_ip())
+
+            # Envia para o gateway via UDP
+            if data is not None:
                 try:
-                    data = sensor_data.SerializeToString()
-                    self.udp_socket.sendto(data, (self.gateway_ip, 50002))
+                    self.udp_socket.sendto(data, (self.gateway_ip, self.gateway_sensor_port))
                 except Exception as e:
                     print(f"Error sending sensor data: {e}")
-            
-            time.sleep(self.state["update_interval"])
 
-            
+            time.sleep(self.update_interval())
+
     def handle_command(self, command_msg):
         """Processa comandos recebidos (via TCP)"""
         try:
             command = command_msg.command
-            params = json.loads(command_msg.parameters) if command_msg.parameters else {}
+            params = command_params(command_msg)
             
             response = device_pb2.DeviceResponse()
             
@@ -126,11 +170,14 @@ class PowerSensor:
                     response.success = False
                     response.message = "Missing interval parameter"
 
+            elif command == "SET_REPORTING":
+                response.success, response.message = self.reporting.configure(params)
+
             else:
                 response.success = False
                 response.message = "Unknown command"
 
-            response.status = json.dumps(self.state)
+            set_state(response, self.device_type, self.state, self.protocol_version)
             
             return response
 
@@ -139,23 +186,18 @@ class PowerSensor:
             response = device_pb2.DeviceResponse()
             response.success = False
             response.message = f"Error: {str(e)}"
-            response.status = json.dumps(self.state)
+            set_state(response, self.device_type, self.state, self.protocol_version)
             return response
             
     def handle_tcp_client(self, client_socket, addr):
         """Gerencia conexões TCP"""
         try:
+            # Um buffer reaproveitado por conexão; frames chegam inteiros mesmo
+            # se o TCP entregar a mensagem em pedaços
+            reader = FrameReader(client_socket)
             while True:
-                # Recebe tamanho da mensagem
-                size_data = client_socket.recv(4)
-                if not size_data:
-                    break
-                    
-                msg_size = int.from_bytes(size_data, byteorder='big')
-                
-                # Recebe mensagem do dispositivo
-                data = client_socket.recv(msg_size)
-                if not data:
+                data = reader.read_frame()
+                if data is None:
                     break
                     
                 # Processa comando
@@ -163,18 +205,37 @@ class PowerSensor:
                 command_msg.ParseFromString(data)
                 
                 # Gera resposta
-                response = self.handle_command(command_msg)
+                response = traced_command(command_msg, self.handle_command, f"device:{self.device_type}")
                 
                 # Envia resposta de volta
                 response_data = response.SerializeToString()
-                client_socket.send(len(response_data).to_bytes(4, byteorder='big'))
-                client_socket.send(response_data)
+                send_frame(client_socket, response_data)
 
         except Exception as e:
             print(f"Error handling TCP client: {e}")
         finally:
             client_socket.close()
             
+    def discovery_response(self, msg, addr, ip):
+        """
+        Resposta a um GATEWAY_DISCOVERY vindo de addr: combina a versão do
+        protocolo, guarda o gateway dono deste device e retorna
+        (DeviceDiscovery serializado, endereço de destino)
+        """
+        discovery_msg = device_pb2.DeviceDiscovery()
+        discovery_msg.device_type = self.device_type
+        discovery_msg.ip = ip
+        discovery_msg.port = self.TCP_PORT
+        self.protocol_version = negotiate(msg.protocol_version)
+        discovery_msg.protocol_version = self.protocol_version
+        set_state(discovery_msg, self.device_type, self.state, self.protocol_version)
+
+        # Anúncios e SensorData vão para o gateway dono deste device_id
+        device_id = f"{self.device_type}_{discovery_msg.ip}_{discovery_msg.port}"
+        self.gateway_ip, self.gateway_announce_port, self.gateway_sensor_port = \
+            gateway_endpoint(msg, addr, device_id)
+        return discovery_msg.SerializeToString(), (self.gateway_ip, self.gateway_announce_port)
+
     def listen_for_discovery(self):
         """Escuta por mensagens de descoberta (multicast) e responde ao Gateway"""
         while True:
@@ -182,18 +243,10 @@ class PowerSensor:
             msg = device_pb2.DeviceCommand()
             msg.ParseFromString(data)
             if msg.command == "GATEWAY_DISCOVERY":
-                self.gateway_ip = addr[0]  # Salva IP do gateway para envio de dados
-                
-                # Prepara resposta
-                discovery_msg = device_pb2.DeviceDiscovery()
-                discovery_msg.device_type = self.device_type
-                discovery_msg.ip = self.get_local_ip()
-                discovery_msg.port = self.TCP_PORT
-                discovery_msg.status = json.dumps(self.state)
-                
+                data, target = self.discovery_response(msg, addr, self.get_local_ip())
                 # Envia resposta unicast
                 response_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                response_socket.sendto(discovery_msg.SerializeToString(), (addr[0], 50001))
+                response_socket.sendto(data, target)
                 response_socket.close()
                 
     def run(self):
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+import json
+import time
+import device_pb2
+
+# Versão mais recente do protocolo entre gateway e devices. Na 1, estado e
+# parâmetros vão em JSON dentro de strings; na 2, em mensagens tipadas.
+PROTOCOL_VERSION = 2
+
+# Sensores: chave do valor medido no dicionário de estado e seu tipo
+SENSOR_FIELDS = {
+    "temperature_sensor": ("temperature", float),
+    "brightness_sensor": ("brightness", int),
+    "power_sensor": ("power", int),
+}
+
+# Envio por mudança dos sensores: deadband padrão, na unidade de cada
+# sensor, e silêncio máximo (s) entre dois SensorData
+DEFAULT_DEADBAND = {
+    "temperature_sensor": 0.1,
+    "brightness_sensor": 0,
+    "power_sensor": 0,
+}
+DEFAULT_MAX_SILENCE = 30
+
+
+class ReportPolicy:
+    """
+    Envio por mudança de um sensor: a leitura só vai ao gateway se mudou
+    mais que a deadband desde o último envio ou se o sensor já está
+    max_silence segundos sem enviar (heartbeat). Os dois valores ficam no
+    dicionário de estado do sensor, que vai ao gateway com o resto do
+    estado e é alterado pelo comando SET_REPORTING.
+    """
+    def __init__(self, device_type, state):
+        self.state = state
+        state.setdefault("deadband", DEFAULT_DEADBAND[device_type])
+        state.setdefault("max_silence", DEFAULT_MAX_SILENCE)
+        # Último valor enviado ao gateway e quando (relógio monotônico)
+        self.last_value = None
+        self.last_at = 0.0
+
+    def should_report(self, value, now=None):
+        """Se a leitura vai ao gateway; se vai, passa a ser o último envio"""
+        now = time.monotonic() if now is None else now
+        if (self.last_value is not None and abs(value - self.last_value) <= self.state["deadband"]
+                and now - self.last_at < self.state["max_silence"]):
+            return False
+        self.last_value = value
+        self.last_at = now
+        return True
+
+    def configure(self, params):
+        """Aplica os parâmetros de um SET_REPORTING; retorna (success, message)"""
+        if "deadband" not in params and "max_silence" not in params:
+            return False, "Missing deadband or max_silence parameter"
+        deadband = float(params.get("deadband", self.state["deadband"]))
+        max_silence = int(params.get("max_silence", self.state["max_silence"]))
+        if deadband < 0:
+            return False, "Deadband must not be negative"
+        if not 1 <= max_silence <= 3600:
+            return False, "Max silence must be between 1 and 3600 seconds"
+        self.state["deadband"] = deadband
+        self.state["max_silence"] = max_silence
+        return True, (f"Reporting changes above {deadband} {self.state['unit']}, "
+                      f"at least every {max_silence} seconds")
+
+
+def negotiate(gateway_version):
+    """Versão usada com um gateway que anunciou gateway_version (0 = gateway antigo)"""
+    return min(PROTOCOL_VERSION, gateway_version or 1)
+
+
+def _power(value):
+    return device_pb2.POWER_ON if value == "ON" else device_pb2.POWER_OFF
+
+
+def typed_state(device_type, state):
+    """TypedDeviceState a partir do dicionário de estado de um device"""
+    typed = device_pb2.TypedDeviceState()
+    if device_type == "air_conditioner":
+        ac = typed.air_conditioner
+        ac.power = _power(state["power"])
+        ac.temperature = int(state["temperature"])
+        ac.mode = device_pb2.AcMode.Value("AC_MODE_" + state["mode"])
+        ac.fan_speed = device_pb2.FanSpeed.Value("FAN_SPEED_" + state["fan_speed"])
+    elif device_type == "smart_lamp":
+        typed.lamp.power = _power(state["power"])
+        typed.lamp.brightness = int(state["brightness"])
+    elif device_type in SENSOR_FIELDS:
+        key, _ = SENSOR_FIELDS[device_type]
+        typed.sensor.value = state[key]
+        typed.sensor.unit = state["unit"]
+        typed.sensor.update_interval = int(state["update_interval"])
+        typed.sensor.deadband = state.get("deadband", 0)
+        typed.sensor.max_silence = int(state.get("max_silence", 0))
+    return typed
+
+
+def state_to_dict(device_type, typed):
+    """Inverso de typed_state: o mesmo dicionário que os devices mandavam em JSON"""
+    kind = typed.WhichOneof("state")
+    if kind == "air_conditioner":
+        ac = typed.air_conditioner
+        return {
+            "power": "ON" if ac.power == device_pb2.POWER_ON else "OFF",
+            "temperature": ac.temperature,
+            "mode": device_pb2.AcMode.Name(ac.mode)[len("AC_MODE_"):],
+            "fan_speed": device_pb2.FanSpeed.Name(ac.fan_speed)[len("FAN_SPEED_"):],
+        }
+    if kind == "lamp":
+        return {
+            "power": "ON" if typed.lamp.power == device_pb2.POWER_ON else "OFF",
+            "brightness": typed.lamp.brightness,
+        }
+    if kind == "sensor":
+        key, cast = SENSOR_FIELDS.get(device_type, ("value", float))
+        return {key: cast(typed.sensor.value), "unit": typed.sensor.unit,
+                "update_interval": typed.sensor.update_interval,
+                "deadband": typed.sensor.deadband, "max_silence": typed.sensor.max_silence}
+    return {}
+
+
+def state_json(device_type, typed):
+    """Estado tipado como o JSON de status do protocolo 1 (para clientes)"""
+    return json.dumps(state_to_dict(device_type, typed))
+
+
+def set_state(message, device_type, state, protocol_version):
+    """Preenche o estado em DeviceResponse/DeviceDiscovery conforme a versão"""
+    if protocol_version >= 2:
+        message.state.CopyFrom(typed_state(device_type, state))
+    else:
+        message.status = json.dumps(state)
+
+
+def encode_params(parameters):
+    """
+    CommandParams equivalente ao dicionário de parâmetros, ou None se
+    algum parâmetro não tem campo tipado (nesse caso vai em JSON)
+    """
+    params = device_pb2.CommandParams()
+    try:
+        for key, value in (parameters or {}).items():
+            if key in ("temperature", "brightness", "interval", "max_silence"):
+                setattr(params, key, int(value))
+            elif key == "deadband":
+                params.deadband = float(value)
+            elif key == "mode":
+                params.mode = device_pb2.AcMode.Value("AC_MODE_" + str(value).upper())
+            elif key == "fan_speed":
+                params.fan_speed = device_pb2.FanSpeed.Value("FAN_SPEED_" + str(value).upper())
+            else:
+                return None
+    except (TypeError, ValueError):
+        return None
+    return params
+
+
+def command_params(command_msg):
+    """Parâmetros de um DeviceCommand como dicionário, tipados ou em JSON"""
+    if not command_msg.HasField("params"):
+        return json.loads(command_msg.parameters) if command_msg.parameters else {}
+    params = command_msg.params
+    result = {}
+    for key in ("temperature", "brightness", "interval", "deadband", "max_silence"):
+        if params.HasField(key):
+            result[key] = getattr(params, key)
+    if params.mode:
+        result["mode"] = device_pb2.AcMode.Name(params.mode)[len("AC_MODE_"):]
+    if params.fan_speed:
+        result["fan_speed"] = device_pb2.FanSpeed.Name(params.fan_speed)[len("FAN_SPEED_"):]
+    return result
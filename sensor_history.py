@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+import threading
+from array import array
+
+
+def downsample(readings, start, bucket=0):
+    """
+    Converte leituras (timestamp, valor) ordenadas em pontos
+    (timestamp, valor, min, max, count). Com bucket > 0 (segundos), agrega
+    os pontos por janela alinhada em start: timestamp é o início da janela
+    e valor a média.
+    """
+    if bucket <= 0:
+        return [(ts, value, value, value, 1) for ts, value in readings]
+
+    points = []
+    window = None
+    for ts, value in readings:
+        current = start + ((ts - start) // bucket) * bucket
+        if current != window:
+            if window is not None:
+                points.append((window, total / count, low, high, count))
+            window, total, low, high, count = current, 0.0, value, value, 0
+        total += value
+        low = min(low, value)
+        high = max(high, value)
+        count += 1
+    if window is not None:
+        points.append((window, total / count, low, high, count))
+    return points
+
+
+class SensorSeries:
+    """
+    Ring buffer de leituras (timestamp, valor) de um único device.
+    Usa dois array('d') pré-alocados, então a memória por série é fixa
+    (16 bytes por ponto) e append não aloca.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity))
+        self.start = 0  # posição física do ponto mais antigo
+        self.count = 0
+
+    def append(self, timestamp, value):
+        # Mantém a série ordenada mesmo se um datagrama chegar atrasado
+        if self.count and timestamp < self.timestamps[(self.start + self.count - 1) % self.capacity]:
+            timestamp = self.timestamps[(self.start + self.count - 1) % self.capacity]
+
+        if self.count < self.capacity:
+            pos = (self.start + self.count) % self.capacity
+            self.count += 1
+        else:
+            pos = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.timestamps[pos] = timestamp
+        self.values[pos] = value
+
+    def _timestamp_at(self, i):
+        return self.timestamps[(self.start + i) % self.capacity]
+
+    def _lower_bound(self, timestamp):
+        """Primeiro índice lógico com timestamp >= timestamp"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._timestamp_at(mid) < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def range(self, start, end):
+        """Itera (timestamp, valor) com start <= timestamp <= end"""
+        first = self._lower_bound(start)
+        for i in range(first, self.count):
+            pos = (self.start + i) % self.capacity
+            timestamp = self.timestamps[pos]
+            if timestamp > end:
+                break
+            yield timestamp, self.values[pos]
+
+
+class SensorHistory:
+    """Séries temporais em memória de todos os devices que enviam SensorData"""
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.series = {}  # device_id -> SensorSeries
+        self.lock = threading.Lock()
+
+    def record(self, device_id, timestamp, value):
+        with self.lock:
+            series = self.series.get(device_id)
+            if series is None:
+                series = self.series[device_id] = SensorSeries(self.capacity)
+            series.append(timestamp, value)
+
+    def query(self, device_id, start, end, bucket=0):
+        """
+        Retorna a lista de pontos (timestamp, valor, min, max, count) no
+        intervalo, agregados por downsample() se bucket > 0
+        """
+        with self.lock:
+            series = self.series.get(device_id)
+            if series is None:
+                return []
+            return downsample(series.range(start, end), start, bucket)
+
+    def forget(self, device_id):
+        with self.lock:
+            self.series.pop(device_id, None)
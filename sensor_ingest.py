@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+import socket
+import struct
+import sys
+import threading
+
+# Opção do Linux que anexa a cada datagrama o total de pacotes descartados
+# pelo kernel naquele socket (buffer cheio); nem toda versão do Python a expõe
+SO_RXQ_OVFL = getattr(socket, "SO_RXQ_OVFL", 40 if sys.platform.startswith("linux") else None)
+
+
+def enable_drop_tracking(sock):
+    """Liga SO_RXQ_OVFL no socket; retorna se o kernel vai informar os descartes"""
+    if SO_RXQ_OVFL is None:
+        return False
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+    except OSError:
+        return False
+    return True
+
+
+def receive_datagram(sock, bufsize, flags=0, track_drops=False):
+    """
+    Lê um datagrama; retorna (data, addr, drops), com drops sendo o total
+    de descartes do socket informado pelo kernel ou None se não veio
+    """
+    if not track_drops:
+        data, addr = sock.recvfrom(bufsize, flags)
+        return data, addr, None
+    data, ancdata, _, addr = sock.recvmsg(bufsize, socket.CMSG_SPACE(4), flags)
+    drops = None
+    for level, kind, payload in ancdata:
+        if level == socket.SOL_SOCKET and kind == SO_RXQ_OVFL and len(payload) >= 4:
+            drops = struct.unpack("I", payload[:4])[0]
+    return data, addr, drops
+
+
+class IngestWorker:
+    """Uma thread com seu próprio socket UDP na porta compartilhada"""
+    def __init__(self, ingestor, index):
+        self.ingestor = ingestor
+        self.index = index
+
+        # Contadores escritos só por esta thread; a leitura soma todos os workers
+        self.packets = 0
+        self.parse_errors = 0
+        self.wakeups = 0
+        self.kernel_drops = 0
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if ingestor.workers > 1:
+            # O kernel distribui os datagramas entre os sockets por hash do remetente
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, ingestor.rcvbuf)
+        self.track_drops = enable_drop_tracking(self.sock)
+        self.sock.bind((ingestor.host, ingestor.port))
+
+    def _receive(self, flags):
+        data, addr, drops = receive_datagram(self.sock, self.ingestor.max_datagram, flags, self.track_drops)
+        if drops is not None:
+            self.kernel_drops = drops
+        return data, addr
+
+    def _handle(self, data, addr):
+        self.packets += 1
+        try:
+            self.ingestor.handler(data, addr)
+        except Exception:
+            self.parse_errors += 1
+
+    def run(self):
+        batch_size = self.ingestor.batch_size
+        while True:
+            # Bloqueia até chegar algo e depois esvazia o que já está na fila
+            # do socket sem voltar a dormir, até batch_size datagramas
+            data, addr = self._receive(0)
+            self.wakeups += 1
+            self._handle(data, addr)
+            for _ in range(batch_size - 1):
+                try:
+                    data, addr = self._receive(socket.MSG_DONTWAIT)
+                except BlockingIOError:
+                    break
+                self._handle(data, addr)
+
+
+class SensorIngestor:
+    """
+    Recebe SensorData na porta dos sensores com vários workers.
+
+    Cada worker tem um socket próprio ligado à mesma porta via SO_REUSEPORT
+    e entrega cada datagrama a handler(data, addr), que precisa ser seguro
+    entre threads. stats() expõe pacotes, erros de parse e descartes do
+    kernel (SO_RXQ_OVFL) somados entre os workers.
+    """
+    def __init__(self, handler, port=50002, host='0.0.0.0', workers=1, batch_size=64,
+                 rcvbuf=4 * 1024 * 1024, max_datagram=2048):
+        self.handler = handler
+        self.port = port
+        self.host = host
+        self.workers = workers
+        self.batch_size = batch_size
+        self.rcvbuf = rcvbuf
+        self.max_datagram = max_datagram
+
+        self.worker_list = [IngestWorker(self, i) for i in range(workers)]
+
+    def start(self):
+        for worker in self.worker_list:
+            t = threading.Thread(target=worker.run, name=f"sensor-ingest-{worker.index}", daemon=True)
+            t.start()
+
+    def stats(self):
+        workers = self.worker_list
+        return {
+            "ingest_workers": len(workers),
+            "sensor_packets": sum(w.packets for w in workers),
+            "sensor_parse_errors": sum(w.parse_errors for w in workers),
+            "sensor_udp_drops": sum(w.kernel_drops for w in workers),
+            "sensor_wakeups": sum(w.wakeups for w in workers),
+        }
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+import mmap
+import os
+import struct
+import threading
+import time
+from bisect import bisect_right
+
+# Registro de tamanho fixo: instante de recebimento no gateway, timestamp
+# enviado pelo sensor, valor, device_id e sensor_type (preenchidos com \0)
+RECORD = struct.Struct('<dqd48s24s')
+# Entrada do índice esparso: instante de recebimento e número do registro
+INDEX_ENTRY = struct.Struct('<dQ')
+
+
+class Segment:
+    """Um arquivo de segmento (.log) com seu índice esparso (.idx)"""
+    def __init__(self, directory, name):
+        self.name = name
+        self.log_path = os.path.join(directory, name + ".log")
+        self.idx_path = os.path.join(directory, name + ".idx")
+        self.index_times = []    # instante de recebimento de cada entrada do índice
+        self.index_records = []  # número do registro correspondente
+        self.first_time = None
+        self.last_time = None
+        self.records = 0         # registros já gravados em disco (flush)
+
+    def size(self):
+        return self.records * RECORD.size
+
+    def load(self):
+        """Carrega um segmento existente a partir do .log e do .idx"""
+        self.records = os.path.getsize(self.log_path) // RECORD.size
+        if os.path.exists(self.idx_path):
+            with open(self.idx_path, "rb") as f:
+                data = f.read()
+            usable = len(data) - len(data) % INDEX_ENTRY.size
+            for recv_time, record in INDEX_ENTRY.iter_unpack(data[:usable]):
+                if record < self.records:
+                    self.index_times.append(recv_time)
+                    self.index_records.append(record)
+        if self.records:
+            with open(self.log_path, "rb") as f:
+                self.first_time = RECORD.unpack(f.read(RECORD.size))[0]
+                f.seek((self.records - 1) * RECORD.size)
+                self.last_time = RECORD.unpack(f.read(RECORD.size))[0]
+            if not self.index_records:
+                self.index_times.append(self.first_time)
+                self.index_records.append(0)
+
+    def remove(self):
+        for path in (self.log_path, self.idx_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class SensorLog:
+    """
+    Log em disco, somente-anexação, de todos os SensorData recebidos.
+
+    Cada segmento guarda registros de tamanho fixo (RECORD) em ordem de
+    recebimento, com uma entrada no índice esparso a cada index_every
+    registros. Consultas por intervalo fazem busca binária no índice e
+    percorrem o segmento via mmap, sem ler o arquivo para a memória.
+    Segmentos giram por tamanho ou idade e são apagados por retenção.
+    append() só escreve no buffer: no gateway async ele roda no event
+    loop e não pode esperar o disco. Uma thread faz o flush a cada
+    flush_interval (a última leitura de um sensor que ficou quieto não
+    fica presa no buffer) e o fsync depois de soltar o lock, em cópias
+    dos descritores, então a ingestão nunca espera um fsync.
+    """
+    def __init__(self, directory, segment_max_bytes=16 * 1024 * 1024, segment_max_age=3600,
+                 retention_seconds=7 * 24 * 3600, max_total_bytes=512 * 1024 * 1024,
+                 index_every=128, flush_interval=1.0):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age = segment_max_age
+        self.retention_seconds = retention_seconds
+        self.max_total_bytes = max_total_bytes
+        self.index_every = index_every
+        self.flush_interval = flush_interval
+
+        self.lock = threading.Lock()
+        self.segments = []  # do mais antigo para o mais novo; o último é o ativo
+        self.log_file = None
+        self.idx_file = None
+        self.pending = 0    # registros escritos no buffer mas ainda sem flush
+        self.needs_sync = False  # segmento ativo com flush ainda sem fsync
+        self.unsynced = []  # descritores (dup) de segmentos fechados aguardando fsync
+
+        os.makedirs(directory, exist_ok=True)
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(".log"):
+                segment = Segment(directory, filename[:-4])
+                segment.load()
+                if segment.records:
+                    self.segments.append(segment)
+                else:
+                    segment.remove()
+
+        threading.Thread(target=self.flush_loop, name="sensor-log-flush", daemon=True).start()
+
+    def _open_segment(self, now):
+        self._close_active()
+        segment = Segment(self.directory, f"segment_{int(now * 1000):016d}")
+        self.log_file = open(segment.log_path, "ab")
+        self.idx_file = open(segment.idx_path, "ab")
+        self.segments.append(segment)
+        self._enforce_retention(now)
+
+    def _close_active(self):
+        if self.log_file is not None:
+            self._flush()
+            # O fsync do segmento que sai fica para a thread de flush
+            self.unsynced.extend(os.dup(f.fileno()) for f in (self.log_file, self.idx_file))
+            self.needs_sync = False
+            self.log_file.close()
+            self.idx_file.close()
+            self.log_file = None
+            self.idx_file = None
+
+    def _flush(self):
+        """Passa o buffer para o arquivo (visível para query); chamado com o lock"""
+        self.log_file.flush()
+        self.idx_file.flush()
+        self.segments[-1].records += self.pending
+        self.pending = 0
+        self.needs_sync = True
+
+    def _take_unsynced(self):
+        """Descritores a sincronizar fora do lock; chamado com o lock"""
+        fds, self.unsynced = self.unsynced, []
+        if self.needs_sync and self.log_file is not None:
+            fds += [os.dup(self.log_file.fileno()), os.dup(self.idx_file.fileno())]
+            self.needs_sync = False
+        return fds
+
+    @staticmethod
+    def _sync(fds):
+        for fd in fds:
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def append(self, recv_time, timestamp, value, device_id, sensor_type):
+        record = RECORD.pack(recv_time, int(timestamp), value,
+                             device_id.encode()[:48], sensor_type.encode()[:24])
+        with self.lock:
+            active = self.segments[-1] if self.log_file is not None else None
+            if (active is None
+                    or (active.records + self.pending) * RECORD.size >= self.segment_max_bytes
+                    or recv_time - active.first_time >= self.segment_max_age):
+                self._open_segment(recv_time)
+                active = self.segments[-1]
+
+            number = active.records + self.pending
+            if active.first_time is None:
+                active.first_time = recv_time
+            active.last_time = recv_time
+            if number % self.index_every == 0:
+                entry = INDEX_ENTRY.pack(recv_time, number)
+                self.idx_file.write(entry)
+                active.index_times.append(recv_time)
+                active.index_records.append(number)
+
+            self.log_file.write(record)
+            self.pending += 1
+
+    def flush(self):
+        """Flush e fsync de tudo o que já foi anexado"""
+        with self.lock:
+            if self.log_file is not None and self.pending:
+                self._flush()
+            fds = self._take_unsynced()
+        self._sync(fds)
+
+    def flush_loop(self):
+        """Flush periódico do buffer, com o fsync fora do lock"""
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"[SensorLog] Error flushing log: {e}")
+
+    def close(self):
+        with self.lock:
+            self._close_active()
+            fds = self._take_unsynced()
+        self._sync(fds)
+
+    def _enforce_retention(self, now):
+        total = sum(segment.size() for segment in self.segments)
+        # Nunca apaga o segmento ativo (o último)
+        while len(self.segments) > 1:
+            oldest = self.segments[0]
+            expired = oldest.last_time is not None and now - oldest.last_time > self.retention_seconds
+            if not expired and total <= self.max_total_bytes:
+                break
+            total -= oldest.size()
+            oldest.remove()
+            self.segments.pop(0)
+
+    def enforce_retention(self):
+        with self.lock:
+            self._enforce_retention(time.time())
+
+    def query(self, device_id, start, end):
+        """
+        Retorna [(instante de recebimento, valor), ...] das leituras de
+        device_id recebidas entre start e end, em ordem cronológica.
+        Só enxerga o que já passou por flush (no máximo flush_interval atrás).
+        """
+        key = device_id.encode()[:48].ljust(48, b'\0')
+        with self.lock:
+            segments = [(segment, segment.records) for segment in self.segments
+                        if segment.records and segment.first_time <= end and segment.last_time >= start]
+
+        points = []
+        for segment, records in segments:
+            # Primeira entrada do índice que pode conter start
+            slot = max(bisect_right(segment.index_times, start) - 1, 0)
+            first = segment.index_records[slot] if segment.index_records else 0
+
+            try:
+                with open(segment.log_path, "rb") as f:
+                    mm = mmap.mmap(f.fileno(), records * RECORD.size, access=mmap.ACCESS_READ)
+            except FileNotFoundError:
+                continue  # apagado pela retenção depois de listado: já expirou
+            view = memoryview(mm)[first * RECORD.size:]
+            records_iter = RECORD.iter_unpack(view)
+            try:
+                for recv_time, _, value, record_device, _ in records_iter:
+                    if recv_time > end:
+                        break
+                    if recv_time >= start and record_device == key:
+                        points.append((recv_time, value))
+            finally:
+                # O iterador e a view seguram o buffer do mmap; precisam
+                # ser liberados antes de fechá-lo
+                del records_iter
+                view.release()
+                mm.close()
+        return points
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+import bisect
+import hashlib
+import json
+import threading
+import time
+import device_pb2
+from client import SmartHomeClient
+
+
+def shard_hash(key):
+    """Posição de uma chave no anel (64 bits do md5, estável entre processos)"""
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], byteorder='big')
+
+
+class Shard:
+    """Um processo gateway e os endereços em que atende clientes e devices"""
+    def __init__(self, shard_id, ip, tcp_port=6000, announce_port=50001, sensor_port=50002):
+        self.shard_id = shard_id
+        self.ip = ip
+        self.tcp_port = tcp_port
+        self.announce_port = announce_port
+        self.sensor_port = sensor_port
+
+    def to_dict(self):
+        """Formato enviado aos devices no GATEWAY_DISCOVERY"""
+        return {"id": self.shard_id, "ip": self.ip, "tcp_port": self.tcp_port,
+                "announce_port": self.announce_port, "sensor_port": self.sensor_port}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["id"], data["ip"], data.get("tcp_port", 6000),
+                   data.get("announce_port", 50001), data.get("sensor_port", 50002))
+
+    def fill_proto(self, info):
+        info.shard_id = self.shard_id
+        info.ip = self.ip
+        info.tcp_port = self.tcp_port
+        info.announce_port = self.announce_port
+        info.sensor_port = self.sensor_port
+
+    @classmethod
+    def from_proto(cls, info):
+        return cls(info.shard_id, info.ip, info.tcp_port, info.announce_port, info.sensor_port)
+
+
+class HashRing:
+    """
+    Anel de hashing consistente: cada shard ocupa vnodes posições e o dono
+    de uma chave é o primeiro shard após hash(chave). Quando um shard entra
+    ou sai, só as chaves vizinhas às suas posições mudam de dono.
+    """
+    def __init__(self, shards, vnodes=64):
+        self.shards = list(shards)
+        points = sorted((shard_hash(f"{shard.shard_id}#{i}"), index)
+                        for index, shard in enumerate(self.shards) for i in range(vnodes))
+        self.keys = [point for point, _ in points]
+        self.owners = [self.shards[index] for _, index in points]
+
+    def __len__(self):
+        return len(self.shards)
+
+    def owner(self, key):
+        i = bisect.bisect(self.keys, shard_hash(key))
+        return self.owners[i % len(self.owners)]
+
+
+def gateway_endpoint(discovery_msg, addr, device_id):
+    """
+    Chamado pelos devices ao receber GATEWAY_DISCOVERY: retorna
+    (ip, porta de anúncio, porta de SensorData) do gateway dono de
+    device_id. Sem lista de shards (gateway único), usa o remetente.
+    """
+    params = json.loads(discovery_msg.parameters) if discovery_msg.parameters else {}
+    shards = params.get("shards")
+    if not shards:
+        return addr[0], 50001, 50002
+    owner = HashRing([Shard.from_dict(shard) for shard in shards]).owner(device_id)
+    return owner.ip, owner.announce_port, owner.sensor_port
+
+
+class ShardMembership:
+    """
+    Conjunto de shards vivos visto por um gateway.
+
+    A cada HEARTBEAT_INTERVAL o shard manda SHARD_HELLO para os peers
+    conhecidos e para as sementes ainda não contatadas; a resposta traz a
+    lista de shards do peer, e os que ainda não conhecemos são contatados
+    na rodada seguinte. Só entra no anel quem respondeu diretamente, e sai
+    quem ficar PEER_TIMEOUT segundos sem responder. on_change(ring) é
+    chamado a cada mudança do anel.
+    """
+    HEARTBEAT_INTERVAL = 2
+    PEER_TIMEOUT = 6
+    REQUEST_TIMEOUT = 5
+    # Espera antes de tentar de novo uma semente fora do ar (um shard que
+    # volta se anuncia sozinho às suas sementes)
+    SEED_RETRY_INTERVAL = 30
+
+    def __init__(self, local, seeds=(), on_change=None):
+        self.local = local
+        self.seeds = list(seeds)  # (ip, tcp_port) de outros gateways
+        self.on_change = on_change
+
+        self.lock = threading.Lock()
+        self.peers = {}        # shard_id -> Shard que respondeu diretamente
+        self.last_seen = {}    # shard_id -> instante da última resposta
+        self.candidates = {}   # shard_id -> Shard conhecido por terceiros
+        self.clients = {}      # (ip, tcp_port) -> SmartHomeClient
+        self.seed_retry_at = {}  # (ip, tcp_port) -> próxima tentativa de uma semente
+        self.ring = HashRing([local])
+
+    def shards(self):
+        return list(self.ring.shards)
+
+    def owner(self, device_id):
+        return self.ring.owner(device_id)
+
+    def is_local(self, device_id):
+        return self.ring.owner(device_id) is self.local
+
+    def _client(self, addr):
+        with self.lock:
+            client = self.clients.get(addr)
+            if client is None:
+                # Entre shards as respostas vão sem compressão; repasses mantêm o
+                # trace_id do cliente
+                client = SmartHomeClient(addr[0], addr[1], timeout=self.REQUEST_TIMEOUT, compression=False,
+                                         trace=False)
+                self.clients[addr] = client
+            return client
+
+    def send(self, addr, request, timeout=None):
+        """
+        Envia uma ClientRequest a outro gateway e espera o ClientResponse.
+        A conexão com o peer é compartilhada por todas as threads: quem
+        desiste só descarta a própria requisição e a conexão continua
+        aberta para os outros repasses (uma conexão que cai de fato é
+        detectada e refeita pelo cliente).
+        """
+        client = self._client(addr)
+        try:
+            return client.send_request_async(request).result(timeout=timeout or self.REQUEST_TIMEOUT)
+        except Exception:
+            # Sem a resposta a tempo: o Future não fica esquecido em pending
+            client.forget(request.request_id)
+            raise
+
+    def forward(self, shard, request, timeout=None):
+        """
+        Repassa uma requisição de cliente ao shard dono, marcada como
+        shard_local para não ser roteada de novo
+        """
+        forwarded = device_pb2.ClientRequest()
+        forwarded.CopyFrom(request)
+        forwarded.request_id = 0
+        forwarded.shard_local = True
+        forwarded.ClearField("accept_encodings")
+        return self.send((shard.ip, shard.tcp_port), forwarded, timeout)
+
+    def hello_request(self):
+        request = device_pb2.ClientRequest()
+        request.command = "SHARD_HELLO"
+        for shard in self.shards():
+            shard.fill_proto(request.shards.add())
+        return request
+
+    def handle_hello(self, request, response):
+        """Atende um SHARD_HELLO: o remetente (primeiro da lista) está vivo"""
+        if request.shards:
+            self._mark_alive(Shard.from_proto(request.shards[0]))
+            self._learn(request.shards[1:])
+        for shard in self.shards():
+            shard.fill_proto(response.shards.add())
+
+    def _mark_alive(self, shard):
+        if shard.shard_id == self.local.shard_id:
+            return
+        with self.lock:
+            previous = self.peers.get(shard.shard_id)
+            # Um shard reiniciado pode voltar com outros endereços
+            joined = previous is None or previous.to_dict() != shard.to_dict()
+            self.peers[shard.shard_id] = shard
+            self.last_seen[shard.shard_id] = time.time()
+            self.candidates.pop(shard.shard_id, None)
+        if joined:
+            print(f"[Gateway] Shard joined: {shard.shard_id} ({shard.ip}:{shard.tcp_port})")
+            self._rebuild()
+
+    def _learn(self, infos):
+        with self.lock:
+            for info in infos:
+                if info.shard_id != self.local.shard_id and info.shard_id not in self.peers:
+                    self.candidates[info.shard_id] = Shard.from_proto(info)
+
+    def _rebuild(self):
+        with self.lock:
+            shards = [self.local] + sorted(self.peers.values(), key=lambda shard: shard.shard_id)
+            self.ring = HashRing(shards)
+            ring = self.ring
+        if self.on_change is not None:
+            self.on_change(ring)
+
+    def heartbeat(self):
+        with self.lock:
+            known = {(shard.ip, shard.tcp_port) for shard in self.peers.values()}
+            targets = known | {(shard.ip, shard.tcp_port) for shard in self.candidates.values()}
+            self.candidates = {}
+        now = time.time()
+        seeds = {addr for addr in self.seeds
+                 if addr not in known and self.seed_retry_at.get(addr, 0) <= now}
+        targets |= seeds
+
+        request = self.hello_request()
+        for addr in targets:
+            try:
+                response = self.send(addr, request, timeout=self.HEARTBEAT_INTERVAL)
+            except Exception:
+                if addr in seeds:
+                    self.seed_retry_at[addr] = now + self.SEED_RETRY_INTERVAL
+                continue
+            if response.shards:
+                self._mark_alive(Shard.from_proto(response.shards[0]))
+                self._learn(response.shards[1:])
+
+        now = time.time()
+        with self.lock:
+            gone = [shard_id for shard_id, seen in self.last_seen.items() if now - seen > self.PEER_TIMEOUT]
+            for shard_id in gone:
+                self.peers.pop(shard_id, None)
+                self.last_seen.pop(shard_id, None)
+        for shard_id in gone:
+            print(f"[Gateway] Shard left: {shard_id}")
+        if gone:
+            self._rebuild()
+
+    def run(self):
+        while True:
+            self.heartbeat()
+            time.sleep(self.HEARTBEAT_INTERVAL)
+
+    def start(self):
+        threading.Thread(target=self.run, name="shard-membership", daemon=True).start()
@@ -5,9 +5,14 @@ import threading
 import time
 import json
 import device_pb2
+from sharding import gateway_endpoint
+from state_bus import HEARTBEAT_INTERVAL, StateBus
+from transport import FrameReader, send_frame
+from protocol import command_params, negotiate, set_state, typed_state
+from tracing import span, traced_command
 
 class SmartLamp:
-    def __init__(self):
+    def __init__(self, networking=True, bus=None, ip=None):
         # Configurações de rede
         self.MCAST_GRP = '224.0.0.1'
         self.MCAST_PORT = 50000
@@ -16,6 +21,11 @@ class SmartLamp:
 
         # Guardar IP do gateway quando receber GATEWAY_DISCOVERY
         self.gateway_ip = None
+        # Portas desse gateway; com vários gateways (shards), as do dono deste device
+        self.gateway_announce_port = 50001
+        self.gateway_sensor_port = 50002
+        # Versão do protocolo combinada com o gateway no GATEWAY_DISCOVERY
+        self.protocol_version = 1
 
         # Potência padrão
         self.power = 10
@@ -29,16 +39,41 @@ class SmartLamp:
             "brightness": 0  # 0-100
         }
 
-        # Atualizando files do sensor de luminosidade
-        with open("files/brightness.txt", "w") as f:
-            f.write("0")
-        with open("files/lamp_power.txt", "w") as f:
-            f.write("0")
-
-        # Inicializar sockets
-        self.init_tcp_server()
-        self.init_multicast_listener()
-        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # Estado lido pelos sensores (luminosidade e potência), publicado no barramento
+        # em memória compartilhada (o device_host passa o mesmo bus a todos os devices)
+        self.bus = bus or StateBus()
+        # IP anunciado ao gateway, parte do device_id que identifica o registro
+        # no barramento (o device_host passa o IP do host)
+        self.ip = ip or self.get_local_ip()
+
+        # Inicializar sockets (sem networking, quem cuida da rede é o device_host.py)
+        if networking:
+            self.init_tcp_server()
+            self.init_multicast_listener()
+            self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            # Com a porta TCP definida o device_id já é o definitivo; no
+            # device_host o primeiro publish vem depois de abrir a porta
+            self.publish_state()
+
+    def power_draw(self):
+        """Potência consumida agora (W)"""
+        return self.power if self.state["power"] == "ON" else 0
+
+    @property
+    def device_id(self):
+        """Identificador do device no gateway e no barramento de estado"""
+        return f"{self.device_type}_{self.ip}_{self.TCP_PORT}"
+
+    def publish_state(self):
+        """Publica potência e luminosidade no barramento de estado (renova o heartbeat)"""
+        self.bus.publish("smart_lamp", self.device_id, power=self.power_draw(),
+                         brightness=int(self.state["brightness"]))
+
+    def keep_alive(self):
+        """Republica o estado a cada HEARTBEAT_INTERVAL: sem heartbeat os sensores consideram o device parado"""
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            self.publish_state()
 
     def init_tcp_server(self):
         """Inicializa o servidor TCP para comandos"""
@@ -72,27 +107,19 @@ class SmartLamp:
         """Processa comandos recebidos"""
         try:
             command = command_msg.command
-            params = json.loads(command_msg.parameters) if command_msg.parameters else {}
+            params = command_params(command_msg)
 
             response = device_pb2.DeviceResponse()
 
             if command == "ON":
                 self.state["power"] = "ON"
                 self.state["brightness"] = 50  # 0-100
-                with open("files/brightness.txt", "w") as f:
-                    f.write(str(self.brightness))
-                with open("files/lamp_power.txt", "w") as f:
-                    f.write(str(self.power))
                 response.success = True
                 response.message = "Lamp turned on"
 
             elif command == "OFF":
                 self.state["power"] = "OFF"
                 self.state["brightness"] = 0  # 0-100
-                with open("files/brightness.txt", "w") as f:
-                    f.write("0")
-                with open("files/lamp_power.txt", "w") as f:
-                    f.write("0")
                 response.success = True
                 response.message = "Lamp turned off"
 
@@ -105,10 +132,6 @@ class SmartLamp:
                         else:
                             self.state["power"] = "OFF"
                         self.state["brightness"] = brightness
-                        with open("files/brightness.txt", "w") as f:
-                            f.write(str(brightness))
-                        with open("files/lamp_power.txt", "w") as f:
-                            f.write(str(self.power))
                         response.success = True
                         response.message = f"Brightness set to {brightness}%"
                     else:
@@ -126,8 +149,12 @@ class SmartLamp:
                 response.success = False
                 response.message = "Unknown command"
 
+            # Sensores leem o novo estado do barramento
+            with span("device.publish_state"):
+                self.publish_state()
+
             # Sempre atualiza o status e attributes
-            response.status = json.dumps(self.state)
+            set_state(response, self.device_type, self.state, self.protocol_version)
             response.attributes["power"] = self.state["power"]
             response.attributes["brightness"] = str(self.state["brightness"])
 
@@ -137,23 +164,18 @@ class SmartLamp:
             response = device_pb2.DeviceResponse()
             response.success = False
             response.message = f"Error: {str(e)}"
-            response.status = json.dumps(self.state)
+            set_state(response, self.device_type, self.state, self.protocol_version)
             return response
 
     def handle_tcp_client(self, client_socket, addr):
         """Gerencia conexões TCP"""
         try:
+            # Um buffer reaproveitado por conexão; frames chegam inteiros mesmo
+            # se o TCP entregar a mensagem em pedaços
+            reader = FrameReader(client_socket)
             while True:
-                # Recebe tamanho da mensagem (4 bytes)
-                size_data = client_socket.recv(4)
-                if not size_data:
-                    break
-
-                msg_size = int.from_bytes(size_data, byteorder='big')
-
-                # Recebe a mensagem do tamanho especificado
-                data = client_socket.recv(msg_size)
-                if not data:
+                data = reader.read_frame()
+                if data is None:
                     break
 
                 # Processa comando
@@ -161,18 +183,37 @@ class SmartLamp:
                 command_msg.ParseFromString(data)
 
                 # Gera resposta
-                response = self.handle_command(command_msg)
+                response = traced_command(command_msg, self.handle_command, f"device:{self.device_type}")
 
                 # Envia resposta
                 response_data = response.SerializeToString()
-                client_socket.send(len(response_data).to_bytes(4, byteorder='big'))
-                client_socket.send(response_data)
+                send_frame(client_socket, response_data)
 
         except Exception as e:
             print(f"Error handling TCP client: {e}")
         finally:
             client_socket.close()
 
+    def discovery_response(self, msg, addr, ip):
+        """
+        Resposta a um GATEWAY_DISCOVERY vindo de addr: combina a versão do
+        protocolo, guarda o gateway dono deste device e retorna
+        (DeviceDiscovery serializado, endereço de destino)
+        """
+        discovery_msg = device_pb2.DeviceDiscovery()
+        discovery_msg.device_type = self.device_type
+        discovery_msg.ip = ip
+        discovery_msg.port = self.TCP_PORT
+        self.protocol_version = negotiate(msg.protocol_version)
+        discovery_msg.protocol_version = self.protocol_version
+        set_state(discovery_msg, self.device_type, self.state, self.protocol_version)
+
+        # Anúncios e SensorData vão para o gateway dono deste device_id
+        device_id = f"{self.device_type}_{discovery_msg.ip}_{discovery_msg.port}"
+        self.gateway_ip, self.gateway_announce_port, self.gateway_sensor_port = \
+            gateway_endpoint(msg, addr, device_id)
+        return discovery_msg.SerializeToString(), (self.gateway_ip, self.gateway_announce_port)
+
     def listen_for_discovery(self):
         """Escuta por mensagens de descoberta (multicast)"""
         while True:
@@ -180,41 +221,45 @@ class SmartLamp:
             msg = device_pb2.DeviceCommand()
             msg.ParseFromString(data)
             if msg.command == "GATEWAY_DISCOVERY":
-                # Salva IP do Gateway para envio periódico
-                self.gateway_ip = addr[0]
-
-                # Prepara resposta
-                discovery_msg = device_pb2.DeviceDiscovery()
-                discovery_msg.device_type = self.device_type
-                discovery_msg.ip = self.get_local_ip()
-                discovery_msg.port = self.TCP_PORT
-                discovery_msg.status = json.dumps(self.state)
-
+                data, target = self.discovery_response(msg, addr, self.get_local_ip())
                 # Envia resposta unicast
                 response_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                response_socket.sendto(discovery_msg.SerializeToString(), (addr[0], 50001))
+                response_socket.sendto(data, target)
                 response_socket.close()
 
+    def update_interval(self):
+        """Segundos entre dois envios do estado ao gateway"""
+        return 15
+
+    def tick(self, ip):
+        """SensorData serializado com o estado atual, ou None se ainda não há gateway"""
+        if self.gateway_ip is None:
+            return None
+        sensor_data = device_pb2.SensorData()
+        sensor_data.device_id = f"{self.device_type}_{ip}_{self.TCP_PORT}"
+        sensor_data.sensor_type = "lamp_state"
+        # Podemos enviar o brilho como valor numérico
+        sensor_data.value = float(self.state.get("brightness", 50))
+        if self.protocol_version >= 2:
+            sensor_data.state.CopyFrom(typed_state(self.device_type, self.state))
+        else:
+            # Protocolo 1: o resto do estado vai em JSON dentro de unit
+            sensor_data.unit = json.dumps(self.state)
+        sensor_data.timestamp = int(time.time())
+        return sensor_data.SerializeToString()
+
     def periodically_send_state(self):
         """Envia periodicamente o estado via UDP para o gateway"""
         while True:
             if self.gateway_ip is not None:
                 try:
-                    sensor_data = device_pb2.SensorData()
-                    sensor_data.device_id = f"{self.device_type}_{self.get_local_ip()}_{self.TCP_PORT}"
-                    sensor_data.sensor_type = "lamp_state"
-                    # Podemos enviar o brilho como valor numérico
-                    sensor_data.value = float(self.state.get("brightness", 50))
-                    sensor_data.unit = json.dumps(self.state)  # "indicando" que o resto do estado vem em JSON
-                    sensor_data.timestamp = int(time.time())
-
-                    # Envia pro gateway na porta 50002
-                    data = sensor_data.SerializeToString()
-                    self.udp_socket.sendto(data, (self.gateway_ip, 50002))
+                    data = self.tick(self.get_local_ip())
+                    # Envia pro gateway na porta de SensorData
+                    self.udp_socket.sendto(data, (self.gateway_ip, self.gateway_sensor_port))
                 except Exception as e:
                     print(f"[Lamp] Error sending periodic state: {e}")
 
-            time.sleep(15)
+            time.sleep(self.update_interval())
 
     def run(self):
         """Inicia o dispositivo"""
@@ -226,6 +271,9 @@ class SmartLamp:
         periodic_thread = threading.Thread(target=self.periodically_send_state, daemon=True)
         periodic_thread.start()
 
+        heartbeat_thread = threading.Thread(target=self.keep_alive, daemon=True)
+        heartbeat_thread.start()
+
         print(f"Smart Lamp running on port {self.TCP_PORT}")
 
         # Aceita conexões TCP
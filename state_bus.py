@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+import fcntl
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+# Região de memória compartilhada (arquivo mapeado) onde os atuadores
+# publicam o estado que os sensores usam na simulação
+BUS_PATH = "files/state_bus"
+BUS_MAGIC = b"SBUS2\0\0\0"
+
+# Atuadores republicam o estado a cada HEARTBEAT_INTERVAL; um registro sem
+# heartbeat há mais de STALE_AFTER é de um device que não está rodando, e
+# depois de RECLAIM_AFTER pode ser reaproveitado por outro device
+HEARTBEAT_INTERVAL = 1.0
+STALE_AFTER = 3.0
+RECLAIM_AFTER = 60.0
+
+# Leituras que pegam uma escrita no meio são refeitas; se o escritor morreu
+# no meio de uma escrita o registro fica inválido até o próximo publish
+READ_RETRIES = 100
+
+# Registros por tipo de device e tamanho fixo de cada um
+CAPACITY = 1024
+RECORD_SIZE = 128
+HEADER_SIZE = 64
+
+SEQ = struct.Struct("<Q")
+USED = struct.Struct("<Q")
+DEVICE_ID = struct.Struct("<Qd48s")  # sequência, heartbeat, device_id
+
+# Uma região por tipo: (índice da região, formato dos campos, nomes). Cada
+# registro começa com um contador de sequência (ímpar = escrita em
+# andamento), o heartbeat (epoch) e o device_id, seguidos dos campos.
+SLOTS = {
+    # potência consumida (W), luminosidade (%)
+    "smart_lamp": (0, struct.Struct("<Qd48sii"), ("power", "brightness")),
+    # potência consumida (W), temperatura alvo, modo, velocidade do ventilador
+    "air_conditioner": (1, struct.Struct("<Qd48sid8s8s"), ("power", "temperature", "mode", "fan_speed")),
+    # temperatura simulada do ambiente de cada sensor, para conferência externa
+    "environment": (2, struct.Struct("<Qd48sd"), ("temperature",)),
+}
+
+REGION_SIZE = HEADER_SIZE + CAPACITY * RECORD_SIZE
+BUS_SIZE = HEADER_SIZE + len(SLOTS) * REGION_SIZE
+
+
+def _region(slot):
+    """Offset do cabeçalho da região do tipo (contador de registros em uso)"""
+    return HEADER_SIZE + SLOTS[slot][0] * REGION_SIZE
+
+
+def _record(slot, index):
+    return _region(slot) + HEADER_SIZE + index * RECORD_SIZE
+
+
+class StateBus:
+    """
+    Estado dos devices em memória compartilhada, um registro com seqlock
+    por device_id.
+
+    Cada tipo tem um diretório de registros: o cabeçalho da região conta
+    quantos já foram usados e cada registro guarda o device_id do dono.
+    Um device reserva o seu registro uma vez, com um flock no arquivo
+    (entre processos) e o lock do objeto (entre threads); depois disso só
+    o dono escreve nele, incrementando a sequência antes e depois de
+    escrever. Leitores não tomam lock: leem a sequência, os campos e a
+    sequência de novo, e repetem se ela mudou ou estava ímpar. A
+    vivacidade vem do heartbeat gravado em cada publish.
+    """
+    def __init__(self, path=BUS_PATH):
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self.fd).st_size < BUS_SIZE:
+                os.ftruncate(self.fd, BUS_SIZE)
+            self.map = mmap.mmap(self.fd, BUS_SIZE)
+            if self.map[:len(BUS_MAGIC)] != BUS_MAGIC:
+                # Arquivo novo ou de um formato antigo: começa vazio
+                self.map[:] = bytes(BUS_SIZE)
+                self.map[:len(BUS_MAGIC)] = BUS_MAGIC
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.lock = threading.Lock()
+        self.indexes = {}  # (tipo, device_id) -> índice do registro deste processo
+
+    def _used(self, slot):
+        return min(USED.unpack_from(self.map, _region(slot))[0], CAPACITY)
+
+    def _owner(self, slot, index):
+        _, heartbeat, device_id = DEVICE_ID.unpack_from(self.map, _record(slot, index))
+        return device_id.rstrip(b"\0"), heartbeat
+
+    def _claim(self, slot, key):
+        """Índice do registro de key: o que já é dele, um abandonado ou um novo"""
+        reusable = None
+        now = time.time()
+        for index in range(self._used(slot)):
+            owner, heartbeat = self._owner(slot, index)
+            if owner == key:
+                return index
+            if reusable is None and (not owner or now - heartbeat > RECLAIM_AFTER):
+                reusable = index
+        if reusable is not None:
+            return reusable
+        used = self._used(slot)
+        if used >= CAPACITY:
+            raise RuntimeError(f"State bus full: more than {CAPACITY} {slot} devices")
+        USED.pack_into(self.map, _region(slot), used + 1)
+        return used
+
+    def _write(self, slot, index, key, packed):
+        offset = _record(slot, index)
+        layout = SLOTS[slot][1]
+        seq = SEQ.unpack_from(self.map, offset)[0]
+        if seq % 2:
+            seq += 1  # escritor anterior morreu no meio de uma escrita
+        SEQ.pack_into(self.map, offset, seq + 1)
+        layout.pack_into(self.map, offset, seq + 1, time.time(), key, *packed)
+        SEQ.pack_into(self.map, offset, seq + 2)
+
+    def publish(self, slot, device_id, **values):
+        """Grava os campos do registro de device_id e renova o heartbeat"""
+        fields = SLOTS[slot][2]
+        packed = []
+        for field in fields:
+            value = values[field]
+            packed.append(value.encode() if isinstance(value, str) else value)
+        key = device_id.encode()
+        with self.lock:
+            index = self.indexes.get((slot, device_id))
+            if index is not None and self._owner(slot, index)[0] == key:
+                self._write(slot, index, key, packed)
+                return
+            # Primeiro publish (ou o registro foi reaproveitado por outro
+            # device depois de um longo silêncio): reserva entre processos
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                index = self._claim(slot, key)
+                self._write(slot, index, key, packed)
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            self.indexes[(slot, device_id)] = index
+
+    def _read_record(self, slot, index, max_age, now):
+        offset = _record(slot, index)
+        layout, fields = SLOTS[slot][1:]
+        for _ in range(READ_RETRIES):
+            before = SEQ.unpack_from(self.map, offset)[0]
+            if before % 2:
+                continue
+            _, heartbeat, device_id, *values = layout.unpack_from(self.map, offset)
+            if SEQ.unpack_from(self.map, offset)[0] != before:
+                continue
+            if not before or not device_id.strip(b"\0") or abs(now - heartbeat) > max_age:
+                return None
+            return device_id.rstrip(b"\0").decode(), {
+                field: value.rstrip(b"\0").decode() if isinstance(value, bytes) else value
+                for field, value in zip(fields, values)}
+        return None
+
+    def read(self, slot, max_age=STALE_AFTER):
+        """
+        Campos de cada device do tipo, como {device_id: dicionário}, só dos
+        que publicaram há até max_age e puderam ser lidos de forma consistente
+        """
+        now = time.time()
+        states = {}
+        for index in range(self._used(slot)):
+            record = self._read_record(slot, index, max_age, now)
+            if record is not None:
+                states[record[0]] = record[1]
+        return states
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+
+if __name__ == "__main__":
+    # Mostra o conteúdo atual do barramento
+    bus = StateBus(sys.argv[1] if len(sys.argv) > 1 else BUS_PATH)
+    for slot in SLOTS:
+        states = bus.read(slot)
+        print(f"{slot}: {len(states) or 'not running'}")
+        for device_id, state in sorted(states.items()):
+            print(f"  {device_id}: {state}")
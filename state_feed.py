@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+import json
+import socket
+import struct
+import threading
+import time
+import device_pb2
+from google.protobuf.message import DecodeError
+from protocol import state_to_dict, typed_state
+from state_bus import STALE_AFTER
+
+# Feed multicast com o estado de lâmpadas e ACs, republicado pelo gateway
+FEED_GRP = '224.0.0.1'
+FEED_PORT = 50003
+FEED_TTL = 2
+
+# Mudanças que chegam dentro desse intervalo saem juntas num só datagrama
+FEED_BATCH_DELAY = 0.05
+# A cada FEED_HEARTBEAT o gateway manda o estado de todos os atuadores:
+# é o heartbeat dos atuadores de outros hosts para os sensores
+FEED_HEARTBEAT = 1.0
+# Datagramas maiores que isso são divididos (abaixo do MTU, sem fragmentar)
+MAX_DATAGRAM = 1400
+
+ACTUATOR_TYPES = ("smart_lamp", "air_conditioner")
+# Potência (W) de um atuador ligado, a mesma de smart_lamp.py e air_conditioner.py
+RATED_POWER = {"smart_lamp": 10, "air_conditioner": 1000}
+
+
+def actuator_state(device_info):
+    """ActuatorState de um device_info do registro, ou None se o estado ainda não é conhecido"""
+    message = device_pb2.ActuatorState()
+    message.device_id = device_info['id']
+    message.device_type = device_info['type']
+    message.version = device_info.get('version', 0)
+    if device_info.get('state'):
+        message.state.ParseFromString(device_info['state'])
+    else:
+        try:
+            state = json.loads(device_info.get('status') or "{}")
+            message.state.CopyFrom(typed_state(device_info['type'], state))
+        except (ValueError, KeyError):
+            return None
+    return message
+
+
+class StateFeedPublisher:
+    """
+    Gateway: republica no feed multicast o estado das lâmpadas e ACs do
+    registro. Cada mudança no registro (resposta de comando, SensorData
+    ou anúncio) sai em até FEED_BATCH_DELAY, e a cada FEED_HEARTBEAT sai
+    o estado de todos.
+    """
+    def __init__(self, registry, port=FEED_PORT, group=FEED_GRP):
+        self.registry = registry
+        self.target = (group, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, FEED_TTL)
+
+        self.dirty = set()  # device_ids alterados desde o último envio
+        self.cond = threading.Condition()
+        self.datagrams = 0
+
+        registry.add_listener(self.notify)
+        threading.Thread(target=self.publish_loop, name="state-feed", daemon=True).start()
+
+    def notify(self, device_id):
+        with self.cond:
+            self.dirty.add(device_id)
+            self.cond.notify()
+
+    def publish_loop(self):
+        next_heartbeat = time.monotonic()
+        while True:
+            with self.cond:
+                if not self.dirty:
+                    self.cond.wait(max(0.0, next_heartbeat - time.monotonic()))
+
+            if time.monotonic() >= next_heartbeat:
+                with self.cond:
+                    self.dirty.clear()
+                devices = self.registry.values()
+                next_heartbeat = time.monotonic() + FEED_HEARTBEAT
+            else:
+                # Espera um pouco para juntar as mudanças seguintes
+                time.sleep(FEED_BATCH_DELAY)
+                with self.cond:
+                    dirty, self.dirty = self.dirty, set()
+                devices = [device for device in map(self.registry.get, dirty) if device is not None]
+
+            try:
+                self.publish(devices)
+            except OSError as e:
+                print(f"[Gateway] Error publishing state feed: {e}")
+
+    def publish(self, devices):
+        """Manda o estado dos atuadores entre devices, em datagramas de até MAX_DATAGRAM"""
+        feed = device_pb2.ActuatorFeed()
+        size = 0
+        for device_info in devices:
+            if device_info.get('type') not in ACTUATOR_TYPES:
+                continue
+            state = actuator_state(device_info)
+            if state is None:
+                continue
+            # Campo repeated: tag e tamanho somam no máximo 3 bytes aqui
+            state_size = state.ByteSize() + 3
+            if feed.states and size + state_size > MAX_DATAGRAM:
+                self.send(feed)
+                feed = device_pb2.ActuatorFeed()
+                size = 0
+            feed.states.append(state)
+            size += state_size
+        if feed.states:
+            self.send(feed)
+
+    def send(self, feed):
+        self.sock.sendto(feed.SerializeToString(), self.target)
+        self.datagrams += 1
+
+
+class StateFeed:
+    """
+    Sensores: estado das lâmpadas e ACs de qualquer host, recebido do feed
+    do gateway. read() retorna o mesmo formato de StateBus.read, para os
+    sensores usarem quando o atuador não roda na mesma máquina.
+    """
+    def __init__(self, port=FEED_PORT, group=FEED_GRP):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('0.0.0.0', port))
+        mreq = struct.pack("4sl", socket.inet_aton(group), socket.INADDR_ANY)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+
+        self.lock = threading.Lock()
+        self.devices = {}  # device_id -> (versão, tipo, estado, recebido em)
+
+        threading.Thread(target=self.listen, name="state-feed", daemon=True).start()
+
+    def listen(self):
+        while True:
+            data, _ = self.sock.recvfrom(65535)
+            try:
+                self.receive(data)
+            except (DecodeError, KeyError, ValueError) as e:
+                print(f"[StateFeed] Invalid feed datagram: {e}")
+
+    def receive(self, data):
+        feed = device_pb2.ActuatorFeed()
+        feed.ParseFromString(data)
+        now = time.time()
+        with self.lock:
+            for state in feed.states:
+                current = self.devices.get(state.device_id)
+                # Versão menor é datagrama atrasado, a não ser que o estado guardado
+                # já tenha passado de um heartbeat: aí o gateway reiniciou e a
+                # contagem de versões recomeçou
+                if (current is not None and state.version < current[0]
+                        and now - current[3] <= FEED_HEARTBEAT):
+                    continue
+                self.devices[state.device_id] = (state.version, state.device_type,
+                                                 state_to_dict(state.device_type, state.state), now)
+
+    def read(self, device_type, max_age=STALE_AFTER):
+        """
+        Estado de cada atuador do tipo ouvido no feed há até max_age, como
+        {device_id: campos} no mesmo formato de StateBus.read
+        """
+        now = time.time()
+        states = {}
+        with self.lock:
+            for device_id, (_, entry_type, state, received_at) in list(self.devices.items()):
+                if now - received_at > max_age:
+                    # Sem heartbeat do gateway: o atuador saiu do registro
+                    del self.devices[device_id]
+                elif entry_type == device_type:
+                    states[device_id] = state
+        return {device_id: self.fields(device_type, state) for device_id, state in states.items()}
+
+    @staticmethod
+    def fields(device_type, state):
+        """Dicionário de estado do device nos campos do barramento"""
+        power = RATED_POWER[device_type] if state["power"] == "ON" else 0
+        if device_type == "smart_lamp":
+            return {"power": power, "brightness": state["brightness"]}
+        return {"power": power, "temperature": float(state["temperature"]),
+                "mode": state["mode"], "fan_speed": state["fan_speed"]}
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+import threading
+import time
+from concurrent.futures import Future
+
+
+class StatusEntry:
+    """Último status lido de um device e a leitura em andamento, se houver"""
+    def __init__(self):
+        self.value = None       # (success, message, status) da última leitura bem-sucedida
+        self.fetched_at = 0.0
+        self.inflight = None    # Future da leitura em andamento
+
+
+class StatusCache:
+    """
+    Cache de GET_STATUS por device com single-flight.
+
+    Leituras concorrentes do mesmo device compartilham uma única chamada
+    fetch(device_id), que retorna (success, message, status). Um resultado
+    com menos de ttl segundos é servido direto; até stale_ttl segundos ele
+    ainda é servido, mas dispara uma releitura em segundo plano
+    (stale-while-revalidate). Depois disso o chamador espera a releitura.
+    Assim, o número de chamadas ao device não depende de quantos clientes
+    pedem o status. Com um registry, só devices presentes nele ganham
+    entrada no cache, e a entrada some quando o device sai do registro;
+    ids desconhecidos vão direto ao fetch, sem ocupar memória.
+    """
+    def __init__(self, fetch, executor, ttl=1.0, stale_ttl=10.0, registry=None):
+        self.fetch = fetch
+        self.executor = executor
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.registry = registry
+
+        self.lock = threading.Lock()
+        self.entries = {}  # device_id -> StatusEntry
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.coalesced = 0
+        self.fetches = 0
+
+        if registry is not None:
+            registry.add_listener(self.on_registry_change)
+
+    def _known(self, device_id):
+        return self.registry is None or device_id in self.registry
+
+    def on_registry_change(self, device_id):
+        """Listener do registro: device removido (tombstone) sai do cache"""
+        if device_id not in self.registry:
+            self.forget(device_id)
+
+    def _start_fetch(self, device_id, entry):
+        """Cria a leitura em andamento; chamado com o lock"""
+        entry.inflight = Future()
+        self.fetches += 1
+        return entry.inflight
+
+    def _run_fetch(self, device_id, entry, future):
+        try:
+            value = self.fetch(device_id)
+        except Exception as e:
+            value = (False, f"Error: {e}", "")
+        with self.lock:
+            if value[0]:
+                entry.value = value
+                entry.fetched_at = time.time()
+            entry.inflight = None
+        future.set_result(value)
+        return value
+
+    def get(self, device_id):
+        if not self._known(device_id):
+            # Device fora do registro: nada a reaproveitar nem a guardar
+            try:
+                return self.fetch(device_id)
+            except Exception as e:
+                return (False, f"Error: {e}", "")
+
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(device_id)
+            if entry is None:
+                entry = self.entries[device_id] = StatusEntry()
+
+            age = now - entry.fetched_at
+            if entry.value is not None and age < self.ttl:
+                self.hits += 1
+                return entry.value
+
+            if entry.value is not None and age < self.stale_ttl:
+                self.stale_hits += 1
+                if entry.inflight is None:
+                    future = self._start_fetch(device_id, entry)
+                    self.executor.submit(self._run_fetch, device_id, entry, future)
+                return entry.value
+
+            if entry.inflight is not None:
+                self.coalesced += 1
+                future = entry.inflight
+                leader = False
+            else:
+                future = self._start_fetch(device_id, entry)
+                leader = True
+
+        # Quem abriu a leitura a executa na própria thread; os demais esperam
+        if leader:
+            return self._run_fetch(device_id, entry, future)
+        return future.result()
+
+    def put(self, device_id, value):
+        """Guarda um status obtido por outro caminho (ex.: resposta de CONTROL_DEVICE)"""
+        if not self._known(device_id):
+            return
+        with self.lock:
+            entry = self.entries.get(device_id)
+            if entry is None:
+                entry = self.entries[device_id] = StatusEntry()
+            entry.value = value
+            entry.fetched_at = time.time()
+
+    def invalidate(self, device_id):
+        with self.lock:
+            entry = self.entries.get(device_id)
+            if entry is not None:
+                entry.value = None
+
+    def forget(self, device_id):
+        with self.lock:
+            self.entries.pop(device_id, None)
+
+    def stats(self):
+        return {
+            "status_cache_hits": self.hits,
+            "status_cache_stale_hits": self.stale_hits,
+            "status_cache_coalesced": self.coalesced,
+            "status_cache_fetches": self.fetches,
+        }
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+import threading
+import time
+import device_pb2
+
+
+class Subscription:
+    """Uma assinatura SUBSCRIBE de uma sessão de cliente"""
+    def __init__(self, session, request_id, device_types=None, device_ids=None, interval=0.5):
+        self.session = session
+        self.request_id = request_id
+        self.device_types = set(device_types or [])
+        self.device_ids = set(device_ids or [])
+        self.interval = interval
+
+        self.dirty = set()  # device_ids alterados desde o último push
+        self.known = set()  # device_ids já enviados (para repassar remoções)
+        self.last_push = 0.0
+
+    def matches(self, device_info):
+        if self.device_ids and device_info['id'] not in self.device_ids:
+            return False
+        if self.device_types and device_info['type'] not in self.device_types:
+            return False
+        return True
+
+
+class SubscriptionManager:
+    """
+    Empurra atualizações de DeviceInfo para os clientes assinantes.
+
+    O registro avisa cada mudança via notify(); os device_ids alterados se
+    acumulam por assinatura e uma única thread faz no máximo um push por
+    assinatura a cada interval, com o estado mais recente de cada device
+    (várias mudanças do mesmo device no intervalo viram uma só).
+    """
+    def __init__(self, registry, encode_device_info):
+        self.registry = registry
+        # Retorna o DeviceInfo já codificado como elemento de ClientResponse.devices
+        self.encode_device_info = encode_device_info
+
+        self.subscriptions = []
+        self.cond = threading.Condition()
+
+        registry.add_listener(self.notify)
+        threading.Thread(target=self.push_loop, daemon=True).start()
+
+    def subscribe(self, session, request_id, device_types=None, device_ids=None, interval=0.5):
+        """
+        Registra a assinatura e retorna a resposta inicial (sem devices) e
+        os DeviceInfos codificados com o estado atual dos devices filtrados;
+        os pushes seguintes usam o mesmo request_id
+        """
+        subscription = Subscription(session, request_id, device_types, device_ids, interval)
+        # O primeiro push só sai depois de um intervalo, para não chegar
+        # antes da resposta inicial
+        subscription.last_push = time.time()
+        with self.cond:
+            self.subscriptions.append(subscription)
+
+        response = device_pb2.ClientResponse()
+        response.success = True
+        response.message = "Subscribed"
+        response.full_sync = True
+        response.version = self.registry.version
+        devices_data = []
+        for device_info in self.registry.values():
+            if subscription.matches(device_info):
+                subscription.known.add(device_info['id'])
+                devices_data.append(self.encode_device_info(device_info))
+        return response, b"".join(devices_data)
+
+    def unsubscribe(self, session, request_id):
+        with self.cond:
+            before = len(self.subscriptions)
+            self.subscriptions = [s for s in self.subscriptions
+                                  if not (s.session is session and s.request_id == request_id)]
+            return len(self.subscriptions) != before
+
+    def drop_session(self, session):
+        with self.cond:
+            self.subscriptions = [s for s in self.subscriptions if s.session is not session]
+
+    def notify(self, device_id):
+        device_info = self.registry.get(device_id)
+        with self.cond:
+            woke = False
+            for subscription in self.subscriptions:
+                if device_info is None:
+                    if device_id not in subscription.known:
+                        continue
+                elif not subscription.matches(device_info):
+                    continue
+                subscription.dirty.add(device_id)
+                woke = True
+            if woke:
+                self.cond.notify()
+
+    def build_push(self, subscription, device_ids):
+        """ClientResponse serializado com o estado atual de device_ids"""
+        response = device_pb2.ClientResponse()
+        response.success = True
+        response.message = "Devices updated"
+        response.request_id = subscription.request_id
+        response.version = self.registry.version
+        devices_data = []
+        for device_id in device_ids:
+            device_info = self.registry.get(device_id)
+            if device_info is None:
+                subscription.known.discard(device_id)
+                response.removed_device_ids.append(device_id)
+            else:
+                subscription.known.add(device_id)
+                devices_data.append(self.encode_device_info(device_info))
+        return response.SerializeToString() + b"".join(devices_data)
+
+    def push_loop(self):
+        while True:
+            due = []
+            with self.cond:
+                now = time.time()
+                next_wakeup = None
+                for subscription in self.subscriptions:
+                    if not subscription.dirty:
+                        continue
+                    ready_at = subscription.last_push + subscription.interval
+                    if ready_at <= now:
+                        due.append((subscription, subscription.dirty))
+                        subscription.dirty = set()
+                        subscription.last_push = now
+                    elif next_wakeup is None or ready_at < next_wakeup:
+                        next_wakeup = ready_at
+                if not due:
+                    self.cond.wait(None if next_wakeup is None else next_wakeup - now)
+                    continue
+
+            for subscription, device_ids in due:
+                try:
+                    subscription.session.send(self.build_push(subscription, device_ids))
+                except Exception:
+                    # Sessão encerrada: a assinatura morre junto
+                    self.drop_session(subscription.session)
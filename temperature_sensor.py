@@ -3,13 +3,18 @@ import socket
 import struct
 import threading
 import time
-import json
 import device_pb2
-import subprocess
+from sharding import gateway_endpoint
+from state_bus import StateBus
+from state_feed import StateFeed
+from thermal import Building
+from transport import FrameReader, send_frame
+from protocol import ReportPolicy, command_params, negotiate, set_state, typed_state
+from tracing import traced_command
 
 
 class TemperatureSensor:
-    def __init__(self):
+    def __init__(self, networking=True, bus=None, feed=None, ip=None, building=None, room=0):
         # Configurações de rede
         self.MCAST_GRP = '224.0.0.1'
         self.MCAST_PORT = 50000
@@ -26,13 +31,35 @@ class TemperatureSensor:
         # Temperatura que consideramos "externa/neutra"
         self.default_temp = 25.0
 
-        # Inicializar sockets
-        self.init_tcp_server()
-        self.init_multicast_listener()
-        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # Sala deste sensor num prédio simulado (thermal.py). Sem prédio,
+        # o sensor simula sozinho uma sala com os ACs e lâmpadas que estão
+        # rodando; com um prédio (device_host.py --rooms), quem avança a
+        # simulação é o host
+        self.shared_building = building is not None
+        self.building = building or Building(1, outside_temp=self.default_temp)
+        self.room = room
+
+        # Inicializar sockets (sem networking, quem cuida da rede é o device_host.py)
+        if networking:
+            self.init_tcp_server()
+            self.init_multicast_listener()
+            self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         
         # IP do gateway (será atualizado quando recebermos GATEWAY_DISCOVERY)
         self.gateway_ip = None
+        # Portas desse gateway; com vários gateways (shards), as do dono deste device
+        self.gateway_announce_port = 50001
+        self.gateway_sensor_port = 50002
+        # Versão do protocolo combinada com o gateway no GATEWAY_DISCOVERY
+        self.protocol_version = 1
+        # Envio por mudança: deadband e max_silence entram no estado
+        self.reporting = ReportPolicy(self.device_type, self.state)
+        # Estado dos atuadores, publicado por eles em memória compartilhada
+        self.bus = bus or StateBus()
+        # e republicado pelo gateway em multicast, para atuadores de outros hosts
+        self.feed = feed if feed is not None else (StateFeed() if networking else None)
+        # IP anunciado ao gateway, parte do device_id (o device_host passa o IP do host)
+        self.ip = ip or self.get_local_ip()
         
     def init_tcp_server(self):
         """Inicializa o servidor TCP para comandos"""
@@ -61,151 +88,112 @@ class TemperatureSensor:
         finally:
             s.close()
         return ip
+
+    def actuators(self, device_type):
+        """
+        Estado de cada atuador do tipo que está rodando, {device_id: estado}:
+        os de outros hosts pelo feed do gateway e os desta máquina pelo
+        barramento, que é mais recente e prevalece
+        """
+        states = self.feed.read(device_type) if self.feed is not None else {}
+        states.update(self.bus.read(device_type))
+        return states
     
     def simulate_environment_temperature(self):
         """
         Ajusta a temperatura do ambiente de forma 'aproximada',
         considerando o estado do ar-condicionado e da lâmpada.
         """
+        if self.shared_building:
+            # O prédio inteiro já foi avançado pelo host; só lemos a sala
+            self.state["temperature"] = float(self.building.temperatures[self.room])
+            return
 
         # -----------------------------
-        # Ler arquivos do AC
-        # -----------------------------
-        pid_ac = subprocess.check_output("ps -aux | grep air_conditioner.py", shell=True, text=True)
-        if len(pid_ac.split("\n")) > 3:
-            try:
-                with open("files/ac_power.txt", "r") as f:
-                    ac_power_val = int(f.read().strip())  # se > 0 -> ON, se ==0 -> OFF
-
-                with open("files/ac_settemp.txt", "r") as f:
-                    ac_set_temp = float(f.read().strip())  # 16..30
-
-                with open("files/ac_mode.txt", "r") as f:
-                    ac_mode = f.read().strip()  # COOL, HEAT, FAN
-
-                with open("files/ac_fanspeed.txt", "r") as f:
-                    ac_fan_speed = f.read().strip()  # LOW, MEDIUM, HIGH, AUTO
-            except:
-                # Se der algum erro de leitura, assumimos valores padrão
-                ac_power_val = 0
-                ac_set_temp = 25.0
-                ac_mode = "COOL"
-                ac_fan_speed = "AUTO"
-        else:
-            # Se o ar condicionado não estiver funcionando, assumimos valores padrão
-            ac_power_val = 0
-            ac_set_temp = 25.0
-            ac_mode = "COOL"
-            ac_fan_speed = "AUTO"
-      
-        # A temperatura atual do ambiente
-        current_temp = self.state["temperature"]
-
-        # -----------------------------
-        # Cálculos de influência
+        # Ler estado dos ACs e das lâmpadas (barramento ou feed do gateway)
         # -----------------------------
-        # 1) efeito natural de "voltar" para a default_temp
-        #    se nada estiver ligado (ou dependendo do caso)
-        #    iremos "aproximar" do default_temp vagarosamente
-        #    Exemplo: delta ~ (default_temp - current_temp) * 0.01
-        #    => se current_temp < default_temp, sobe lentamente, e vice-versa
-        approach_rate = 0.02  # quão rápido volta à temp default
-        delta = (self.default_temp - current_temp) * approach_rate
-
-        # 2) efeito do ar-condicionado
-        #    - se ac_power_val > 0 => AC está ON
-        #      COOL -> tende a abaixar
-        #      HEAT -> tende a aumentar
-        #      FAN  -> efeito menor
-        #    - intensidade depende do fan_speed
-        fan_factor = {
-            "LOW": 0.5,
-            "MEDIUM": 1.0,
-            "HIGH": 1.5,
-            "AUTO": 1.0
-        }.get(ac_fan_speed, 1.0)
+        # Todos os ACs e lâmpadas rodando estão na sala; os parados não contam
+        acs = list(self.actuators("air_conditioner").values())
+        lamps = list(self.actuators("smart_lamp").values())
+        if len(acs) != len(self.building.ac_room) or len(lamps) != len(self.building.lamp_room):
+            # Mudou a quantidade de atuadores: nova sala, mesma temperatura
+            temperature = self.building.temperatures[0]
+            self.building = Building(1, ac_rooms=[0] * len(acs), lamp_rooms=[0] * len(lamps),
+                                     outside_temp=self.default_temp)
+            self.building.temperatures[0] = temperature
+        self.building.set_acs([{
+            "power": "ON" if ac["power"] > 0 else "OFF",
+            "temperature": ac["temperature"],
+            "mode": ac["mode"],
+            "fan_speed": ac["fan_speed"],
+        } for ac in acs])
+        self.building.set_lamps([lamp["power"] for lamp in lamps])
 
-        ac_effect = 0.0
-        if ac_power_val > 0:
-            if ac_mode == "COOL":
-                # Podemos diminuir a temp para se aproximar de ac_set_temp
-                # Exemplo de variação inversamente proporcional à diferença
-                # ou um valor fixo. Aqui, uso algo simples:
-                if current_temp > ac_set_temp:
-                    # resfriar
-                    ac_effect = -0.2 * fan_factor  # resfriamento base
-                else:
-                    # se já está abaixo do set_temp, não esfria mais
-                    ac_effect = 0.0
+        # Um passo da simulação da sala (thermal.py)
+        self.building.step()
+        new_temp = float(self.building.temperatures[0])
 
-            elif ac_mode == "HEAT":
-                if current_temp < ac_set_temp:
-                    # aquecer
-                    ac_effect = +0.2 * fan_factor
-                else:
-                    ac_effect = 0.0
+        # Atualiza no estado
+        self.state["temperature"] = new_temp
 
-            elif ac_mode == "FAN":
-                # Modo FAN não muda muito a temp
-                # mas se a temp estiver abaixo do default, poderia subir um pouco
-                # ou se estiver acima, poderia descer um pouco.
-                # Aqui faremos um pequeno "empurrão" para se aproximar do default_temp
-                ac_effect = 0.05 * fan_factor * (self.default_temp - current_temp)
+        # Apenas para fácil conferência externa (python3 state_bus.py)
+        self.bus.publish("environment", self.device_id, temperature=new_temp)
 
-        # -----------------------------
-        # Soma tudo
-        # -----------------------------
-        new_temp = current_temp + delta + ac_effect
+    @property
+    def device_id(self):
+        """Identificador do device no gateway e no barramento de estado"""
+        return f"{self.device_type}_{self.ip}_{self.TCP_PORT}"
 
-        # Podemos limitar para um range mínimo/máximo
-        if new_temp < 5:
-            new_temp = 5
-        if new_temp > 40:
-            new_temp = 40
+    def update_interval(self):
+        """Segundos entre duas leituras"""
+        return self.state["update_interval"]
 
-        # Atualiza no estado
-        self.state["temperature"] = new_temp
-
-        # Apenas para fácil conferência externa
-        with open("files/environment_temp.txt", "w") as f:
-            f.write(f"{new_temp:.2f}")
+    def tick(self, ip):
+        """
+        Avança a simulação um intervalo e retorna o SensorData serializado
+        com a temperatura, ou None se ainda não há gateway ou se o valor
+        não saiu da deadband e o último envio foi há menos de max_silence
+        """
+        self.simulate_environment_temperature()
+        if not self.gateway_ip:
+            return None
+        if not self.reporting.should_report(self.state["temperature"]):
+            return None
+        sensor_data = device_pb2.SensorData()
+        sensor_data.device_id = f"{self.device_type}_{ip}_{self.TCP_PORT}"
+        sensor_data.sensor_type = "temperature"
+        sensor_data.value = self.state["temperature"]
+        sensor_data.unit = self.state["unit"]
+        if self.protocol_version >= 2:
+            sensor_data.state.CopyFrom(typed_state(self.device_type, self.state))
+        sensor_data.timestamp = int(time.time())
+        return sensor_data.SerializeToString()
 
     def simulate_temperature(self):
         """Lida com a simulação de temperatura e envia dados periodicamente ao Gateway"""
         while True:
-            self.simulate_environment_temperature()
+            data = self.tick(self.get_local_ip())
 
             # Agora, envia (via UDP) a temperatura para o Gateway
-            if self.gateway_ip:
-                sensor_data = device_pb2.SensorData()
-                sensor_data.device_id = f"{self.device_type}_{self.get_local_ip()}_{self.TCP_PORT}"
-                sensor_data.sensor_type = "temperature"
-                sensor_data.value = self.state["temperature"]
-                sensor_data.unit = self.state["unit"]
-                sensor_data.timestamp = int(time.time())
-                
+            if data is not None:
                 try:
-                    data = sensor_data.SerializeToString()
-                    self.udp_socket.sendto(data, (self.gateway_ip, 50002))
+                    self.udp_socket.sendto(data, (self.gateway_ip, self.gateway_sensor_port))
                 except Exception as e:
                     print(f"Error sending sensor data: {e}")
-            
-            time.sleep(self.state["update_interval"])
 
-            
+            time.sleep(self.update_interval())
+
     def handle_command(self, command_msg):
         """Processa comandos recebidos (via TCP)"""
         try:
             command = command_msg.command
-            params = json.loads(command_msg.parameters) if command_msg.parameters else {}
+            params = command_params(command_msg)
             
             response = device_pb2.DeviceResponse()
             
             if command == "GET_STATUS":
                 response.success = True
                 response.message = "Status retrieved"
-                # Retornamos status em JSON
-                response.status = json.dumps(self.state)
                 response.attributes["temperature"] = str(self.state["temperature"])
                 response.attributes["unit"] = self.state["unit"]
 
@@ -223,12 +211,14 @@ class TemperatureSensor:
                     response.success = False
                     response.message = "Missing interval parameter"
 
+            elif command == "SET_REPORTING":
+                response.success, response.message = self.reporting.configure(params)
+
             else:
                 response.success = False
                 response.message = "Unknown command"
 
-            if not response.status:
-                response.status = json.dumps(self.state)
+            set_state(response, self.device_type, self.state, self.protocol_version)
             
             return response
 
@@ -236,36 +226,53 @@ class TemperatureSensor:
             response = device_pb2.DeviceResponse()
             response.success = False
             response.message = f"Error: {str(e)}"
-            response.status = json.dumps(self.state)
+            set_state(response, self.device_type, self.state, self.protocol_version)
             return response
             
     def handle_tcp_client(self, client_socket, addr):
         """Gerencia conexões TCP"""
         try:
+            # Um buffer reaproveitado por conexão; frames chegam inteiros mesmo
+            # se o TCP entregar a mensagem em pedaços
+            reader = FrameReader(client_socket)
             while True:
-                size_data = client_socket.recv(4)
-                if not size_data:
-                    break
-                    
-                msg_size = int.from_bytes(size_data, byteorder='big')
-                data = client_socket.recv(msg_size)
-                if not data:
+                data = reader.read_frame()
+                if data is None:
                     break
                     
                 command_msg = device_pb2.DeviceCommand()
                 command_msg.ParseFromString(data)
                 
-                response = self.handle_command(command_msg)
+                response = traced_command(command_msg, self.handle_command, f"device:{self.device_type}")
                 
                 response_data = response.SerializeToString()
-                client_socket.send(len(response_data).to_bytes(4, byteorder='big'))
-                client_socket.send(response_data)
+                send_frame(client_socket, response_data)
 
         except Exception as e:
             print(f"Error handling TCP client: {e}")
         finally:
             client_socket.close()
             
+    def discovery_response(self, msg, addr, ip):
+        """
+        Resposta a um GATEWAY_DISCOVERY vindo de addr: combina a versão do
+        protocolo, guarda o gateway dono deste device e retorna
+        (DeviceDiscovery serializado, endereço de destino)
+        """
+        discovery_msg = device_pb2.DeviceDiscovery()
+        discovery_msg.device_type = self.device_type
+        discovery_msg.ip = ip
+        discovery_msg.port = self.TCP_PORT
+        self.protocol_version = negotiate(msg.protocol_version)
+        discovery_msg.protocol_version = self.protocol_version
+        set_state(discovery_msg, self.device_type, self.state, self.protocol_version)
+
+        # Anúncios e SensorData vão para o gateway dono deste device_id
+        device_id = f"{self.device_type}_{discovery_msg.ip}_{discovery_msg.port}"
+        self.gateway_ip, self.gateway_announce_port, self.gateway_sensor_port = \
+            gateway_endpoint(msg, addr, device_id)
+        return discovery_msg.SerializeToString(), (self.gateway_ip, self.gateway_announce_port)
+
     def listen_for_discovery(self):
         """Escuta por mensagens de descoberta (multicast) e responde ao Gateway"""
         while True:
@@ -273,16 +280,9 @@ class TemperatureSensor:
             msg = device_pb2.DeviceCommand()
             msg.ParseFromString(data)
             if msg.command == "GATEWAY_DISCOVERY":
-                self.gateway_ip = addr[0]  # Salva IP do gateway
-                
-                discovery_msg = device_pb2.DeviceDiscovery()
-                discovery_msg.device_type = self.device_type
-                discovery_msg.ip = self.get_local_ip()
-                discovery_msg.port = self.TCP_PORT
-                discovery_msg.status = json.dumps(self.state)
-                
+                data, target = self.discovery_response(msg, addr, self.get_local_ip())
                 response_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                response_socket.sendto(discovery_msg.SerializeToString(), (addr[0], 50001))
+                response_socket.sendto(data, target)
                 response_socket.close()
                 
     def run(self):
@@ -0,0 +1,100 @@
+import socket
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import device_pb2
+from client import SmartHomeClient
+from transport import FrameReader, send_frame
+
+
+class FakeGateway:
+    """Responde cada requisição com o próprio comando, exceto SILENT (nunca responde)"""
+    def __init__(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(16)
+        self.port = self.listener.getsockname()[1]
+        self.connections = 0
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+
+    def accept_loop(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self.serve, args=(conn,), daemon=True).start()
+
+    def serve(self, conn):
+        reader = FrameReader(conn)
+        with conn:
+            try:
+                while True:
+                    data = reader.read_frame()
+                    if data is None:
+                        return
+                    request = device_pb2.ClientRequest()
+                    request.ParseFromString(data)
+                    if request.command == "SILENT":
+                        continue
+                    response = device_pb2.ClientResponse(success=True, message=request.command,
+                                                         request_id=request.request_id)
+                    send_frame(conn, response.SerializeToString())
+            except OSError:
+                pass
+
+    def close(self):
+        self.listener.close()
+
+
+class SmartHomeClientTest(unittest.TestCase):
+    def setUp(self):
+        self.gateway = FakeGateway()
+        self.client = SmartHomeClient(gateway_port=self.gateway.port, timeout=2.0, compression=False,
+                                      trace=False)
+
+    def tearDown(self):
+        self.client.disconnect()
+        self.gateway.close()
+
+    def request(self, command):
+        return device_pb2.ClientRequest(command=command)
+
+    def test_threads_share_one_connection(self):
+        def send(i):
+            return self.client.send_request(self.request(f"CMD_{i}")).message
+
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            messages = list(executor.map(send, range(400)))
+
+        self.assertEqual(messages, [f"CMD_{i}" for i in range(400)])
+        self.assertEqual(self.gateway.connections, 1)
+        self.assertEqual(self.client.pending, {})
+
+    def test_timed_out_request_is_forgotten(self):
+        self.client.timeout = 0.2
+        self.assertIsNone(self.client.send_request(self.request("SILENT")))
+        self.assertEqual(self.client.pending, {})
+        self.assertEqual(self.client.send_request(self.request("PING")).message, "PING")
+
+    def test_lost_connection_fails_only_its_requests(self):
+        old_future = self.client.send_request_async(self.request("SILENT"))
+        old_sock = self.client.sock
+        # Outra thread já trocou a conexão antes do leitor da antiga perceber a queda
+        with self.client.connect_lock:
+            self.client.sock = None
+        self.assertTrue(self.client.connect())
+        new_future = self.client.send_request_async(self.request("SILENT"))
+
+        old_sock.shutdown(socket.SHUT_RDWR)
+        self.assertIsInstance(old_future.exception(timeout=2), ConnectionError)
+        self.assertFalse(new_future.done())
+        self.assertIsNotNone(self.client.sock)
+        self.assertEqual(self.client.send_request(self.request("PING")).message, "PING")
+        old_sock.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
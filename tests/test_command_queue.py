@@ -0,0 +1,106 @@
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from command_queue import DeviceCommandQueues
+
+
+class BlockingDevice:
+    """Devices falsos: registram os comandos; os da lâmpada esperam release()"""
+    def __init__(self):
+        self.executed = []
+        self.started = threading.Event()
+        self.gate = threading.Event()
+
+    def execute(self, device_id, command, parameters):
+        if device_id != "lamp":
+            return (True, device_id, "")
+        self.executed.append((command, parameters))
+        self.started.set()
+        self.gate.wait(5)
+        return (True, f"{command} {parameters}", "")
+
+    def release(self):
+        self.gate.set()
+
+
+class DeviceCommandQueuesTest(unittest.TestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.device = BlockingDevice()
+        self.queues = DeviceCommandQueues(self.device.execute, self.executor, max_pending=3)
+
+    def tearDown(self):
+        self.device.release()
+        self.executor.shutdown(wait=True)
+
+    def start_busy(self):
+        """Ocupa o device com um comando em execução, para os seguintes ficarem na fila"""
+        running = self.queues.submit("lamp", "ON")
+        self.assertTrue(self.device.started.wait(5))
+        return running
+
+    def test_repeated_setpoints_merge_into_last_value(self):
+        self.start_busy()
+        first = self.queues.submit("lamp", "SET_BRIGHTNESS", {"brightness": 10})
+        second = self.queues.submit("lamp", "SET_BRIGHTNESS", {"brightness": 20})
+        self.device.release()
+
+        self.assertEqual(first.result(5), second.result(5))
+        self.assertEqual(self.device.executed, [("ON", None), ("SET_BRIGHTNESS", {"brightness": 20})])
+        self.assertEqual(self.queues.stats()["commands_merged"], 1)
+
+    def test_merge_only_with_tail_of_queue(self):
+        self.start_busy()
+        futures = [self.queues.submit("lamp", "SET_BRIGHTNESS", {"brightness": 10}),
+                   self.queues.submit("lamp", "OFF"),
+                   self.queues.submit("lamp", "SET_BRIGHTNESS", {"brightness": 20})]
+        self.device.release()
+
+        for future in futures:
+            future.result(5)
+        self.assertEqual(self.device.executed, [
+            ("ON", None),
+            ("SET_BRIGHTNESS", {"brightness": 10}),
+            ("OFF", None),
+            ("SET_BRIGHTNESS", {"brightness": 20}),
+        ])
+        self.assertEqual(self.queues.stats()["commands_merged"], 0)
+
+    def test_running_command_is_not_merged(self):
+        self.queues.submit("lamp", "SET_BRIGHTNESS", {"brightness": 10})
+        self.assertTrue(self.device.started.wait(5))
+        queued = self.queues.submit("lamp", "SET_BRIGHTNESS", {"brightness": 20})
+        self.device.release()
+
+        queued.result(5)
+        self.assertEqual([parameters for _, parameters in self.device.executed],
+                         [{"brightness": 10}, {"brightness": 20}])
+
+    def test_full_queue_rejects_immediately(self):
+        self.start_busy()
+        for command in ("OFF", "ON", "OFF"):
+            self.queues.submit("lamp", command)
+        rejected = self.queues.submit("lamp", "ON")
+
+        self.assertTrue(rejected.done())
+        self.assertEqual(rejected.result(), (False, "Device busy: command queue full", ""))
+        self.assertEqual(self.queues.stats()["commands_rejected_busy"], 1)
+
+    def test_cancelled_command_is_skipped(self):
+        self.start_busy()
+        cancelled = self.queues.submit("lamp", "OFF")
+        kept = self.queues.submit("lamp", "SET_BRIGHTNESS", {"brightness": 50})
+        self.assertTrue(cancelled.cancel())
+        self.device.release()
+
+        kept.result(5)
+        self.assertEqual([command for command, _ in self.device.executed], ["ON", "SET_BRIGHTNESS"])
+
+    def test_devices_do_not_share_a_queue(self):
+        self.start_busy()
+        self.assertEqual(self.queues.submit("ac", "ON").result(5), (True, "ac", ""))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import json
+import os
+import unittest
+import zlib
+
+import device_pb2
+from compression import (DICTIONARY, SUPPORTED_ENCODINGS, build_dictionary, choose_encoding,
+                         compress_response, decode_response)
+from transport import FrameError
+
+
+def list_devices(count):
+    """LIST_DEVICES serializado com count lâmpadas"""
+    response = device_pb2.ClientResponse(success=True, message="Devices retrieved successfully")
+    for i in range(count):
+        dev = response.devices.add()
+        dev.device_id = f"smart_lamp_192.168.0.{i % 250}_{40000 + i}"
+        dev.device_type = "smart_lamp"
+        dev.ip = f"192.168.0.{i % 250}"
+        dev.port = 40000 + i
+        dev.status = json.dumps({"power": "ON", "brightness": i % 101})
+    return response.SerializeToString()
+
+
+def decode(data, **kwargs):
+    response = device_pb2.ClientResponse()
+    response.ParseFromString(data)
+    return decode_response(response, **kwargs)
+
+
+class CompressionTest(unittest.TestCase):
+    def test_round_trip(self):
+        data = list_devices(200)
+        for encoding in (device_pb2.ENCODING_ZLIB, device_pb2.ENCODING_ZLIB_DICT):
+            compressed = compress_response(data, encoding)
+            self.assertLess(len(compressed), len(data) / 3)
+
+            wrapper = device_pb2.ClientResponse()
+            wrapper.ParseFromString(compressed)
+            self.assertEqual(wrapper.encoding, encoding)
+            self.assertEqual(len(wrapper.devices), 0)
+            self.assertEqual(decode(compressed).SerializeToString(), data)
+
+    def test_dictionary_helps_small_responses(self):
+        data = list_devices(8)
+        plain = compress_response(data, device_pb2.ENCODING_ZLIB, threshold=0)
+        with_dict = compress_response(data, device_pb2.ENCODING_ZLIB_DICT, threshold=0)
+        self.assertLess(len(with_dict), len(plain))
+        self.assertEqual(decode(with_dict).SerializeToString(), data)
+
+    def test_below_threshold_passes_through(self):
+        data = list_devices(2)
+        self.assertLess(len(data), 1024)
+        self.assertIs(compress_response(data, device_pb2.ENCODING_ZLIB_DICT), data)
+        data = list_devices(200)
+        self.assertIs(compress_response(data, device_pb2.ENCODING_NONE), data)
+
+    def test_incompressible_response_passes_through(self):
+        data = device_pb2.ClientResponse(compressed_body=os.urandom(4096)).SerializeToString()
+        self.assertIs(compress_response(data, device_pb2.ENCODING_ZLIB, threshold=0), data)
+
+    def test_uncompressed_response_is_untouched(self):
+        data = list_devices(3)
+        self.assertEqual(decode(data).SerializeToString(), data)
+
+    def test_decompression_bomb_is_rejected(self):
+        wrapper = device_pb2.ClientResponse(encoding=device_pb2.ENCODING_ZLIB)
+        wrapper.compressed_body = zlib.compress(bytes(10 * 1024 * 1024))
+        self.assertLess(len(wrapper.compressed_body), 64 * 1024)
+
+        response = device_pb2.ClientResponse()
+        response.ParseFromString(wrapper.SerializeToString())
+        with self.assertRaises(FrameError):
+            decode_response(response, max_size=1024 * 1024)
+
+    def test_unknown_encoding_is_rejected(self):
+        response = device_pb2.ClientResponse(encoding=99, compressed_body=b"x")
+        with self.assertRaises(FrameError):
+            decode_response(response)
+
+    def test_choose_encoding(self):
+        self.assertEqual(choose_encoding(SUPPORTED_ENCODINGS), device_pb2.ENCODING_ZLIB_DICT)
+        self.assertEqual(choose_encoding([device_pb2.ENCODING_ZLIB]), device_pb2.ENCODING_ZLIB)
+        self.assertEqual(choose_encoding([]), device_pb2.ENCODING_NONE)
+
+    def test_dictionary_is_stable(self):
+        # Cliente e gateway montam o dicionário separadamente: precisa ser determinístico
+        self.assertEqual(build_dictionary(), DICTIONARY)
+
+
+if __name__ == "__main__":
+    unittest.main()
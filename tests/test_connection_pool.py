@@ -0,0 +1,57 @@
+import socket
+import time
+import unittest
+
+from connection_pool import DeviceConnectionPool
+
+
+class DeviceConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        # Device que aceita conexões (pelo backlog) e nunca responde
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(8)
+        self.addr = self.listener.getsockname()
+        self.pool = DeviceConnectionPool(max_per_device=2, idle_timeout=0.2, read_timeout=0.2)
+
+    def tearDown(self):
+        self.pool.prune()
+        self.listener.close()
+
+    def test_silent_device_times_out(self):
+        sock, reused = self.pool.acquire(self.addr)
+        self.assertFalse(reused)
+        sock.sendall(b"ping")
+
+        started = time.monotonic()
+        with self.assertRaises(socket.timeout):
+            sock.recv(1)
+        self.assertLess(time.monotonic() - started, 2.0)
+        self.pool.discard(sock)
+
+    def test_released_connection_is_reused(self):
+        sock, _ = self.pool.acquire(self.addr)
+        self.pool.release(self.addr, sock)
+
+        again, reused = self.pool.acquire(self.addr)
+        self.assertIs(again, sock)
+        self.assertTrue(reused)
+        self.assertEqual(again.gettimeout(), 0.2)
+        self.pool.discard(again)
+
+    def test_idle_connections_are_bounded_and_expire(self):
+        socks = [self.pool.acquire(self.addr)[0] for _ in range(3)]
+        for sock in socks:
+            self.pool.release(self.addr, sock)
+        self.assertEqual(len(self.pool.idle[self.addr]), 2)
+        self.assertEqual(socks[2].fileno(), -1)  # além de max_per_device: fechada
+
+        time.sleep(0.3)
+        sock, reused = self.pool.acquire(self.addr)
+        self.assertFalse(reused)
+        self.assertTrue(all(old.fileno() == -1 for old in socks[:2]))
+        self.pool.discard(sock)
+
+
+if __name__ == "__main__":
+    unittest.main()
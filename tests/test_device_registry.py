@@ -0,0 +1,140 @@
+import unittest
+
+from device_registry import DeviceRegistry
+
+
+def lamp(device_id, **fields):
+    device = {"id": device_id, "type": "smart_lamp", "status": '{"power": "OFF"}'}
+    device.update(fields)
+    return device
+
+
+class DeviceRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = DeviceRegistry(max_tombstones=2)
+        self.notified = []
+        self.registry.add_listener(self.notified.append)
+
+    def test_first_sync_is_full(self):
+        self.registry.put(lamp("a"))
+        self.registry.put(lamp("b"))
+
+        version, changed, removed, full_sync = self.registry.changes_since(0)
+        self.assertEqual(version, 2)
+        self.assertEqual({device["id"] for device in changed}, {"a", "b"})
+        self.assertEqual(removed, [])
+        self.assertTrue(full_sync)
+
+    def test_delta_has_only_changes_since_version(self):
+        self.registry.put(lamp("a"))
+        self.registry.put(lamp("b"))
+        version = self.registry.version
+
+        self.registry.update("b", status='{"power": "ON"}')
+        self.registry.put(lamp("c"))
+        new_version, changed, removed, full_sync = self.registry.changes_since(version)
+
+        self.assertEqual(new_version, version + 2)
+        self.assertEqual(sorted(device["id"] for device in changed), ["b", "c"])
+        self.assertEqual(removed, [])
+        self.assertFalse(full_sync)
+
+    def test_update_without_change_keeps_version(self):
+        self.registry.put(lamp("a"))
+        version = self.registry.version
+        self.registry.update("a", status='{"power": "OFF"}')
+
+        self.assertEqual(self.registry.version, version)
+        self.assertEqual(self.registry.changes_since(version)[1], [])
+        self.assertEqual(self.notified, ["a"])
+
+    def test_update_creates_from_defaults(self):
+        self.assertIsNone(self.registry.update("a", status="{}"))
+        device = self.registry.update("a", defaults=lamp("a"), ip="10.0.0.1")
+        self.assertEqual(device["ip"], "10.0.0.1")
+        self.assertIn("a", self.registry)
+
+    def test_removal_leaves_tombstone(self):
+        self.registry.put(lamp("a"))
+        self.registry.put(lamp("b"))
+        version = self.registry.version
+
+        self.assertIsNotNone(self.registry.remove("a"))
+        self.assertIsNone(self.registry.remove("a"))
+        _, changed, removed, full_sync = self.registry.changes_since(version)
+
+        self.assertEqual(changed, [])
+        self.assertEqual(removed, ["a"])
+        self.assertFalse(full_sync)
+        self.assertNotIn("a", self.registry)
+        self.assertEqual(self.notified, ["a", "b", "a"])
+
+    def test_put_after_removal_clears_tombstone(self):
+        self.registry.put(lamp("a"))
+        version = self.registry.version
+        self.registry.remove("a")
+        self.registry.put(lamp("a"))
+
+        _, changed, removed, _ = self.registry.changes_since(version)
+        self.assertEqual([device["id"] for device in changed], ["a"])
+        self.assertEqual(removed, [])
+
+    def test_dropped_tombstones_force_full_sync(self):
+        for device_id in "abcd":
+            self.registry.put(lamp(device_id))
+        version = self.registry.version
+        for device_id in "abc":
+            self.registry.remove(device_id)
+
+        # Só cabem 2 tombstones: a remoção de "a" foi esquecida
+        self.assertEqual(list(self.registry.tombstones), ["b", "c"])
+        _, changed, removed, full_sync = self.registry.changes_since(version)
+        self.assertTrue(full_sync)
+        self.assertEqual([device["id"] for device in changed], ["d"])
+        self.assertEqual(removed, [])
+
+    def test_version_from_the_future_forces_full_sync(self):
+        self.registry.put(lamp("a"))
+        self.assertTrue(self.registry.changes_since(self.registry.version + 10)[3])
+
+
+class DeviceLeaseTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = DeviceRegistry(lease_duration=10.0)
+
+    def test_expired_lease_removes_device(self):
+        self.registry.put(lamp("a", expires_at=100.0))
+        self.registry.put(lamp("b", expires_at=200.0))
+
+        self.assertEqual(self.registry.expire(now=50.0), [])
+        self.assertEqual(self.registry.expire(now=150.0), ["a"])
+        self.assertNotIn("a", self.registry)
+        self.assertIn("a", self.registry.tombstones)
+        self.assertIn("b", self.registry)
+
+    def test_touch_renews_lease(self):
+        self.registry.put(lamp("a", expires_at=100.0))
+        self.registry.touch("a", last_seen=95.0)
+
+        self.assertEqual(self.registry.expire(now=101.0), [])
+        self.assertEqual(self.registry["a"]["expires_at"], 105.0)
+        self.assertEqual(self.registry.expire(now=106.0), ["a"])
+
+    def test_touch_does_not_bump_version(self):
+        self.registry.put(lamp("a"))
+        version = self.registry.version
+        self.registry.touch("a", last_seen=1.0)
+        self.registry.touch("missing", last_seen=1.0)
+        self.assertEqual(self.registry.version, version)
+
+    def test_removed_then_readded_device_gets_new_lease(self):
+        self.registry.put(lamp("a", expires_at=100.0))
+        self.registry.remove("a")
+        self.registry.put(lamp("a", expires_at=300.0))
+
+        self.assertEqual(self.registry.expire(now=150.0), [])
+        self.assertEqual(self.registry.expire(now=301.0), ["a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+import json
+import socket
+import unittest
+
+import device_pb2
+from async_gateway import AsyncGateway
+from gateway import DEVICES_FIELD_NUMBER, Gateway, encode_length_delimited
+
+
+def sensor_packet(device_id, value, timestamp=1000):
+    data = device_pb2.SensorData(device_id=device_id, sensor_type="temperature", value=value,
+                                 timestamp=timestamp)
+    return data.SerializeToString()
+
+
+class GatewayTestCase(unittest.TestCase):
+    """Gateway em portas livres, sem log em disco, métricas nem feed"""
+    gateway_class = Gateway
+
+    def setUp(self):
+        self.gateway = self.gateway_class(sensor_log_dir="", tcp_port=0, announce_port=0, sensor_port=0,
+                               metrics_port=0, state_feed_port=0)
+
+    def tearDown(self):
+        for sock in (self.gateway.tcp_socket, self.gateway.udp_socket, self.gateway.sensor_socket):
+            sock.close()
+        self.gateway.device_executor.shutdown(wait=False)
+
+
+class SensorHistoryLifecycleTest(GatewayTestCase):
+    def test_history_follows_registry(self):
+        device_id = "temperature_sensor_10.0.0.5_5000"
+        self.gateway.handle_sensor_packet(sensor_packet(device_id, 21.0), ("10.0.0.5", 5000))
+        self.assertEqual(len(self.gateway.history.query(device_id, 0, 2000)), 1)
+
+        self.gateway.devices.update(device_id, status='{"temperature": 22.0}')
+        self.assertIn(device_id, self.gateway.history.series)
+
+        self.gateway.devices.remove(device_id)
+        self.assertNotIn(device_id, self.gateway.history.series)
+
+    def test_expired_lease_drops_history(self):
+        device_id = "temperature_sensor_10.0.0.6_5000"
+        self.gateway.handle_sensor_packet(sensor_packet(device_id, 21.0), ("10.0.0.6", 5000))
+        self.gateway.devices.expire(now=self.gateway.devices[device_id]["expires_at"] + 1)
+        self.assertNotIn(device_id, self.gateway.history.series)
+
+
+class SensorDropsTest(GatewayTestCase):
+    device_id = "temperature_sensor_10.0.0.8_5000"
+
+    def send_sensor_packets(self, count):
+        port = self.gateway.sensor_socket.getsockname()[1]
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+            for _ in range(count):
+                sender.sendto(sensor_packet(self.device_id, 21.0), ("127.0.0.1", port))
+
+    def receive_all(self):
+        """Esvazia o socket de sensores pelo caminho do gateway"""
+        self.gateway.sensor_socket.setblocking(False)
+        while True:
+            try:
+                self.gateway.receive_sensor_datagram()
+            except BlockingIOError:
+                return
+
+    def overflow_sensor_socket(self):
+        """Enche o buffer mínimo do socket até o kernel descartar; depois lê tudo"""
+        if not self.gateway.sensor_track_drops:
+            self.skipTest("SO_RXQ_OVFL indisponível")
+        self.gateway.sensor_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1)
+        self.send_sensor_packets(500)
+        self.receive_all()
+        # O kernel anota a contagem nos datagramas enfileirados depois do descarte
+        self.send_sensor_packets(1)
+
+    def test_single_socket_reports_drops(self):
+        self.assertEqual(self.gateway.collect_stats().get("sensor_udp_drops", 0), 0)
+        self.overflow_sensor_socket()
+        self.receive_all()
+        self.assertGreater(self.gateway.collect_stats()["sensor_udp_drops"], 0)
+
+
+class AsyncSensorDropsTest(SensorDropsTest):
+    gateway_class = AsyncGateway
+
+    def test_single_socket_reports_drops(self):
+        self.overflow_sensor_socket()
+        self.gateway.on_sensor_readable()
+        self.assertGreater(self.gateway.collect_stats()["sensor_udp_drops"], 0)
+        self.assertEqual(len(self.gateway.history.query(self.device_id, 0, 2000)), 1)
+
+
+class LengthDelimitedTest(unittest.TestCase):
+    def test_matches_protobuf_for_every_varint_length(self):
+        # Tamanhos com varint de 1, 2 e 3 bytes, e nas bordas entre eles
+        for size in (0, 1, 127, 128, 300, 16383, 16384, 70000):
+            dev = device_pb2.DeviceInfo(device_id="lamp", status="x" * size)
+            expected = device_pb2.ClientResponse()
+            expected.devices.add().CopyFrom(dev)
+
+            encoded = encode_length_delimited(DEVICES_FIELD_NUMBER, dev.SerializeToString())
+            self.assertEqual(encoded, expected.SerializeToString(), size)
+
+
+class EncodedDevicesTest(GatewayTestCase):
+    def put_lamp(self, device_id, status):
+        return self.gateway.devices.put({"id": device_id, "type": "smart_lamp", "ip": "10.0.0.7",
+                                         "port": 5000, "status": json.dumps(status)})
+
+    def test_cached_entries_build_a_valid_response(self):
+        small = self.put_lamp("lamp_small", {"power": "ON"})
+        large = self.put_lamp("lamp_large", {"power": "ON", "note": "x" * 200})
+        self.assertGreaterEqual(len(self.gateway.encode_device_info(large)), 128)
+
+        devices_data = b"".join(self.gateway.encode_device_info(device_info) for device_info in (small, large))
+        # Os devices vão depois dos outros campos, como no LIST_DEVICES
+        head = device_pb2.ClientResponse(success=True, version=2)
+        parsed = device_pb2.ClientResponse()
+        parsed.ParseFromString(head.SerializeToString() + devices_data)
+
+        expected = device_pb2.ClientResponse()
+        for device_info in (small, large):
+            self.gateway.fill_device_info(expected.devices.add(), device_info)
+        self.assertEqual(devices_data, expected.SerializeToString())
+        expected.MergeFrom(head)
+        self.assertEqual(parsed, expected)
+
+    def test_cache_follows_version(self):
+        device_info = self.put_lamp("lamp", {"power": "OFF"})
+        first = self.gateway.encode_device_info(device_info)
+        self.assertIs(self.gateway.encode_device_info(device_info), first)
+
+        self.gateway.devices.update("lamp", status=json.dumps({"power": "ON"}))
+        parsed = device_pb2.ClientResponse()
+        parsed.ParseFromString(self.gateway.encode_device_info(device_info))
+        self.assertEqual(json.loads(parsed.devices[0].status), {"power": "ON"})
+
+    def test_list_devices_response_parses(self):
+        for i in range(20):
+            self.put_lamp(f"lamp_{i}", {"power": "ON", "brightness": i, "note": "y" * (i * 10)})
+        request = device_pb2.ClientRequest(command="LIST_DEVICES", request_id=7)
+
+        response = device_pb2.ClientResponse()
+        response.ParseFromString(self.gateway.process_client_request(request))
+        self.assertTrue(response.success)
+        self.assertEqual(response.request_id, 7)
+        self.assertEqual(sorted(device.device_id for device in response.devices),
+                         sorted(f"lamp_{i}" for i in range(20)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+from protocol import DEFAULT_MAX_SILENCE, ReportPolicy
+
+
+class ReportPolicyTest(unittest.TestCase):
+    def setUp(self):
+        self.state = {"temperature": 25.0, "unit": "°C"}
+        self.policy = ReportPolicy("temperature_sensor", self.state)
+
+    def test_defaults_go_into_state(self):
+        self.assertEqual(self.state["deadband"], 0.1)
+        self.assertEqual(self.state["max_silence"], DEFAULT_MAX_SILENCE)
+
+    def test_reports_only_changes_above_deadband(self):
+        self.assertTrue(self.policy.should_report(25.0, now=0.0))
+        self.assertFalse(self.policy.should_report(25.05, now=2.0))
+        self.assertFalse(self.policy.should_report(24.95, now=4.0))
+        self.assertTrue(self.policy.should_report(25.2, now=6.0))
+        # A deadband conta a partir do último envio, não da última leitura
+        self.assertFalse(self.policy.should_report(25.25, now=8.0))
+        self.assertTrue(self.policy.should_report(25.31, now=10.0))
+
+    def test_heartbeat_after_max_silence(self):
+        self.assertTrue(self.policy.should_report(25.0, now=0.0))
+        self.assertFalse(self.policy.should_report(25.0, now=DEFAULT_MAX_SILENCE - 1))
+        self.assertTrue(self.policy.should_report(25.0, now=DEFAULT_MAX_SILENCE))
+
+    def test_zero_deadband_reports_any_change(self):
+        policy = ReportPolicy("power_sensor", {"power": 0, "unit": "W"})
+        self.assertTrue(policy.should_report(10, now=0.0))
+        self.assertFalse(policy.should_report(10, now=1.0))
+        self.assertTrue(policy.should_report(20, now=2.0))
+
+    def test_configure(self):
+        self.assertEqual(self.policy.configure({"deadband": 0.5}),
+                         (True, "Reporting changes above 0.5 °C, at least every 30 seconds"))
+        self.assertTrue(self.policy.configure({"max_silence": 60})[0])
+        self.assertEqual((self.state["deadband"], self.state["max_silence"]), (0.5, 60))
+
+    def test_configure_rejects_invalid_values(self):
+        self.assertFalse(self.policy.configure({})[0])
+        self.assertFalse(self.policy.configure({"deadband": -1})[0])
+        self.assertFalse(self.policy.configure({"max_silence": 0})[0])
+        self.assertEqual((self.state["deadband"], self.state["max_silence"]), (0.1, DEFAULT_MAX_SILENCE))
+
+
+if __name__ == "__main__":
+    unittest.main()
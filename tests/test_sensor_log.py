@@ -0,0 +1,121 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import sensor_log
+from sensor_log import RECORD, SensorLog
+
+
+class SensorLogTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="sensor_log_")
+        self.logs = []
+
+    def tearDown(self):
+        for log in self.logs:
+            log.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def open_log(self, **options):
+        options.setdefault("flush_interval", 60.0)
+        log = SensorLog(self.directory, **options)
+        self.logs.append(log)
+        return log
+
+    def fill(self, log, start, count, step=1.0):
+        for i in range(count):
+            recv_time = start + i * step
+            log.append(recv_time, recv_time, float(i), "temp_1", "temperature")
+            log.append(recv_time, recv_time, -float(i), "temp_2", "temperature")
+        log.flush()
+
+    def test_query_by_range_and_device(self):
+        log = self.open_log(index_every=4)
+        self.fill(log, 1000.0, 50)
+
+        points = log.query("temp_1", 1010.0, 1019.0)
+        self.assertEqual(points, [(1000.0 + i, float(i)) for i in range(10, 20)])
+        self.assertEqual(log.query("temp_2", 1049.0, 2000.0), [(1049.0, -49.0)])
+        self.assertEqual(log.query("temp_3", 0, 2000.0), [])
+
+    def test_query_only_sees_flushed_records(self):
+        log = self.open_log()
+        log.append(1000.0, 1000, 1.0, "temp_1", "temperature")
+        self.assertEqual(log.query("temp_1", 0, 2000.0), [])
+        log.flush()
+        self.assertEqual(log.query("temp_1", 0, 2000.0), [(1000.0, 1.0)])
+
+    def test_append_never_flushes_or_syncs(self):
+        log = self.open_log()
+        with mock.patch.object(sensor_log.os, "fsync") as fsync:
+            for i in range(100):
+                log.append(1000.0 + i * 10, 1000 + i * 10, float(i), "temp_1", "temperature")
+        fsync.assert_not_called()
+        self.assertEqual(log.query("temp_1", 0, 5000.0), [])
+
+    def test_fsync_runs_outside_the_lock(self):
+        log = self.open_log(segment_max_bytes=RECORD.size * 10)
+        synced = []
+
+        def fsync(fd):
+            self.assertFalse(log.lock.locked())
+            synced.append(fd)
+
+        with mock.patch.object(sensor_log.os, "fsync", fsync):
+            self.fill(log, 1000.0, 25)
+        # Os dois arquivos de cada segmento (os que giraram e o ativo)
+        self.assertEqual(len(synced), 2 * len(log.segments))
+        self.assertEqual(log.unsynced, [])
+
+    def test_flush_thread_publishes_quiet_sensor(self):
+        log = self.open_log(flush_interval=0.05)
+        now = time.time()
+        log.append(now, now, 21.5, "temp_1", "temperature")
+
+        deadline = time.time() + 5
+        while not log.query("temp_1", 0, now + 1) and time.time() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(log.query("temp_1", 0, now + 1), [(now, 21.5)])
+
+    def test_segments_rotate_and_reload(self):
+        log = self.open_log(segment_max_bytes=RECORD.size * 10)
+        self.fill(log, 1000.0, 25)
+        self.assertGreater(len(log.segments), 1)
+        log.close()
+
+        reopened = self.open_log()
+        self.assertEqual(len(reopened.query("temp_1", 0, 2000.0)), 25)
+
+    def test_retention_drops_expired_segments(self):
+        log = self.open_log(segment_max_age=10, retention_seconds=180)
+        self.fill(log, 1000.0, 10)
+        self.fill(log, 1050.0, 10)
+        self.fill(log, 1200.0, 10)
+
+        # Em 1200 o primeiro segmento (até 1009) passou da retenção; o segundo (até 1059) não
+        self.assertEqual(len(log.segments), 2)
+        self.assertEqual(log.query("temp_1", 0, 1100.0)[0], (1050.0, 0.0))
+
+    def test_retention_by_total_size_keeps_active_segment(self):
+        log = self.open_log(segment_max_bytes=RECORD.size * 10, max_total_bytes=RECORD.size * 20)
+        self.fill(log, 1000.0, 40)
+
+        self.assertLessEqual(sum(segment.size() for segment in log.segments[:-1]), RECORD.size * 20)
+        self.assertEqual(log.query("temp_1", 1039.0, 1039.0), [(1039.0, 39.0)])
+
+    def test_query_skips_segment_removed_by_retention(self):
+        log = self.open_log(segment_max_bytes=RECORD.size * 10)
+        self.fill(log, 1000.0, 25)
+        oldest = log.segments[0]
+        os.remove(oldest.log_path)  # como se a retenção tivesse apagado depois da listagem
+
+        points = log.query("temp_1", 0, 2000.0)
+        self.assertTrue(points)
+        self.assertGreater(points[0][0], oldest.last_time)
+
+
+if __name__ == "__main__":
+    unittest.main()
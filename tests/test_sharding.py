@@ -0,0 +1,99 @@
+import json
+import unittest
+from collections import Counter
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import device_pb2
+from sharding import HashRing, Shard, ShardMembership, gateway_endpoint
+from tests.test_client import FakeGateway
+
+KEYS = [f"smart_lamp_10.0.0.{i % 250}_{5000 + i}" for i in range(10000)]
+
+
+def make_shards(*names):
+    return [Shard(name, f"10.0.1.{i}", announce_port=50001 + 10 * i, sensor_port=50002 + 10 * i)
+            for i, name in enumerate(names)]
+
+
+def owners(ring):
+    return {key: ring.owner(key).shard_id for key in KEYS}
+
+
+class HashRingTest(unittest.TestCase):
+    def test_owner_is_stable(self):
+        self.assertEqual(owners(HashRing(make_shards("a", "b", "c"))),
+                         owners(HashRing(list(reversed(make_shards("a", "b", "c"))))))
+
+    def test_keys_spread_over_shards(self):
+        counts = Counter(owners(HashRing(make_shards("a", "b", "c", "d"))).values())
+        self.assertEqual(set(counts), {"a", "b", "c", "d"})
+        for count in counts.values():
+            self.assertGreater(count, len(KEYS) / 4 * 0.6)
+
+    def test_adding_shard_moves_only_its_share(self):
+        before = owners(HashRing(make_shards("a", "b", "c")))
+        after = owners(HashRing(make_shards("a", "b", "c", "d")))
+
+        moved = [key for key in KEYS if before[key] != after[key]]
+        # Só chaves que passam para o shard novo, em torno de 1/4 do total
+        self.assertTrue(all(after[key] == "d" for key in moved))
+        self.assertLess(len(moved), len(KEYS) * 0.4)
+        self.assertGreater(len(moved), len(KEYS) * 0.1)
+
+    def test_removing_shard_moves_only_its_keys(self):
+        before = owners(HashRing(make_shards("a", "b", "c", "d")))
+        after = owners(HashRing(make_shards("a", "b", "d")))
+
+        for key in KEYS:
+            if before[key] != "c":
+                self.assertEqual(after[key], before[key])
+            else:
+                self.assertNotEqual(after[key], "c")
+
+
+class GatewayEndpointTest(unittest.TestCase):
+    def discovery(self, shards=None):
+        message = device_pb2.DeviceCommand(command="GATEWAY_DISCOVERY")
+        if shards is not None:
+            message.parameters = json.dumps({"shards": [shard.to_dict() for shard in shards]})
+        return message
+
+    def test_single_gateway_uses_sender(self):
+        self.assertEqual(gateway_endpoint(self.discovery(), ("10.0.0.9", 5007), KEYS[0]),
+                         ("10.0.0.9", 50001, 50002))
+
+    def test_sharded_gateway_uses_ring_owner(self):
+        shards = make_shards("a", "b", "c")
+        owner = HashRing(shards).owner(KEYS[0])
+        self.assertEqual(gateway_endpoint(self.discovery(shards), ("10.0.0.9", 5007), KEYS[0]),
+                         (owner.ip, owner.announce_port, owner.sensor_port))
+
+
+class ShardMembershipTest(unittest.TestCase):
+    def setUp(self):
+        self.gateway = FakeGateway()
+        self.addr = ("127.0.0.1", self.gateway.port)
+        self.membership = ShardMembership(Shard("a", "127.0.0.1"))
+
+    def tearDown(self):
+        for client in self.membership.clients.values():
+            client.disconnect()
+        self.gateway.close()
+
+    def test_timeout_keeps_shared_connection(self):
+        client = self.membership._client(self.addr)
+        other = client.send_request_async(device_pb2.ClientRequest(command="SILENT"))
+
+        with self.assertRaises(FutureTimeoutError):
+            self.membership.send(self.addr, device_pb2.ClientRequest(command="SILENT"), timeout=0.2)
+
+        # Só a requisição que expirou sai de pending; os outros repasses seguem esperando
+        self.assertEqual(len(client.pending), 1)
+        self.assertFalse(other.done())
+        response = self.membership.send(self.addr, device_pb2.ClientRequest(command="PING"))
+        self.assertEqual(response.message, "PING")
+        self.assertEqual(self.gateway.connections, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import state_bus
+from state_bus import BUS_SIZE, SEQ, StateBus, _record
+
+
+def publish_lamps(path, first, count):
+    """Processo filho: publica count lâmpadas no barramento compartilhado"""
+    bus = StateBus(path)
+    for i in range(first, first + count):
+        bus.publish("smart_lamp", f"lamp_{i}", power=10, brightness=i)
+    bus.close()
+
+
+class StateBusTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="state_bus_")
+        self.path = os.path.join(self.directory, "state_bus")
+        self.bus = StateBus(self.path)
+
+    def tearDown(self):
+        self.bus.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_one_record_per_device(self):
+        self.bus.publish("smart_lamp", "lamp_a", power=10, brightness=40)
+        self.bus.publish("smart_lamp", "lamp_b", power=0, brightness=0)
+        self.bus.publish("smart_lamp", "lamp_a", power=10, brightness=80)
+        self.bus.publish("air_conditioner", "ac_a", power=1000, temperature=21.5, mode="COOL",
+                         fan_speed="HIGH")
+
+        self.assertEqual(self.bus.read("smart_lamp"), {
+            "lamp_a": {"power": 10, "brightness": 80},
+            "lamp_b": {"power": 0, "brightness": 0},
+        })
+        self.assertEqual(self.bus.read("air_conditioner"), {
+            "ac_a": {"power": 1000, "temperature": 21.5, "mode": "COOL", "fan_speed": "HIGH"}})
+        self.assertEqual(self.bus.read("environment"), {})
+
+    def test_other_instance_reads_and_keeps_record(self):
+        self.bus.publish("smart_lamp", "lamp_a", power=10, brightness=40)
+        other = StateBus(self.path)
+        try:
+            other.publish("smart_lamp", "lamp_a", power=10, brightness=60)
+            other.publish("smart_lamp", "lamp_b", power=10, brightness=10)
+            self.assertEqual(self.bus._used("smart_lamp"), 2)
+            self.assertEqual(self.bus.read("smart_lamp")["lamp_a"]["brightness"], 60)
+        finally:
+            other.close()
+
+    def test_processes_claim_distinct_records(self):
+        context = multiprocessing.get_context("fork")
+        processes = [context.Process(target=publish_lamps, args=(self.path, i * 10, 10)) for i in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(10)
+            self.assertEqual(process.exitcode, 0)
+
+        states = self.bus.read("smart_lamp")
+        self.assertEqual(len(states), 40)
+        self.assertEqual(sum(state["power"] for state in states.values()), 400)
+        self.assertEqual(self.bus._used("smart_lamp"), 40)
+
+    def test_silent_devices_are_stale_and_then_reclaimed(self):
+        now = 1000.0
+        with mock.patch.object(state_bus.time, "time", lambda: now):
+            self.bus.publish("smart_lamp", "lamp_old", power=10, brightness=50)
+        self.assertEqual(self.bus.read("smart_lamp"), {})
+
+        self.bus.publish("smart_lamp", "lamp_new", power=10, brightness=20)
+        self.assertEqual(list(self.bus.read("smart_lamp")), ["lamp_new"])
+        # Mais de RECLAIM_AFTER sem heartbeat: o registro de lamp_old é reaproveitado
+        self.assertEqual(self.bus._used("smart_lamp"), 1)
+
+    def test_max_age(self):
+        now = 1000.0
+        with mock.patch.object(state_bus.time, "time", lambda: now):
+            self.bus.publish("smart_lamp", "lamp_a", power=10, brightness=50)
+        with mock.patch.object(state_bus.time, "time", lambda: now + 5):
+            self.assertEqual(self.bus.read("smart_lamp"), {})
+            self.assertIn("lamp_a", self.bus.read("smart_lamp", max_age=10))
+
+    def test_record_mid_write_is_skipped(self):
+        self.bus.publish("smart_lamp", "lamp_a", power=10, brightness=50)
+        offset = _record("smart_lamp", 0)
+        seq = SEQ.unpack_from(self.bus.map, offset)[0]
+        SEQ.pack_into(self.bus.map, offset, seq + 1)  # escritor morreu no meio da escrita
+
+        self.assertEqual(self.bus.read("smart_lamp"), {})
+        self.bus.publish("smart_lamp", "lamp_a", power=10, brightness=70)
+        self.assertEqual(self.bus.read("smart_lamp"), {"lamp_a": {"power": 10, "brightness": 70}})
+        self.assertEqual(SEQ.unpack_from(self.bus.map, offset)[0] % 2, 0)
+
+    def test_reader_never_sees_torn_record(self):
+        stop = threading.Event()
+
+        def write():
+            i = 0
+            while not stop.is_set():
+                i += 1
+                self.bus.publish("smart_lamp", "lamp_a", power=i, brightness=i)
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        reader = StateBus(self.path)
+        try:
+            reads = 0
+            while reads < 2000:
+                state = reader.read("smart_lamp").get("lamp_a")
+                if state is not None:
+                    self.assertEqual(state["power"], state["brightness"])
+                    reads += 1
+        finally:
+            stop.set()
+            writer.join()
+            reader.close()
+
+    def test_old_format_is_reset(self):
+        self.bus.close()
+        with open(self.path, "wb") as f:
+            f.write(b"\xff" * BUS_SIZE)
+        self.bus = StateBus(self.path)
+        self.assertEqual(self.bus.read("smart_lamp"), {})
+        self.bus.publish("smart_lamp", "lamp_a", power=10, brightness=50)
+        self.assertIn("lamp_a", self.bus.read("smart_lamp"))
+
+
+if __name__ == "__main__":
+    unittest.main()
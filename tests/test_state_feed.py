@@ -0,0 +1,48 @@
+import unittest
+from unittest import mock
+
+import device_pb2
+import state_feed
+from state_feed import FEED_HEARTBEAT, StateFeed
+
+
+def lamp_feed(version, brightness):
+    feed = device_pb2.ActuatorFeed()
+    state = feed.states.add(device_id="lamp_a", device_type="smart_lamp", version=version)
+    state.state.lamp.power = device_pb2.POWER_ON
+    state.state.lamp.brightness = brightness
+    return feed.SerializeToString()
+
+
+class StateFeedTest(unittest.TestCase):
+    def setUp(self):
+        self.feed = StateFeed(port=0)
+        self.now = 1000.0
+
+    def receive(self, version, brightness):
+        with mock.patch.object(state_feed.time, "time", lambda: self.now):
+            self.feed.receive(lamp_feed(version, brightness))
+
+    def brightness(self):
+        with mock.patch.object(state_feed.time, "time", lambda: self.now):
+            return self.feed.read("smart_lamp")["lamp_a"]["brightness"]
+
+    def test_late_datagram_is_ignored(self):
+        self.receive(5, 80)
+        self.now += FEED_HEARTBEAT / 2
+        self.receive(4, 40)
+        self.assertEqual(self.brightness(), 80)
+
+    def test_restarted_gateway_is_accepted(self):
+        self.receive(500, 80)
+        # O gateway reiniciou: versões recomeçam em 1, depois de pelo menos um heartbeat sem feed
+        self.now += FEED_HEARTBEAT * 1.5
+        self.receive(1, 30)
+        self.assertEqual(self.brightness(), 30)
+        self.now += FEED_HEARTBEAT / 2
+        self.receive(2, 35)
+        self.assertEqual(self.brightness(), 35)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from device_registry import DeviceRegistry
+from status_cache import StatusCache
+
+
+class SlowDevice:
+    """fetch falso: conta as chamadas e demora até release()"""
+    def __init__(self):
+        self.calls = 0
+        self.gate = threading.Event()
+
+    def fetch(self, device_id):
+        self.calls += 1
+        self.gate.wait(5)
+        return (True, "Status retrieved", f'{{"call": {self.calls}}}')
+
+
+class StatusCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=16)
+        self.device = SlowDevice()
+        self.registry = DeviceRegistry()
+        self.registry.put({"id": "lamp", "type": "smart_lamp"})
+        self.cache = StatusCache(self.device.fetch, self.executor, ttl=5.0, stale_ttl=10.0,
+                                 registry=self.registry)
+
+    def tearDown(self):
+        self.device.gate.set()
+        self.executor.shutdown(wait=True)
+
+    def test_concurrent_reads_share_one_fetch(self):
+        futures = [self.executor.submit(self.cache.get, "lamp") for _ in range(10)]
+        deadline = time.time() + 5
+        while self.cache.coalesced < 9 and time.time() < deadline:
+            time.sleep(0.01)
+        self.device.gate.set()
+
+        results = {future.result(5) for future in futures}
+        self.assertEqual(len(results), 1)
+        self.assertEqual(self.device.calls, 1)
+        self.assertEqual(self.cache.stats()["status_cache_fetches"], 1)
+
+    def test_fresh_value_is_served_from_cache(self):
+        self.device.gate.set()
+        first = self.cache.get("lamp")
+        self.assertEqual(self.cache.get("lamp"), first)
+        self.assertEqual(self.device.calls, 1)
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_stale_value_is_served_while_refreshing(self):
+        self.device.gate.set()
+        first = self.cache.get("lamp")
+        self.cache.entries["lamp"].fetched_at -= 6.0  # entre ttl e stale_ttl
+
+        self.assertEqual(self.cache.get("lamp"), first)
+        self.assertEqual(self.cache.stale_hits, 1)
+        deadline = time.time() + 5
+        while self.device.calls < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.device.calls, 2)
+
+    def test_failed_fetch_is_not_cached(self):
+        cache = StatusCache(lambda device_id: (False, "Device not found", ""), self.executor,
+                            registry=self.registry)
+        self.assertFalse(cache.get("lamp")[0])
+        self.assertIsNone(cache.entries["lamp"].value)
+
+    def test_unknown_devices_are_not_cached(self):
+        self.device.gate.set()
+        self.assertTrue(self.cache.get("ghost")[0])
+        self.cache.put("ghost", (True, "Status retrieved", "{}"))
+        self.assertNotIn("ghost", self.cache.entries)
+
+    def test_removed_device_leaves_the_cache(self):
+        self.device.gate.set()
+        self.cache.get("lamp")
+        self.assertIn("lamp", self.cache.entries)
+
+        self.registry.update("lamp", status='{"power": "ON"}')
+        self.assertIn("lamp", self.cache.entries)
+        self.registry.remove("lamp")
+        self.assertNotIn("lamp", self.cache.entries)
+
+
+if __name__ == "__main__":
+    unittest.main()
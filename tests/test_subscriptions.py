@@ -0,0 +1,135 @@
+import threading
+import time
+import unittest
+
+import device_pb2
+from device_registry import DeviceRegistry
+from gateway import DEVICES_FIELD_NUMBER, encode_length_delimited
+from subscriptions import SubscriptionManager
+
+
+def encode_device_info(device_info):
+    dev = device_pb2.DeviceInfo(device_id=device_info['id'], device_type=device_info['type'],
+                                status=device_info['status'])
+    return encode_length_delimited(DEVICES_FIELD_NUMBER, dev.SerializeToString())
+
+
+class FakeSession:
+    """Guarda cada push recebido, com o instante de chegada"""
+    def __init__(self):
+        self.pushes = []
+        self.lock = threading.Lock()
+
+    def send(self, data):
+        response = device_pb2.ClientResponse()
+        response.ParseFromString(data)
+        with self.lock:
+            self.pushes.append((time.monotonic(), response))
+
+    def wait(self, count, timeout=5):
+        deadline = time.monotonic() + timeout
+        while len(self.pushes) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.responses
+
+    @property
+    def responses(self):
+        return [response for _, response in self.pushes]
+
+
+class SubscriptionManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = DeviceRegistry()
+        self.manager = SubscriptionManager(self.registry, encode_device_info)
+
+    def put(self, device_id, device_type="smart_lamp", status="{}"):
+        self.registry.put({"id": device_id, "type": device_type, "status": status})
+
+    def subscribe(self, interval=0.05, **filters):
+        session = FakeSession()
+        response, devices_data = self.manager.subscribe(session, 1, interval=interval, **filters)
+        initial = device_pb2.ClientResponse()
+        initial.ParseFromString(response.SerializeToString() + devices_data)
+        return session, initial
+
+    def test_initial_response_has_current_state(self):
+        self.put("lamp_1")
+        self.put("ac_1", "air_conditioner")
+        _, initial = self.subscribe()
+        self.assertTrue(initial.full_sync)
+        self.assertEqual(sorted(device.device_id for device in initial.devices), ["ac_1", "lamp_1"])
+
+    def test_at_most_one_push_per_interval(self):
+        self.put("lamp_1")
+        session, _ = self.subscribe(interval=0.2)
+
+        started = time.monotonic()
+        for i in range(100):
+            self.registry.update("lamp_1", status=f'{{"brightness": {i}}}')
+            time.sleep(0.01)
+        elapsed = time.monotonic() - started
+        pushes = session.wait(1)
+        time.sleep(0.3)
+
+        times = [pushed_at for pushed_at, _ in session.pushes]
+        self.assertLessEqual(len(times), elapsed / 0.2 + 2)
+        for before, after in zip(times, times[1:]):
+            self.assertGreaterEqual(after - before, 0.19)
+        # Cada push leva o device uma vez só, com o estado mais recente
+        last = session.pushes[-1][1]
+        self.assertEqual([device.status for device in last.devices], ['{"brightness": 99}'])
+        self.assertTrue(all(len(push.devices) == 1 for push in pushes))
+
+    def test_type_filter(self):
+        session, _ = self.subscribe(device_types=["air_conditioner"])
+        self.put("lamp_1")
+        self.put("ac_1", "air_conditioner")
+
+        pushes = session.wait(1)
+        time.sleep(0.1)
+        self.assertEqual([device.device_id for push in session.responses for device in push.devices], ["ac_1"])
+        self.assertEqual(pushes[0].request_id, 1)
+
+    def test_device_id_filter(self):
+        session, _ = self.subscribe(device_ids=["lamp_2"])
+        self.put("lamp_1")
+        self.put("lamp_2")
+
+        session.wait(1)
+        time.sleep(0.1)
+        self.assertEqual([device.device_id for push in session.responses for device in push.devices], ["lamp_2"])
+
+    def test_removal_only_to_subscribers_that_knew_the_device(self):
+        self.put("lamp_1")
+        knew, _ = self.subscribe()
+        other, _ = self.subscribe(device_ids=["lamp_2"])
+        late, _ = self.subscribe(device_types=["air_conditioner"])
+
+        self.registry.remove("lamp_1")
+        pushes = knew.wait(1)
+        time.sleep(0.1)
+
+        self.assertEqual(list(pushes[0].removed_device_ids), ["lamp_1"])
+        self.assertEqual(other.pushes, [])
+        self.assertEqual(late.pushes, [])
+
+    def test_device_added_after_subscribe_can_be_removed(self):
+        session, _ = self.subscribe()
+        self.put("lamp_1")
+        session.wait(1)
+        self.registry.remove("lamp_1")
+
+        pushes = session.wait(2)
+        self.assertEqual(list(pushes[1].removed_device_ids), ["lamp_1"])
+
+    def test_unsubscribe_stops_pushes(self):
+        session, _ = self.subscribe()
+        self.assertTrue(self.manager.unsubscribe(session, 1))
+        self.assertFalse(self.manager.unsubscribe(session, 1))
+        self.put("lamp_1")
+        time.sleep(0.15)
+        self.assertEqual(session.pushes, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
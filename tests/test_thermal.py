@@ -0,0 +1,81 @@
+import unittest
+
+import numpy as np
+
+from thermal import AC_RATE, APPROACH_RATE, MAX_TEMP, Building
+
+
+def ac(power="ON", temperature=20.0, mode="COOL", fan_speed="MEDIUM"):
+    return {"power": power, "temperature": temperature, "mode": mode, "fan_speed": fan_speed}
+
+
+def scalar_step(temp, outside, ac_state):
+    """Modelo escalar antigo do TemperatureSensor: uma sala e um AC"""
+    fan_factor = {"LOW": 0.5, "MEDIUM": 1.0, "HIGH": 1.5, "AUTO": 1.0}[ac_state["fan_speed"]]
+    effect = 0.0
+    if ac_state["power"] == "ON":
+        if ac_state["mode"] == "COOL" and temp > ac_state["temperature"]:
+            effect = -0.2 * fan_factor
+        elif ac_state["mode"] == "HEAT" and temp < ac_state["temperature"]:
+            effect = 0.2 * fan_factor
+        elif ac_state["mode"] == "FAN":
+            effect = 0.05 * fan_factor * (outside - temp)
+    return min(max(temp + (outside - temp) * APPROACH_RATE + effect, 5.0), 40.0)
+
+
+class BuildingTest(unittest.TestCase):
+    def test_single_room_matches_scalar_model(self):
+        states = [ac(), ac(mode="HEAT", temperature=28.0, fan_speed="LOW"),
+                  ac(mode="FAN", fan_speed="HIGH"), ac(power="OFF")]
+        for state in states:
+            building = Building(1, ac_rooms=[0], outside_temp=25.0)
+            building.temperatures[:] = 27.0
+            building.set_acs([state])
+            expected = 27.0
+            for _ in range(50):
+                expected = scalar_step(expected, 25.0, state)
+                self.assertAlmostEqual(building.step()[0], expected)
+
+    def test_acs_in_the_same_room_add_up(self):
+        building = Building(2, ac_rooms=[0, 0, 1])
+        building.set_acs([ac(), ac(fan_speed="HIGH"), ac(power="OFF")])
+        temps = building.step()
+        self.assertAlmostEqual(temps[0], 25.0 - AC_RATE * 2.5)
+        self.assertAlmostEqual(temps[1], 25.0)
+
+    def test_ac_stops_at_target(self):
+        building = Building(1, ac_rooms=[0])
+        building.set_acs([ac(temperature=24.0)])
+        for _ in range(100):
+            building.step()
+        self.assertLess(abs(building.temperatures[0] - 24.0), AC_RATE)
+
+    def test_lamps_heat_their_room(self):
+        building = Building(2, lamp_rooms=[1, 1])
+        building.set_lamps([10, 0])
+        temps = building.step()
+        self.assertEqual(temps[0], 25.0)
+        self.assertGreater(temps[1], 25.0)
+
+    def test_exchange_between_neighbours_conserves_heat(self):
+        building = Building(2, edges=[(0, 1)], outside_temp=25.0)
+        building.temperatures[:] = [20.0, 30.0]
+        temps = building.step()
+        self.assertAlmostEqual(temps.sum(), 50.0)
+        self.assertGreater(temps[0], 20.0 + (25.0 - 20.0) * APPROACH_RATE)
+
+    def test_grid_neighbours(self):
+        building = Building.grid(6, rooms_per_floor=3)
+        edges = set(zip(building.edge_a.tolist(), building.edge_b.tolist()))
+        self.assertEqual(edges, {(0, 1), (1, 2), (3, 4), (4, 5), (0, 3), (1, 4), (2, 5)})
+
+    def test_temperature_is_clipped(self):
+        building = Building(1, lamp_rooms=[0] * 100)
+        building.set_lamps(np.full(100, 1000.0))
+        for _ in range(10):
+            building.step()
+        self.assertEqual(building.temperatures[0], MAX_TEMP)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import asyncio
+import socket
+import threading
+import time
+import unittest
+
+from transport import FrameError, FrameReader, encode_frame, read_frame_async, recv_frame, send_frame
+
+
+class FrameReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.sender, self.receiver = socket.socketpair()
+        self.receiver.settimeout(5)
+
+    def tearDown(self):
+        self.sender.close()
+        self.receiver.close()
+
+    def send_in_pieces(self, data, piece):
+        """Escreve data em pedaços de piece bytes, para o leitor receber leituras partidas"""
+        def write():
+            for i in range(0, len(data), piece):
+                self.sender.sendall(data[i:i + piece])
+                time.sleep(0.001)
+        thread = threading.Thread(target=write)
+        thread.start()
+        return thread
+
+    def test_frame_split_across_reads(self):
+        payloads = [b"first", b"", b"x" * 1000, b"last"]
+        thread = self.send_in_pieces(b"".join(map(encode_frame, payloads)), 3)
+        reader = FrameReader(self.receiver)
+
+        received = [bytes(reader.read_frame()) for _ in payloads]
+        thread.join()
+        self.assertEqual(received, payloads)
+
+    def test_many_frames_in_one_read(self):
+        payloads = [f"message {i}".encode() for i in range(100)]
+        self.sender.sendall(b"".join(map(encode_frame, payloads)))
+        reader = FrameReader(self.receiver, buffer_size=64)
+
+        self.assertEqual([bytes(reader.read_frame()) for _ in payloads], payloads)
+
+    def test_frame_larger_than_buffer(self):
+        payload = bytes(range(256)) * 1000
+        thread = self.send_in_pieces(encode_frame(payload) + encode_frame(b"next"), 4096)
+        reader = FrameReader(self.receiver, buffer_size=1024)
+
+        self.assertEqual(bytes(reader.read_frame()), payload)
+        self.assertEqual(bytes(reader.read_frame()), b"next")
+        thread.join()
+
+    def test_close_mid_frame_returns_none(self):
+        self.sender.sendall(encode_frame(b"complete") + encode_frame(b"truncated")[:-3])
+        self.sender.close()
+        reader = FrameReader(self.receiver)
+
+        self.assertEqual(bytes(reader.read_frame()), b"complete")
+        self.assertIsNone(reader.read_frame())
+
+    def test_oversized_frame_is_rejected(self):
+        self.sender.sendall(encode_frame(b"x" * 100))
+        with self.assertRaises(FrameError):
+            FrameReader(self.receiver, max_frame_size=10).read_frame()
+
+    def test_recv_frame_reads_exactly_one_frame(self):
+        send_frame(self.sender, b"one")
+        send_frame(self.sender, b"two")
+
+        self.assertEqual(bytes(recv_frame(self.receiver)), b"one")
+        self.assertEqual(bytes(recv_frame(self.receiver)), b"two")
+
+    def test_async_reader(self):
+        async def read():
+            reader = asyncio.StreamReader()
+            for i in range(0, len(data), 2):
+                reader.feed_data(data[i:i + 2])
+            reader.feed_eof()
+            first = await read_frame_async(reader)
+            second = await read_frame_async(reader)
+            with self.assertRaises(asyncio.IncompleteReadError):
+                await read_frame_async(reader)
+            return first, second
+
+        data = encode_frame(b"alpha") + encode_frame(b"beta")
+        self.assertEqual(asyncio.run(read()), (b"alpha", b"beta"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+import argparse
+import time
+import numpy as np
+
+# Taxas por passo de simulação, um SIMULATION_TICK (o update_interval
+# padrão do sensor de temperatura)
+SIMULATION_TICK = 2.0
+APPROACH_RATE = 0.02    # quão rápido cada sala volta à temperatura externa
+AC_RATE = 0.2           # °C por passo de um AC em COOL/HEAT com ventilação MEDIUM
+FAN_RATE = 0.05         # fração da diferença para a externa corrigida no modo FAN
+LAMP_HEAT = 0.001       # °C por passo para cada W de lâmpada acesa na sala
+EXCHANGE_RATE = 0.05    # fração da diferença trocada por passo entre salas vizinhas
+MIN_TEMP = 5.0
+MAX_TEMP = 40.0
+
+AC_MODES = {"COOL": 0, "HEAT": 1, "FAN": 2}
+FAN_FACTORS = {"LOW": 0.5, "MEDIUM": 1.0, "HIGH": 1.5, "AUTO": 1.0}
+
+
+class Building:
+    """
+    Temperatura de todas as salas de um prédio, avançada com uma única
+    atualização vetorizada por passo.
+
+    Cada sala tende à temperatura externa, recebe o efeito dos seus ACs
+    (vários por sala), o calor das lâmpadas acesas e troca calor com as
+    salas vizinhas. Com uma sala, um AC e nada mais, o resultado é o mesmo
+    do modelo escalar antigo do TemperatureSensor.
+    """
+    def __init__(self, rooms, ac_rooms=(), lamp_rooms=(), edges=(), outside_temp=25.0,
+                 exchange_rate=EXCHANGE_RATE):
+        self.rooms = rooms
+        self.outside_temp = outside_temp
+        self.temperatures = np.full(rooms, outside_temp)
+
+        # ACs: sala, ligado, temperatura alvo, modo e fator de ventilação
+        self.ac_room = np.asarray(ac_rooms, dtype=np.intp)
+        self.ac_on = np.zeros(len(self.ac_room), dtype=bool)
+        self.ac_set_temp = np.full(len(self.ac_room), outside_temp)
+        self.ac_mode = np.zeros(len(self.ac_room), dtype=np.int8)
+        self.ac_fan = np.ones(len(self.ac_room))
+
+        # Lâmpadas: sala e potência acesa (W)
+        self.lamp_room = np.asarray(lamp_rooms, dtype=np.intp)
+        self.lamp_watts = np.zeros(len(self.lamp_room))
+
+        # Paredes entre salas: pares (a, b), cada um contado uma vez
+        edges = np.asarray(edges, dtype=np.intp).reshape(-1, 2)
+        self.edge_a = edges[:, 0]
+        self.edge_b = edges[:, 1]
+        self.exchange_rate = exchange_rate
+
+    @classmethod
+    def grid(cls, rooms, rooms_per_floor=None, **kwargs):
+        """
+        Salas em andares de rooms_per_floor (todas num andar se None),
+        vizinhas da sala ao lado e das salas de cima e de baixo
+        """
+        per_floor = rooms_per_floor or rooms
+        index = np.arange(rooms)
+        beside = index[(index % per_floor != per_floor - 1) & (index + 1 < rooms)]
+        above = index[index + per_floor < rooms]
+        edges = np.concatenate([
+            np.stack([beside, beside + 1], axis=1),
+            np.stack([above, above + per_floor], axis=1),
+        ])
+        return cls(rooms, edges=edges, **kwargs)
+
+    def set_acs(self, states):
+        """states: dicionário de estado de cada AC, na ordem de ac_rooms"""
+        self.ac_on[:] = [state["power"] == "ON" for state in states]
+        self.ac_set_temp[:] = [state["temperature"] for state in states]
+        self.ac_mode[:] = [AC_MODES.get(state["mode"], AC_MODES["COOL"]) for state in states]
+        self.ac_fan[:] = [FAN_FACTORS.get(state["fan_speed"], 1.0) for state in states]
+
+    def set_lamps(self, watts):
+        """Potência acesa de cada lâmpada, na ordem de lamp_rooms"""
+        self.lamp_watts[:] = watts
+
+    def step(self):
+        temps = self.temperatures
+
+        # 1) efeito natural de voltar para a temperatura externa
+        delta = (self.outside_temp - temps) * APPROACH_RATE
+
+        # 2) ACs: COOL só resfria acima do alvo, HEAT só aquece abaixo dele,
+        #    FAN empurra de leve para a temperatura externa
+        if len(self.ac_room):
+            ac_temps = temps[self.ac_room]
+            mode = self.ac_mode
+            effect = np.where((mode == AC_MODES["COOL"]) & (ac_temps > self.ac_set_temp), -AC_RATE, 0.0)
+            effect += np.where((mode == AC_MODES["HEAT"]) & (ac_temps < self.ac_set_temp), AC_RATE, 0.0)
+            effect += np.where(mode == AC_MODES["FAN"], FAN_RATE * (self.outside_temp - ac_temps), 0.0)
+            effect *= self.ac_fan * self.ac_on
+            delta += np.bincount(self.ac_room, weights=effect, minlength=self.rooms)
+
+        # 3) calor das lâmpadas
+        if len(self.lamp_room):
+            delta += LAMP_HEAT * np.bincount(self.lamp_room, weights=self.lamp_watts, minlength=self.rooms)
+
+        # 4) troca de calor entre vizinhas, com as temperaturas do início do passo
+        if len(self.edge_a):
+            flow = self.exchange_rate * (temps[self.edge_b] - temps[self.edge_a])
+            delta += np.bincount(self.edge_a, weights=flow, minlength=self.rooms)
+            delta -= np.bincount(self.edge_b, weights=flow, minlength=self.rooms)
+
+        np.clip(temps + delta, MIN_TEMP, MAX_TEMP, out=temps)
+        return temps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede o custo de um passo da simulação térmica")
+    parser.add_argument("--rooms", type=int, default=10000)
+    parser.add_argument("--rooms-per-floor", type=int, default=20)
+    parser.add_argument("--acs-per-room", type=int, default=2)
+    parser.add_argument("--lamps-per-room", type=int, default=4)
+    parser.add_argument("--steps", type=int, default=200)
+    args = parser.parse_args()
+
+    rooms = np.arange(args.rooms)
+    building = Building.grid(args.rooms, args.rooms_per_floor,
+                             ac_rooms=np.repeat(rooms, args.acs_per_room),
+                             lamp_rooms=np.repeat(rooms, args.lamps_per_room))
+    rng = np.random.default_rng(0)
+    building.ac_on[:] = rng.random(len(building.ac_room)) < 0.5
+    building.ac_mode[:] = rng.integers(0, 3, len(building.ac_room))
+    building.ac_set_temp[:] = rng.integers(16, 31, len(building.ac_room))
+    building.lamp_watts[:] = np.where(rng.random(len(building.lamp_room)) < 0.5, 10, 0)
+
+    started = time.perf_counter()
+    for _ in range(args.steps):
+        building.step()
+    elapsed = (time.perf_counter() - started) / args.steps
+    print(f"{args.rooms} rooms, {len(building.ac_room)} ACs, {len(building.lamp_room)} lamps, "
+          f"{len(building.edge_a)} walls: {elapsed * 1e3:.3f} ms per step")
+    print(f"temperature min/mean/max: {building.temperatures.min():.2f} / "
+          f"{building.temperatures.mean():.2f} / {building.temperatures.max():.2f}")
+
+
+if __name__ == "__main__":
+    main()
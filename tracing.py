@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Recorders ativos na thread atual; span() grava em todos eles
+_active = threading.local()
+
+
+class SpanRecorder:
+    """Spans medidos por um processo (gateway ou device) para uma requisição rastreada"""
+    def __init__(self, process, trace_id=0):
+        self.process = process
+        self.trace_id = trace_id
+        self.spans = []  # (nome, processo, início epoch, duração em segundos)
+
+    def add(self, name, start, duration, process=None):
+        # list.append é atômico: o despachante da fila do device grava
+        # enquanto a thread da requisição espera
+        self.spans.append((name, process or self.process, start, duration))
+
+    @contextmanager
+    def span(self, name):
+        start = time.time()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter() - started)
+
+    def add_remote(self, spans):
+        """Spans vindos de outro processo (DeviceResponse.spans, ClientResponse.spans)"""
+        for span in spans:
+            self.add(span.name, span.start, span.duration, span.process)
+
+    def fill(self, spans):
+        """Preenche um campo repeated Span"""
+        for name, process, start, duration in self.spans:
+            span = spans.add()
+            span.name = name
+            span.process = process
+            span.start = start
+            span.duration = duration
+
+
+class Trace(SpanRecorder):
+    """Uma requisição de cliente rastreada no gateway"""
+    def __init__(self, process, trace_id, command, device_id=""):
+        super().__init__(process, trace_id)
+        self.command = command
+        self.device_id = device_id
+        self.start = time.time()
+        self.duration = 0.0
+
+    def fill_proto(self, trace):
+        trace.trace_id = self.trace_id
+        trace.command = self.command
+        trace.device_id = self.device_id
+        trace.start = self.start
+        trace.duration = self.duration
+        self.fill(trace.spans)
+
+
+class TraceBuffer:
+    """Últimos capacity traces concluídos, para GET_TRACES"""
+    def __init__(self, capacity=1024):
+        self.lock = threading.Lock()
+        self.traces = deque(maxlen=capacity)
+
+    def record(self, trace):
+        with self.lock:
+            self.traces.append(trace)
+
+    def recent(self, limit=50, min_duration=0.0, command=None):
+        """
+        Os limit traces mais recentes com duração >= min_duration (e do
+        comando pedido, se houver), do mais novo ao mais antigo
+        """
+        with self.lock:
+            traces = list(self.traces)
+        found = []
+        for trace in reversed(traces):
+            if trace.duration >= min_duration and command in (None, trace.command):
+                found.append(trace)
+                if len(found) >= limit:
+                    break
+        return found
+
+
+def active():
+    """Recorders ativos na thread atual (tupla vazia se nenhum)"""
+    return getattr(_active, "recorders", ())
+
+
+@contextmanager
+def activate(*recorders):
+    """Faz span() gravar nesses recorders enquanto o bloco roda nesta thread"""
+    previous = active()
+    _active.recorders = recorders
+    try:
+        yield
+    finally:
+        _active.recorders = previous
+
+
+@contextmanager
+def span(name):
+    """Cronometra o bloco nos recorders ativos; sem nenhum, não faz nada"""
+    recorders = active()
+    if not recorders:
+        yield
+        return
+    start = time.time()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        for recorder in recorders:
+            recorder.add(name, start, duration)
+
+
+def add_remote(spans):
+    for recorder in active():
+        recorder.add_remote(spans)
+
+
+def current_trace_id():
+    recorders = active()
+    return recorders[0].trace_id if recorders else 0
+
+
+def traced_command(command_msg, handle, process):
+    """
+    Usado pelos devices: executa handle(command_msg) e, se o gateway mandou
+    trace_id, devolve os spans medidos junto com a DeviceResponse
+    """
+    if not command_msg.trace_id:
+        return handle(command_msg)
+    recorder = SpanRecorder(process, command_msg.trace_id)
+    with activate(recorder), recorder.span("device.handle_command"):
+        response = handle(command_msg)
+    recorder.fill(response.spans)
+    return response
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+import struct
+
+# Todo frame TCP do sistema: 4 bytes big-endian com o tamanho e a mensagem
+HEADER = struct.Struct('>I')
+# Frames maiores que isso indicam um peer com defeito (ou lixo no stream)
+MAX_FRAME_SIZE = 4 * 1024 * 1024
+
+
+class FrameError(ConnectionError):
+    """Frame inválido; o stream está dessincronizado e a conexão deve ser fechada"""
+
+
+def encode_frame(payload):
+    """Cabeçalho e mensagem num único bytes, para ser escrito de uma vez"""
+    return HEADER.pack(len(payload)) + payload
+
+
+def send_frame(sock, payload):
+    # Um único sendall: sem dois syscalls por mensagem nem esbarrar no
+    # Nagle/delayed ACK entre cabeçalho e corpo
+    sock.sendall(encode_frame(payload))
+
+
+def _check_size(size, max_frame_size):
+    if size > max_frame_size:
+        raise FrameError(f"Frame of {size} bytes exceeds limit of {max_frame_size}")
+
+
+def recv_into_exact(sock, view):
+    """Preenche view inteira; retorna False se a conexão fechar antes"""
+    received = 0
+    while received < len(view):
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            return False
+        received += n
+    return True
+
+
+def recv_frame(sock, max_frame_size=MAX_FRAME_SIZE):
+    """
+    Lê exatamente um frame, sem ler nada além dele (seguro em sockets
+    compartilhados, como os do pool de conexões). Retorna a mensagem, ou
+    None se a conexão fechar.
+    """
+    header = bytearray(HEADER.size)
+    if not recv_into_exact(sock, memoryview(header)):
+        return None
+    size = HEADER.unpack(header)[0]
+    _check_size(size, max_frame_size)
+    payload = bytearray(size)
+    if size and not recv_into_exact(sock, memoryview(payload)):
+        return None
+    return payload
+
+
+class FrameReader:
+    """
+    Lê frames de um socket para um buffer pré-alocado e reaproveitado.
+
+    Cada recv_into traz o que estiver disponível, então vários frames
+    pequenos chegam num único syscall. read_frame() devolve uma memoryview
+    dentro do buffer, válida só até a próxima chamada (ParseFromString
+    aceita memoryview direto, sem cópia).
+    """
+    def __init__(self, sock, max_frame_size=MAX_FRAME_SIZE, buffer_size=64 * 1024):
+        self.sock = sock
+        self.max_frame_size = max_frame_size
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.start = 0  # início dos dados ainda não consumidos
+        self.end = 0    # fim dos dados recebidos
+
+    def _fill(self, needed):
+        """Garante needed bytes a partir de start; False se a conexão fechar"""
+        if self.start + needed > len(self.buffer):
+            pending = self.end - self.start
+            if needed > len(self.buffer):
+                # Frame maior que o buffer: cresce (até max_frame_size + cabeçalho)
+                buffer = bytearray(max(needed, 2 * len(self.buffer)))
+                buffer[:pending] = self.view[self.start:self.end]
+                self.buffer = buffer
+                self.view = memoryview(buffer)
+            else:
+                self.view[:pending] = self.view[self.start:self.end]
+            self.start, self.end = 0, pending
+
+        while self.end - self.start < needed:
+            n = self.sock.recv_into(self.view[self.end:])
+            if n == 0:
+                return False
+            self.end += n
+        return True
+
+    def read_frame(self):
+        """Próxima mensagem como memoryview, ou None se a conexão fechar"""
+        if not self._fill(HEADER.size):
+            return None
+        size = HEADER.unpack_from(self.buffer, self.start)[0]
+        _check_size(size, self.max_frame_size)
+        if not self._fill(HEADER.size + size):
+            return None
+        begin = self.start + HEADER.size
+        self.start = begin + size
+        if self.start == self.end:
+            self.start = self.end = 0
+        return self.view[begin:begin + size]
+
+
+async def read_frame_async(reader, max_frame_size=MAX_FRAME_SIZE):
+    """Versão para asyncio.StreamReader; levanta IncompleteReadError se a conexão fechar"""
+    header = await reader.readexactly(HEADER.size)
+    size = HEADER.unpack(header)[0]
+    _check_size(size, max_frame_size)
+    return await reader.readexactly(size)